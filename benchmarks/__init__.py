@@ -0,0 +1,86 @@
+"""
+Benchmarks for the obfuscator. Run from the repository root, for example python -m benchmarks.throughput
+"""
+import contextlib
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Any
+
+import pyobf2.lib as obf
+
+# Configurations to benchmark: every transformer on its own (in each of its modes), and some combinations
+PRESETS: dict[str, dict[str, Any]] = {
+    "logicTransformer": {"logicTransformer.enabled": True},
+    "removeTypeHints": {"removeTypeHints.enabled": True},
+    "fstrToFormatSeq": {"fstrToFormatSeq.enabled": True},
+    "encodeStrings.b64lzma": {"encodeStrings.enabled": True, "encodeStrings.mode": "b64lzma"},
+    "encodeStrings.chararray": {"encodeStrings.enabled": True, "encodeStrings.mode": "chararray"},
+    "encodeStrings.xortable": {"encodeStrings.enabled": True, "encodeStrings.mode": "xortable"},
+    "encodeStrings.decodeOnce": {"encodeStrings.enabled": True, "encodeStrings.decode_once": True},
+    "stringCollector": {"stringCollector.enabled": True},
+    "floatsToComplex": {"floatsToComplex.enabled": True},
+    "intObfuscator.bits": {"intObfuscator.enabled": True, "intObfuscator.mode": "bits"},
+    "intObfuscator.complement": {"intObfuscator.enabled": True, "intObfuscator.mode": "complement"},
+    "intObfuscator.decode": {"intObfuscator.enabled": True, "intObfuscator.mode": "decode"},
+    "renamer": {"renamer.enabled": True},
+    "typeAliasTransformer": {"typeAliasTransformer.enabled": True},
+    "replaceAttribSet": {"replaceAttribSet.enabled": True},
+    "dynamicCodeObjLauncher": {"dynamicCodeObjLauncher.enabled": True},
+    "varCollector": {"varCollector.enabled": True},
+    "unicodeTransformer": {"unicodeTransformer.enabled": True},
+    "compileFinalFiles": {"compileFinalFiles.enabled": True},
+    "packInPyz": {"packInPyz.enabled": True},
+    "strings+ints": {
+        "encodeStrings.enabled": True,
+        "encodeStrings.mode": "chararray",
+        "intObfuscator.enabled": True,
+        "intObfuscator.mode": "bits",
+    },
+    "heavy": {
+        "logicTransformer.enabled": True,
+        "removeTypeHints.enabled": True,
+        "encodeStrings.enabled": True,
+        "intObfuscator.enabled": True,
+        "renamer.enabled": True,
+        "typeAliasTransformer.enabled": True,
+        "replaceAttribSet.enabled": True,
+        "varCollector.enabled": True,
+    },
+}
+
+
+@contextlib.contextmanager
+def configured(overrides: dict[str, Any]):
+    """
+    Disables every transformer, applies overrides, and restores the previous configuration afterwards
+    :param overrides: key : value pairs, as for set_config_dict
+    """
+    previous = obf.get_current_config()
+    try:
+        obf.set_config_dict({x.config.name + ".enabled": False for x in obf.all_transformers})
+        obf.set_config_dict(overrides)
+        random.seed(0)
+        yield
+    finally:
+        obf.set_config_dict(previous)
+
+
+def environment() -> dict[str, Any]:
+    """
+    Describes what the benchmark ran on, to tell results of different commits and machines apart
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": sys.version,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
@@ -0,0 +1,68 @@
+"""
+Compares two result files of benchmarks.throughput, for example from two commits.
+Run as python -m benchmarks.compare old.json new.json. Exits with 1 if anything got slower than the threshold.
+"""
+import argparse
+import json
+
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+
+def _key(result: dict) -> tuple:
+    return result["preset"], result["modules"], result["functions_per_module"]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--threshold", type=float, default=1.15, help="Slowdown factor (new / old) above which to fail"
+    )
+    args = parser.parse_args()
+    with open(args.old, "r", encoding="utf8") as f:
+        old = json.load(f)
+    with open(args.new, "r", encoding="utf8") as f:
+        new = json.load(f)
+    old_results = {_key(x): x for x in old["results"]}
+
+    table = Table(title=f"{old['environment']['commit']} -> {new['environment']['commit']}")
+    for x in ["Preset", "Modules", "Functions", "Old (ms)", "New (ms)", "New / old"]:
+        table.add_column(x, justify="left" if x == "Preset" else "right")
+    regressions = 0
+    for x in new["results"]:
+        if _key(x) not in old_results:
+            continue
+        before = old_results[_key(x)]["transform_s"]
+        after = x["transform_s"]
+        ratio = after / before if before > 0 else float("inf")
+        style = None
+        if ratio > args.threshold:
+            style = "red"
+            regressions += 1
+        elif ratio < 1 / args.threshold:
+            style = "green"
+        table.add_row(
+            x["preset"],
+            str(x["modules"]),
+            str(x["functions_per_module"]),
+            f"{before * 1000:.1f}",
+            f"{after * 1000:.1f}",
+            f"{ratio:.2f}",
+            style=style,
+        )
+    console.print(table)
+    for preset, k in new.get("scaling", {}).items():
+        k_old = old.get("scaling", {}).get(preset)
+        if k is not None and k_old is not None and k > k_old + 0.2:
+            console.log(f"{preset} scales worse than before: nodes^{k_old:.2f} -> nodes^{k:.2f}", style="red")
+    if regressions > 0:
+        console.log(f"{regressions} measurements got slower than {args.threshold}x", style="red")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
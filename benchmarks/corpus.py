@@ -0,0 +1,192 @@
+"""
+Generates synthetic projects to benchmark the obfuscator with. The same parameters always generate the same project.
+Run as python -m benchmarks.corpus <directory> to write one to disk.
+"""
+import argparse
+import dataclasses
+import os.path
+import random
+import string
+
+
+@dataclasses.dataclass(frozen=True)
+class CorpusSpec:
+    # Amount of modules, besides main.py
+    modules: int = 8
+    functions_per_module: int = 8
+    # String / number literals per function
+    strings_per_function: int = 4
+    numbers_per_function: int = 6
+    # How deep for / if / while blocks are nested in each function
+    nesting_depth: int = 2
+    # How many functions of earlier modules each module imports
+    imports_per_module: int = 2
+    seed: int = 0
+
+
+class _ModuleWriter:
+    def __init__(self, rnd: random.Random, spec: CorpusSpec):
+        self.rnd = rnd
+        self.spec = spec
+        self.lines = []
+        self.indent = 0
+
+    def line(self, s: str):
+        self.lines.append("    " * self.indent + s if s != "" else "")
+
+    def string_literal(self) -> str:
+        return repr("".join(self.rnd.choices(string.ascii_letters + string.digits + " _-", k=self.rnd.randint(4, 24))))
+
+    def number_literal(self) -> str:
+        if self.rnd.random() < 0.2:
+            return repr(round(self.rnd.uniform(0, 100), 3))
+        return str(self.rnd.randint(0, 5000))
+
+    def literal_statements(self, strings: int, numbers: int, callables: list[str]) -> list[str]:
+        stmts = []
+        for _ in range(strings):
+            stmts.append(f"total += len({self.string_literal()})")
+        for _ in range(numbers):
+            stmts.append(f"total += int({self.number_literal()}) % 97")
+        for x in callables:
+            stmts.append(f"total += {x}(x % 5)")
+        self.rnd.shuffle(stmts)
+        return stmts
+
+    def block(self, depth: int, stmts: list[str]):
+        """
+        Writes stmts, nested depth levels deep into loops and conditionals. Every loop runs at most 3 times
+        """
+        if depth == 0 or len(stmts) <= 1:
+            for x in stmts:
+                self.line(x)
+            return
+        split = self.rnd.randint(0, len(stmts) // 2)
+        for x in stmts[:split]:
+            self.line(x)
+        kind = self.rnd.choice(["for", "if", "while"])
+        var = f"i{depth}"
+        if kind == "for":
+            self.line(f"for {var} in range({self.rnd.randint(1, 3)}):")
+        elif kind == "if":
+            self.line(f"if x % {self.rnd.randint(2, 5)} != {self.rnd.randint(1, 4)} or total > 0:")
+        else:
+            self.line(f"{var} = 0")
+            self.line(f"while {var} < {self.rnd.randint(1, 3)}:")
+        self.indent += 1
+        if kind == "while":
+            self.line(f"{var} += 1")
+        self.block(depth - 1, stmts[split:])
+        self.indent -= 1
+
+
+def function_name(module: int, function: int) -> str:
+    return f"compute_{module}_{function}"
+
+
+def generate_module(spec: CorpusSpec, index: int) -> str:
+    """
+    Generates the source of one module of a project
+    :param spec: The project parameters
+    :param index: The index of the module. Modules only import modules with a lower index, so there are no cycles
+    :return: The source
+    """
+    rnd = random.Random(f"{spec.seed}:{index}")
+    w = _ModuleWriter(rnd, spec)
+    imported = []
+    if index > 0:
+        for _ in range(spec.imports_per_module):
+            other = rnd.randrange(index)
+            name = function_name(other, rnd.randrange(spec.functions_per_module))
+            if name not in imported:
+                w.line(f"from mod{other} import {name}")
+                imported.append(name)
+    w.line("")
+    w.line(f"LABEL = {w.string_literal()}")
+    w.line("")
+    w.line("")
+    w.line(f"class Accumulator{index}:")
+    w.indent += 1
+    w.line("def __init__(self, start: int):")
+    w.line("    self.value = start")
+    w.line("")
+    w.line("def add(self, amount: int) -> int:")
+    w.line("    self.value += amount")
+    w.line("    return self.value")
+    w.indent -= 1
+    for f in range(spec.functions_per_module):
+        w.line("")
+        w.line("")
+        w.line(f"def {function_name(index, f)}(x: int) -> int:")
+        w.indent += 1
+        w.line(f"total = {rnd.randint(0, 10)}")
+        # earlier functions of this module, and imported functions. calls only go backwards, so this terminates
+        callables = [function_name(index, rnd.randrange(f))] if f > 0 and rnd.random() < 0.5 else []
+        if len(imported) > 0 and rnd.random() < 0.5:
+            callables.append(rnd.choice(imported))
+        w.block(
+            spec.nesting_depth,
+            w.literal_statements(spec.strings_per_function, spec.numbers_per_function, callables),
+        )
+        w.line(f"acc = Accumulator{index}(total)")
+        w.line("return acc.add(len(LABEL))")
+        w.indent -= 1
+    return "\n".join(w.lines) + "\n"
+
+
+def generate_main(spec: CorpusSpec) -> str:
+    """
+    Generates the entry point of a project, which calls every function and prints the results
+    :param spec: The project parameters
+    :return: The source
+    """
+    lines = [f"import mod{i}" for i in range(spec.modules)]
+    lines += ["", "", "def main():", "    results = []"]
+    for i in range(spec.modules):
+        for f in range(spec.functions_per_module):
+            lines.append(f"    results.append(mod{i}.{function_name(i, f)}({(i + f) % 7}))")
+    lines += ["    print(sum(results), len(results))", "", "", 'if __name__ == "__main__":', "    main()"]
+    return "\n".join(lines) + "\n"
+
+
+def generate_project(spec: CorpusSpec) -> dict[str, str]:
+    """
+    Generates a project
+    :param spec: The project parameters
+    :return: file name : source pairs. The entry point is main.py
+    """
+    files = {f"mod{i}.py": generate_module(spec, i) for i in range(spec.modules)}
+    files["main.py"] = generate_main(spec)
+    return files
+
+
+def write_project(spec: CorpusSpec, directory: str) -> list[str]:
+    """
+    Generates a project, and writes it to a directory
+    :param spec: The project parameters
+    :param directory: The directory to write to. Will be created if it doesn't exist
+    :return: The absolute paths of the written files, entry point last
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, src in generate_project(spec).items():
+        p = os.path.abspath(os.path.join(directory, name))
+        with open(p, "w", encoding="utf8") as f:
+            f.write(src)
+        paths.append(p)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.corpus", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("directory")
+    for field in dataclasses.fields(CorpusSpec):
+        parser.add_argument("--" + field.name.replace("_", "-"), type=int, default=field.default)
+    args = parser.parse_args()
+    spec = CorpusSpec(**{x.name: getattr(args, x.name) for x in dataclasses.fields(CorpusSpec)})
+    for x in write_project(spec, args.directory):
+        print(x)
+
+
+if __name__ == "__main__":
+    main()
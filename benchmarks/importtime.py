@@ -0,0 +1,122 @@
+"""
+Measures how long importing the obfuscator takes, and checks that the library doesn't import what it doesn't need.
+Run as python -m benchmarks.importtime. Each module is imported in fresh interpreters under python -X importtime.
+Exits with 1 if a module imports something it shouldn't, or got slower than the baseline (--baseline).
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from rich.console import Console
+from rich.table import Table
+
+from . import environment
+
+console = Console()
+
+# What the CLI, or a transformer that isn't enabled, needs. Importing the library mustn't import any of it
+_CLI_ONLY = ["rich", "tomlkit", "colorama", "Crypto", "concurrent.futures.process", "pyobf2.cli"]
+_TRANSFORMER_IMPLEMENTATIONS = ["pyobf2.lib.transformers."]
+
+# module : prefixes of modules it mustn't import
+TARGETS: dict[str, list[str]] = {
+    "pyobf2": [*_CLI_ONLY, "pyobf2.lib"],
+    "pyobf2.lib": [*_CLI_ONLY, *_TRANSFORMER_IMPLEMENTATIONS],
+    "pyobf2.lib.inmemory": [*_CLI_ONLY, "pyobf2.lib.transformers.packPyz"],
+    "pyobf2.lib.aio": [*_CLI_ONLY, *_TRANSFORMER_IMPLEMENTATIONS],
+    "pyobf2.cli": [*_TRANSFORMER_IMPLEMENTATIONS],
+}
+
+
+def import_once(module: str) -> tuple[int, list[str]]:
+    """
+    Imports a module in a fresh interpreter
+    :param module: The module to import
+    :return: The time importing it took in µs, including everything it imported, and the names of everything it
+    imported
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    )
+    total = None
+    imported = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip() == "cumulative":  # the header
+            continue
+        imported.append(name.strip())
+        if name.strip() == module and not name.startswith("  "):
+            total = int(cumulative)
+    if total is None:
+        raise ValueError(f"{module} wasn't imported: {proc.stderr}")
+    return total, imported
+
+
+def measure(module: str, forbidden: list[str], repeat: int) -> dict:
+    """
+    :param module: The module to import
+    :param forbidden: Prefixes of modules it mustn't import
+    :param repeat: How often to import it. The fastest time is reported
+    :return: The result for the module
+    """
+    times = []
+    imported = []
+    for _ in range(repeat):
+        t, imported = import_once(module)
+        times.append(t)
+    unexpected = [x for x in imported if x != module and any(x == p or x.startswith(p) for p in forbidden)]
+    return {"module": module, "import_us": min(times), "modules_imported": len(imported), "unexpected": unexpected}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.importtime", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Imports per module, the fastest one is reported")
+    parser.add_argument("--baseline", help="A previous result file to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=1.25, help="Slowdown factor (new / baseline) above which to fail"
+    )
+    parser.add_argument("-o", "--output", help="Writes the results as JSON to this file")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf8") as f:
+            baseline = {x["module"]: x for x in json.load(f)["results"]}
+
+    results = []
+    failures = 0
+    table = Table(title="Import time")
+    for x in ["Module", "Time (ms)", "Baseline (ms)", "Modules", "Unexpected imports"]:
+        table.add_column(x, justify="left" if x in ("Module", "Unexpected imports") else "right")
+    for module, forbidden in TARGETS.items():
+        result = measure(module, forbidden, args.repeat)
+        results.append(result)
+        before = baseline.get(module, {}).get("import_us")
+        style = None
+        if len(result["unexpected"]) > 0 or (before is not None and result["import_us"] > before * args.threshold):
+            style = "red"
+            failures += 1
+        table.add_row(
+            module,
+            f"{result['import_us'] / 1000:.1f}",
+            "" if before is None else f"{before / 1000:.1f}",
+            str(result["modules_imported"]),
+            ", ".join(result["unexpected"]),
+            style=style,
+        )
+    console.print(table)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump({"environment": environment(), "parameters": vars(args), "results": results}, f, indent=2)
+        console.log(f"Wrote results to {args.output}")
+    if failures > 0:
+        console.log(f"{failures} modules import something they shouldn't, or got slower", style="red")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
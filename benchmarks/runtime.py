@@ -0,0 +1,197 @@
+"""
+Measures what obfuscating costs the obfuscated program at runtime.
+Each workload is obfuscated with each preset, and the original and obfuscated versions are run in fresh interpreters
+under timeit and tracemalloc.
+Run as python -m benchmarks.runtime [workload.py ...]. A workload is run as __main__, so the work it does goes under
+if __name__ == "__main__". Defaults to the workloads in benchmarks/workloads.
+"""
+import argparse
+import ast
+import builtins
+import contextlib
+import glob
+import hashlib
+import importlib.util
+import io
+import json
+import marshal
+import os.path
+import pathlib
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from types import CodeType
+
+from rich.console import Console
+from rich.table import Table
+
+import pyobf2.lib as obf
+from pyobf2.lib.util import unparse_to_file
+from . import PRESETS, configured, environment
+
+console = Console()
+
+# packInPyz needs a __main__.py to bootstrap, which single file workloads don't have
+RUNTIME_PRESETS = [x for x in PRESETS.keys() if x != "packInPyz"]
+
+
+def obfuscate_workload(workload: str, preset: str, out_dir: str) -> str:
+    """
+    Obfuscates a workload with a preset
+    :param workload: The workload file
+    :param preset: The preset, from PRESETS
+    :param out_dir: Directory to write the obfuscated workload to
+    :return: The file to run. This isn't a .py file if the post run compiled or packed it
+    """
+    out_file = os.path.join(out_dir, os.path.basename(workload))
+    with open(workload, "r", encoding="utf8") as f:
+        source_ast = ast.parse(f.read())
+    with configured(PRESETS[preset]):
+        source_ast = obf.do_obfuscation_single_ast(source_ast, os.path.abspath(workload))
+        unparse_to_file(source_ast, out_file)
+        outputs = obf.do_post_run(pathlib.Path(out_dir), [pathlib.Path(out_file)])
+    return str(outputs[0])
+
+
+def load_code(path: str) -> CodeType:
+    """
+    Loads the code object of a workload, the way the interpreter would before running it
+    :param path: A .py file, or a .pyc file from compileFinalFiles
+    :return: The code object
+    """
+    if path.endswith(".pyc"):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:4] != importlib.util.MAGIC_NUMBER:
+            raise ValueError(f"{path} was compiled for another python version")
+        return marshal.loads(data[16:])  # magic, flags, and the source mtime and size
+    with open(path, "r", encoding="utf8") as f:
+        return compile(f.read(), path, "exec")
+
+
+def measure(path: str, number: int, repeat: int) -> dict:
+    """
+    Runs a workload. Called in a fresh interpreter by run_measurement. Only running it is timed: the code is loaded
+    once, so .py and .pyc workloads compare the same way
+    :return: The fastest time of one run in seconds, the tracemalloc peak of one run in KiB, and a hash of its output
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    code = load_code(path)
+
+    def run():
+        exec(code, {"__name__": "__main__", "__file__": path, "__builtins__": builtins})
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        run()  # warm up, and remember what it printed, to see if obfuscating broke it
+    with contextlib.redirect_stdout(io.StringIO()):
+        times = timeit.repeat(run, number=number, repeat=repeat)
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "time_s": min(times) / number,
+        "peak_kib": peak / 1024,
+        "output_sha256": hashlib.sha256(output.getvalue().encode("utf8")).hexdigest(),
+    }
+
+
+def run_measurement(path: str, number: int, repeat: int) -> dict:
+    """
+    Measures a workload in a fresh interpreter, see measure
+    """
+    r = subprocess.run(
+        [sys.executable, "-m", "benchmarks.runtime", "--measure", path]
+        + ["--number", str(number), "--repeat", str(repeat)],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if r.returncode != 0:
+        raise RuntimeError(f"Running {path} failed:\n{r.stderr}")
+    return json.loads(r.stdout.strip().split("\n")[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.runtime", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("workloads", nargs="*", help="Workload files")
+    parser.add_argument("-o", "--output", help="File to write the results to, as JSON")
+    parser.add_argument("--presets", default=",".join(RUNTIME_PRESETS), help="Comma separated presets to run")
+    parser.add_argument("--number", type=int, default=5, help="Runs per timing")
+    parser.add_argument("--repeat", type=int, default=3, help="Timings per measurement. The fastest one is kept")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure is not None:
+        print(json.dumps(measure(args.measure, args.number, args.repeat)))
+        return
+
+    workloads = args.workloads
+    if len(workloads) == 0:
+        workloads = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "workloads", "*.py")))
+    presets = args.presets.split(",")
+    for x in presets:
+        if x not in PRESETS:
+            parser.error(f"Unknown preset {x}, available: {', '.join(PRESETS.keys())}")
+
+    results = []
+    for workload in workloads:
+        workload = os.path.abspath(workload)
+        original = run_measurement(workload, args.number, args.repeat)
+        console.log(f"{os.path.basename(workload)}: {original['time_s'] * 1000:.2f} ms")
+        for preset in presets:
+            result = {"workload": workload, "preset": preset, "original": original}
+            with tempfile.TemporaryDirectory() as tmp:
+                try:
+                    obfuscated = run_measurement(obfuscate_workload(workload, preset, tmp), args.number, args.repeat)
+                except Exception as e:
+                    console.log(f"{preset} failed: {e}", style="red")
+                    result["error"] = str(e)
+                    results.append(result)
+                    continue
+            result["obfuscated"] = obfuscated
+            result["slowdown"] = obfuscated["time_s"] / original["time_s"]
+            result["peak_delta_kib"] = obfuscated["peak_kib"] - original["peak_kib"]
+            result["same_output"] = obfuscated["output_sha256"] == original["output_sha256"]
+            results.append(result)
+            console.log(f"{preset:>24}: {result['slowdown']:.2f}x")
+
+    print_summary(results)
+    if args.output is not None:
+        doc = {
+            "environment": environment(),
+            "parameters": {"number": args.number, "repeat": args.repeat},
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(doc, f, indent=2)
+        console.log("Wrote results to", os.path.abspath(args.output))
+
+
+def print_summary(results: list[dict]):
+    table = Table(title="Runtime overhead")
+    for x in ["Workload", "Preset", "Original (ms)", "Obfuscated (ms)", "Slowdown", "Peak delta (KiB)", "Output"]:
+        table.add_column(x, justify="left" if x in ["Workload", "Preset", "Output"] else "right")
+    for x in results:
+        name = os.path.basename(x["workload"])
+        if "error" in x:
+            original = f"{x['original']['time_s'] * 1000:.2f}"
+            table.add_row(name, x["preset"], original, "-", "-", "-", "failed", style="red")
+            continue
+        table.add_row(
+            name,
+            x["preset"],
+            f"{x['original']['time_s'] * 1000:.2f}",
+            f"{x['obfuscated']['time_s'] * 1000:.2f}",
+            f"{x['slowdown']:.2f}x",
+            f"{x['peak_delta_kib']:+.0f}",
+            "same" if x["same_output"] else "differs",
+            style=None if x["same_output"] else "red",
+        )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
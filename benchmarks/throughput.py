@@ -0,0 +1,189 @@
+"""
+Measures how long obfuscating takes, for each preset on synthetic projects of growing size.
+Run as python -m benchmarks.throughput -o results.json, and compare results with python -m benchmarks.compare.
+"""
+import argparse
+import ast
+import json
+import math
+import os.path
+import pathlib
+import shutil
+import tempfile
+import time
+from typing import Any
+
+from rich.console import Console
+from rich.table import Table
+
+import pyobf2.lib as obf
+from pyobf2.lib.profiler import Profiler, count_nodes
+from pyobf2.lib.util import unparse_to_file
+from . import PRESETS, configured, environment
+from .corpus import CorpusSpec, write_project
+
+console = Console()
+
+
+def _int_list(s: str) -> list[int]:
+    return [int(x) for x in s.split(",")]
+
+
+def run_once(
+    files: list[str], out_dir: str, jobs: int, fused: bool, profiler: Profiler | None = None
+) -> dict[str, float]:
+    """
+    Obfuscates the files with the current configuration, then writes them and runs the post run
+    :return: The seconds each phase took
+    """
+    asts = []
+    for x in files:
+        with open(x, "r", encoding="utf8") as f:
+            asts.append(ast.parse(f.read()))
+    t0 = time.perf_counter()
+    for _ in obf.do_obfuscation_batch_ast(asts, files, jobs, fused, profiler):
+        pass
+    t1 = time.perf_counter()
+    in_dir = os.path.dirname(files[0])
+    shutil.rmtree(out_dir, ignore_errors=True)
+    outs = []
+    for x, a in zip(files, asts):
+        outs.append(os.path.join(out_dir, os.path.relpath(x, in_dir)))
+        unparse_to_file(a, outs[-1], profiler)
+    t2 = time.perf_counter()
+    obf.do_post_run(pathlib.Path(out_dir), [pathlib.Path(x) for x in outs], profiler)
+    t3 = time.perf_counter()
+    return {"transform_s": t1 - t0, "write_s": t2 - t1, "post_run_s": t3 - t2}
+
+
+def scaling_exponent(points: list[tuple[float, float]]) -> float | None:
+    """
+    Fits time = c * size ^ k through the points, by least squares in log-log space
+    :param points: (size, time) pairs
+    :return: k, or None if there are less than 2 distinct sizes. Around 1 means linear, 2 quadratic
+    """
+    points = [(math.log(x), math.log(y)) for (x, y) in points if x > 0 and y > 0]
+    if len({x for (x, _) in points}) < 2:
+        return None
+    mx = sum(x for (x, _) in points) / len(points)
+    my = sum(y for (_, y) in points) / len(points)
+    return sum((x - mx) * (y - my) for (x, y) in points) / sum((x - mx) ** 2 for (x, _) in points)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.throughput", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-o", "--output", help="File to write the results to, as JSON")
+    parser.add_argument("--presets", default=",".join(PRESETS.keys()), help="Comma separated presets to run")
+    parser.add_argument("--modules", type=_int_list, default=[2, 4, 8], help="Comma separated module counts")
+    parser.add_argument("--functions", type=_int_list, default=[4, 8], help="Comma separated functions per module")
+    parser.add_argument("--strings", type=int, default=CorpusSpec.strings_per_function)
+    parser.add_argument("--numbers", type=int, default=CorpusSpec.numbers_per_function)
+    parser.add_argument("--nesting", type=int, default=CorpusSpec.nesting_depth)
+    parser.add_argument("--imports", type=int, default=CorpusSpec.imports_per_module)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per measurement. The fastest one is kept")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--fused", action="store_true")
+    args = parser.parse_args()
+
+    presets = args.presets.split(",")
+    for x in presets:
+        if x not in PRESETS:
+            parser.error(f"Unknown preset {x}, available: {', '.join(PRESETS.keys())}")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        corpora = []
+        for modules in args.modules:
+            for functions in args.functions:
+                spec = CorpusSpec(
+                    modules=modules,
+                    functions_per_module=functions,
+                    strings_per_function=args.strings,
+                    numbers_per_function=args.numbers,
+                    nesting_depth=args.nesting,
+                    imports_per_module=args.imports,
+                )
+                files = write_project(spec, os.path.join(tmp, f"in_{modules}_{functions}"))
+                nodes = 0
+                for x in files:
+                    with open(x, "r", encoding="utf8") as f:
+                        nodes += count_nodes(ast.parse(f.read()))
+                corpora.append((spec, files, nodes))
+
+        for preset in presets:
+            for spec, files, nodes in corpora:
+                out_dir = os.path.join(tmp, "out")
+                best = None
+                for _ in range(args.repeat):
+                    with configured(PRESETS[preset]):
+                        timings = run_once(files, out_dir, args.jobs, args.fused)
+                    if best is None or timings["transform_s"] < best["transform_s"]:
+                        best = timings
+                # one more run to see which transformer took how long
+                profiler = Profiler(trace_memory=False)
+                with configured(PRESETS[preset]):
+                    run_once(files, out_dir, args.jobs, args.fused, profiler)
+                steps = {}
+                for row in profiler.summary():
+                    steps[f"{row['cat']}:{row['name']}"] = {
+                        "wall_s": row["wall_ms"] / 1000,
+                        "nodes_before": row["nodes_before"],
+                        "nodes_after": row["nodes_after"],
+                    }
+                result = {
+                    "preset": preset,
+                    "modules": spec.modules,
+                    "functions_per_module": spec.functions_per_module,
+                    "files": len(files),
+                    "nodes": nodes,
+                    **best,
+                    "steps": steps,
+                }
+                results.append(result)
+                console.log(
+                    f"{preset:>24} {spec.modules:>4} modules x {spec.functions_per_module:>3} functions: "
+                    f"{best['transform_s'] * 1000:9.1f} ms"
+                )
+
+    scaling = {}
+    for preset in presets:
+        points = [(x["nodes"], x["transform_s"]) for x in results if x["preset"] == preset]
+        scaling[preset] = scaling_exponent(points)
+    print_summary(results, scaling)
+    if args.output is not None:
+        doc = {
+            "environment": environment(),
+            "parameters": {k: v for (k, v) in vars(args).items() if k != "output"},
+            "results": results,
+            "scaling": scaling,
+        }
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(doc, f, indent=2)
+        console.log("Wrote results to", os.path.abspath(args.output))
+
+
+def print_summary(results: list[dict[str, Any]], scaling: dict[str, float | None]):
+    table = Table(title="Throughput")
+    for x in ["Preset", "Modules", "Functions", "Nodes", "Transform (ms)", "Write (ms)", "Post run (ms)", "Nodes/s"]:
+        table.add_column(x, justify="left" if x == "Preset" else "right")
+    for x in results:
+        table.add_row(
+            x["preset"],
+            str(x["modules"]),
+            str(x["functions_per_module"]),
+            str(x["nodes"]),
+            f"{x['transform_s'] * 1000:.1f}",
+            f"{x['write_s'] * 1000:.1f}",
+            f"{x['post_run_s'] * 1000:.1f}",
+            f"{x['nodes'] / x['transform_s']:.0f}" if x["transform_s"] > 0 else "-",
+        )
+    console.print(table)
+    table = Table(title="Scaling (time ~ nodes^k)")
+    table.add_column("Preset")
+    table.add_column("k", justify="right")
+    for preset, k in scaling.items():
+        table.add_row(preset, "-" if k is None else f"{k:.2f}", style="red" if k is not None and k > 1.3 else None)
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
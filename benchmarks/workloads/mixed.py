@@ -0,0 +1,67 @@
+# A bit of everything the transformers touch: string and number literals, attribute access, branches, loops and calls
+
+
+class Inventory:
+    def __init__(self):
+        self.items = {}
+        self.changes = 0
+
+    def add(self, name: str, amount: int):
+        self.items[name] = self.items.get(name, 0) + amount
+        self.changes += 1
+
+    def remove(self, name: str, amount: int) -> bool:
+        if self.items.get(name, 0) < amount:
+            return False
+        self.items[name] -= amount
+        self.changes += 1
+        return True
+
+
+def checksum(s: str) -> int:
+    total = 7
+    for c in s:
+        total = (total * 31 + ord(c)) % 1000003
+    return total
+
+
+def collatz(n: int) -> int:
+    steps = 0
+    while n != 1:
+        if n % 2 == 0:
+            n = n // 2
+        else:
+            n = 3 * n + 1
+        steps += 1
+    return steps
+
+
+def describe(inv: Inventory) -> str:
+    parts = []
+    for name in sorted(inv.items.keys()):
+        parts.append(name + "=" + str(inv.items[name]))
+    return ", ".join(parts)
+
+
+def main():
+    inv = Inventory()
+    names = ["apple", "banana", "cherry", "dragonfruit", "elderberry"]
+    for i in range(2000):
+        name = names[i % len(names)]
+        if i % 3 == 0:
+            inv.add(name, i % 17 + 1)
+        elif not inv.remove(name, 2):
+            inv.add(name, 5)
+    total = 0
+    for i in range(1, 600):
+        total += collatz(i)
+    ratio = 0.0
+    for i in range(1, 500):
+        ratio += 1.5 / i
+    text = describe(inv)
+    print(text)
+    print("checksum:", checksum(text * 20), "collatz:", total, "ratio:", round(ratio, 6), "changes:", inv.changes)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
 if __name__ == "__main__":
-    from pyobf2 import main
+    from pyobf2.cli import main
 
     main()
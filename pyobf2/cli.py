@@ -0,0 +1,534 @@
+import argparse
+import ast
+import math
+import os.path
+from ast import *
+from pathlib import Path
+from time import perf_counter, sleep
+
+import colorama
+import rich.traceback
+import rich.tree
+import tomlkit
+from rich.console import Console
+from rich.progress import track
+from rich.table import Table
+from tomlkit import *
+
+from pyobf2.lib import (
+    all_config_segments,
+    all_transformers,
+    do_obfuscation_batch_ast,
+    do_obfuscation_single_ast,
+    do_post_run,
+)
+from pyobf2.lib.cache import BuildCache
+from pyobf2.lib.cfg import *
+from pyobf2.lib.incremental import IncrementalBuild
+from pyobf2.lib.profiler import Profiler, profile_span
+from pyobf2.lib.sources import SourceCache
+from pyobf2.lib.util import NonEscapingUnparser, get_dependency_tree, write_to_file
+
+colorama.init()
+
+console = Console()
+# __builtins__["print"] = console.log  # make it fancy
+
+config_file = "config.toml"
+# seconds between checking for changes, in watch mode
+watch_interval = 0.25
+
+general_settings = ConfigSegment(
+    "general",
+    "General settings for the obfuscator",
+    input_file=ConfigValue("The input for the obfuscator", "input.py"),
+    output_file=ConfigValue("The output for the obfuscator", "output.py"),
+    transitive=ConfigValue("Resolves local imports from the target file and obfuscates them aswell", True),
+    manual_include=ConfigValue(
+        "Manually includes these files in transitive mode, if the automatic import resolver doesn't find them", []
+    ),
+    overwrite_output_forcefully=ConfigValue(
+        "Skips the existence check of the output file. This WILL nuke the output file if it already exists", False
+    ),
+    jobs=ConfigValue(
+        "How many worker processes to obfuscate files with in transitive mode. 1 runs everything in this process", 1
+    ),
+    fused=ConfigValue(
+        "Runs transformers that only rewrite single nodes in one traversal of each file, instead of one each.\n"
+        "The output is the same, but obfuscating is faster",
+        False,
+    ),
+    cache_dir=ConfigValue(
+        "Directory to cache obfuscated files in, in transitive mode. Files that didn't change since the last run, and "
+        "don't import anything that did, are taken from there.\n"
+        "Requires a deterministic renamer.rename_format, if the renamer is enabled. Empty to disable",
+        "",
+    ),
+)
+
+all_config_segments.insert(0, general_settings)
+
+
+def populate_with(doc: TOMLDocument, seg: ConfigSegment):
+    tbl = table()
+    for x in [comment(y.strip()) for y in seg.desc.split("\n")]:
+        tbl.add(x)
+    for k in seg.keys():
+        v: ConfigValue = seg[k]
+        for x in [comment(y.strip()) for y in v.desc.split("\n")]:
+            tbl.add(x)
+        tbl.add(k, v.value)
+    doc.add(seg.name, tbl)
+
+
+def generate_example_config() -> TOMLDocument:
+    doc = document()
+    # Header
+    doc.add(comment("Obfuscator configuration file"))
+    doc.add(nl())
+
+    # Values
+    for x in all_config_segments:
+        populate_with(doc, x)
+    return doc
+
+
+def parse_config(cfg: TOMLDocument):
+    for x in all_config_segments:
+        config_segment = cfg[x.name]
+        for y in x:
+            v: ConfigValue = x[y]
+            v.value = config_segment[y]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="pyobf2", description="Obfuscates python code, configured by " + config_file)
+    parser.add_argument(
+        "--profile",
+        metavar="OUT.json",
+        help="Records the time and memory each transformer takes on each file, as well as the other steps of the run. "
+        "Writes them as a Chrome trace to OUT.json, and prints a summary",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keeps running after obfuscating, and re-obfuscates what changed whenever a file changes. "
+        "Requires transitive mode",
+    )
+    args = parser.parse_args()
+    if not os.path.exists(config_file):
+        console.log("Configuration file does not exist, creating example...", style="red")
+        example_cfg = generate_example_config()
+        st = dumps(example_cfg)
+        with open(config_file, "w") as f:
+            f.write(st)
+        console.log("Created, view at", os.path.abspath("config.toml"), style="green")
+        exit(1)
+    with open(config_file, "r") as f:
+        cfg_file_contents = f.read()
+    cfg_file = loads(cfg_file_contents)
+    try:
+        parse_config(cfg_file)
+    except Exception:
+        console.print_exception(suppress=[tomlkit])
+        console.log(
+            "The configuration [red]failed to parse[/red]. This is probably due to your configuration being outdated. "
+            "Please [red]remove[/red] your current configuration file and regenerate it."
+        )
+        exit(1)
+    project_root = next(x for x in all_transformers if x.name == "renamer").config["project_root"]
+    if project_root.value == "":
+        # mapping store modules are named relative to the project, whatever part of it a run obfuscates
+        project_root.value = os.path.dirname(os.path.abspath(general_settings["input_file"].value))
+    profiler = None
+    if args.profile is not None:
+        profiler = Profiler()
+        profiler.start()
+    try:
+        if args.watch:
+            go_watch()
+        elif general_settings["transitive"].value:
+            go_transitive(profiler)
+        else:
+            go_single(profiler)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.write_chrome_trace(args.profile)
+            print_profile_summary(profiler)
+            console.log("Wrote profile to", os.path.abspath(args.profile))
+
+
+def print_profile_summary(profiler: Profiler):
+    table = Table(title="Profile")
+    for x in ["Step", "Kind", "Count", "Wall (ms)", "CPU (ms)", "Peak (KiB)", "Nodes before", "Nodes after", "Growth"]:
+        table.add_column(x, justify="left" if x in ["Step", "Kind"] else "right")
+    for row in profiler.summary():
+        before = row["nodes_before"]
+        after = row["nodes_after"]
+        table.add_row(
+            row["name"],
+            row["cat"],
+            str(row["count"]),
+            f"{row['wall_ms']:.1f}",
+            f"{row['cpu_ms']:.1f}",
+            "-" if row["peak_kib"] is None else f"{row['peak_kib']:.0f}",
+            "-" if before is None else str(before),
+            "-" if after is None else str(after),
+            "-" if before is None or after is None or before == 0 else f"{after / before:.2f}x",
+        )
+    console.print(table)
+
+
+def resolve_file_spec(fspec: str) -> list[str]:
+    if "**" in fspec:
+        if fspec.count("**") > 1:
+            raise ValueError(f"Invalid file specifier {fspec}, ** can only occur once")
+        if not fspec.endswith("**"):
+            raise ValueError(f"Invalid file specifier {fspec}, ** has to be at the end of the specifier")
+        prefix = fspec[:-2]
+        prefix = os.path.abspath(prefix)
+        if not os.path.isdir(prefix):
+            raise ValueError(f"Invalid file specifier {fspec}, ** prefix {prefix} is not a directory or doesn't exist")
+        from pathlib import Path
+
+        all_pys = list(Path(prefix).rglob("*.[pP][yY]"))
+        return [str(x.absolute()) for x in all_pys]
+    elif "*" in fspec:
+        if fspec.count("*") > 1:
+            raise ValueError(f"Invalid file specifier {fspec}, * can only occur once")
+        if not fspec.endswith("*"):
+            raise ValueError(f"Invalid file specifier {fspec}, * has to be at the end of the specifier")
+        prefix = fspec[:-1]
+        prefix = os.path.abspath(prefix)
+        if not os.path.isdir(prefix):
+            raise ValueError(f"Invalid file specifier {fspec}, * prefix {prefix} is not a directory or doesn't exist")
+        from pathlib import Path
+
+        all_pys = list(Path(prefix).glob("*.[pP][yY]"))
+        return [str(x.absolute()) for x in all_pys]
+    else:
+        absp = os.path.abspath(fspec)
+        if not os.path.isfile(absp):
+            raise ValueError(f"Invalid file specifier {fspec}, target is not a file or does not exist")
+        return [absp]
+
+
+def resolve_manual_includes() -> list[str]:
+    files = []
+    for x in general_settings["manual_include"].value:
+        files += resolve_file_spec(os.path.abspath(x))
+    return files
+
+
+def go_transitive(profiler: Profiler | None = None):
+    input_file = general_settings["input_file"].value
+    output_file = general_settings["output_file"].value
+    if not os.path.exists(input_file) or not os.path.isfile(input_file):
+        console.log(
+            "The input file at",
+            os.path.abspath(input_file),
+            "does not exist",
+            style="red",
+        )
+        exit(1)
+    if not os.path.exists(output_file):
+        os.makedirs(output_file)
+    elif not os.path.isdir(output_file):
+        console.log("Transitive obfuscation requires the output to be a directory", style="red")
+        exit(1)
+    console.log("Parsing inheritance tree...")
+    # every file is read and parsed once, by the crawler, and then handed to the obfuscation
+    sources = SourceCache()
+    with profile_span(profiler, "crawl", "crawl", file=os.path.abspath(input_file)):
+        deptree = get_dependency_tree(input_file, sources, general_settings["jobs"].value)
+    if len(deptree) == 0 and len(general_settings["manual_include"].value) == 0:
+        console.log(
+            "Transitive run with no dependencies, aborting\nSet transitive to false in your config.toml if you have "
+            "only one file",
+            style="red",
+        )
+        exit(1)
+    if len(deptree) != 0:
+        common_prefix_l = len(os.path.commonpath(list(map(lambda x: os.path.dirname(x) + "/", deptree.keys())))) + 1
+        tree = rich.tree.Tree(os.path.abspath(input_file)[common_prefix_l:], style="green")
+        # console.log(deptree)
+        recurse_tree_inner(deptree, deptree[os.path.abspath(input_file)], common_prefix_l, tree)
+        console.log(tree)
+    all_files = []
+    for x in deptree.keys():
+        if x not in all_files:
+            all_files.append(x)
+        for y in deptree[x]:
+            if y not in all_files:
+                all_files.append(y)
+    try:
+        all_files += resolve_manual_includes()
+    except ValueError as e:
+        console.log(e, style="red")
+        exit(1)
+
+    all_files = list(dict.fromkeys(all_files))  # remove dupes
+    common_prefix_l = len(os.path.commonpath(list(map(lambda x: os.path.dirname(x) + "/", all_files)))) + 1
+
+    transformers_to_run = list(filter(lambda x: x.config["enabled"].value, all_transformers))
+    if len(transformers_to_run) == 0:
+        console.log("Nothing to do, bailing out", style="red")
+        exit(0)
+
+    cache = None
+    cache_keys = {}
+    cached_sources = {}
+    obfuscated_files = all_files
+    if general_settings["cache_dir"].value != "":
+        cache = BuildCache(general_settings["cache_dir"].value)
+        cache_keys = cache.compute_keys(all_files, deptree, sources)
+        for x in all_files:
+            cached = cache.get(cache_keys[x])
+            if cached is not None:
+                cached_sources[x] = cached
+        # files that changed still need the files they import, to apply their mappings
+        needed = set()
+        for x in all_files:
+            if x not in cached_sources:
+                needed.add(x)
+                needed.update(deptree.get(x, []))
+        if len(needed) > 0:
+            # the renamer resolves absolute imports relative to the top-most file
+            needed.add(os.path.abspath(input_file))
+        obfuscated_files = [x for x in all_files if x in needed]
+        console.log(f"{len(cached_sources)} of {len(all_files)} files are cached")
+    progress = rich.progress.Progress(
+        rich.progress.TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
+        rich.progress.BarColumn(bar_width=None),
+        "[progress.percentage]{task.percentage:>3.1f}%",
+        "•",
+        rich.progress.TextColumn("[#4f4f4f]{task.description:>32}", justify="right"),
+        console=console,
+    )
+    all_asts = []
+    for x in obfuscated_files:
+        with profile_span(profiler, "parse", "parse", file=x):  # only manual includes aren't parsed yet
+            all_asts.append(sources.take_ast(x))
+    all_tasks = []
+    for file in obfuscated_files:
+        task1 = progress.add_task("Waiting", start=False, filename=file[common_prefix_l:])
+        all_tasks.append(task1)
+
+    task_labels = [*["Transformer " + x.name for x in transformers_to_run], "Done"]
+    jobs = general_settings["jobs"].value
+    with progress:
+        # with jobs > 1, files finished in a worker process are unparsed there as well, in the same pool, and each is
+        # written as soon as it's done
+        for processed_file in do_obfuscation_batch_ast(
+            all_asts, obfuscated_files, jobs, general_settings["fused"].value, profiler, unparse=True, ordered=False
+        ):
+            index = processed_file["file_index"]
+            task = all_tasks[index]
+            progress.update(task, total=len(task_labels))
+            comp_i = progress._tasks[task].completed
+            if comp_i == 0:
+                progress.start_task(task)
+            progress.update(
+                task, total=len(task_labels), completed=comp_i + 1, description=task_labels[math.floor(comp_i)]
+            )
+            if processed_file["transformer"] is not None:
+                continue
+            file = obfuscated_files[index]
+            all_asts[index] = None  # we're done with it, don't keep it around
+            if file in cached_sources:  # was only obfuscated for the files importing it
+                continue
+            full_path = os.path.join(output_file, file[common_prefix_l:])
+            # reported as soon as the file is finished, not at the end of the batch
+            write_obfuscated_file(
+                processed_file["source"], processed_file["error"], full_path, cache, cache_keys.get(file), profiler
+            )
+
+    console.log("Writing")
+    for file in cached_sources.keys():
+        full_path = os.path.join(output_file, file[common_prefix_l:])
+        console.log("... " + full_path)
+        write_to_file(cached_sources[file], full_path)
+    console.log("Doing post run")
+    all_outs = [Path(os.path.join(output_file, x[common_prefix_l:])) for x in all_files]
+    ofp = Path(output_file)
+    do_post_run(ofp, all_outs, profiler)
+    console.log("Done", style="green")
+
+
+def report_unparse_error(e: Exception, full_path: str):
+    # the exception may come from a worker process, so it isn't necessarily being handled here
+    console.print(rich.traceback.Traceback.from_exception(type(e), e, e.__traceback__, max_frames=999))
+    if str(e) == "Unable to avoid backslash in f-string expression part":
+        console.log(
+            "[red]An error occurred with re-parsing the python AST into source code.[/red] AST was not able to escape ASCII characters in an "
+            "F-String expression. Please check if you have any ASCII characters in F-Strings, and escape them manually. "
+        )
+    console.log("Current file:", full_path)
+
+
+def write_obfuscated_file(
+    src: str | None,
+    error: Exception | None,
+    full_path: str,
+    cache: BuildCache | None,
+    cache_key: str | None,
+    profiler: Profiler | None = None,
+):
+    console.log("... " + full_path)
+    if error is not None:
+        report_unparse_error(error, full_path)
+        exit(1)
+    write_to_file(src, full_path, profiler)
+    if cache is not None:
+        cache.put(cache_key, src)
+
+
+def recurse_tree_inner(orig, m, common_prefix_len: int, tree: rich.tree.Tree):
+    for x in m:
+        el = tree.add(x[common_prefix_len:])
+        if x in orig:
+            recurse_tree_inner(orig, orig[x], common_prefix_len, el)
+
+
+def go_watch():
+    input_file = general_settings["input_file"].value
+    output_file = general_settings["output_file"].value
+    if not general_settings["transitive"].value:
+        console.log("Watch mode requires transitive to be enabled", style="red")
+        exit(1)
+    if not os.path.isfile(input_file):
+        console.log("The input file at", os.path.abspath(input_file), "does not exist", style="red")
+        exit(1)
+    if os.path.exists(output_file) and not os.path.isdir(output_file):
+        console.log("Transitive obfuscation requires the output to be a directory", style="red")
+        exit(1)
+    if any(x.config["enabled"].value for x in all_transformers if x.name == "packInPyz"):
+        console.log("packInPyz replaces the output directory, and can't be used in watch mode", style="red")
+        exit(1)
+    try:
+        manual_files = resolve_manual_includes()
+    except ValueError as e:
+        console.log(e, style="red")
+        exit(1)
+    build = IncrementalBuild(
+        input_file, output_file, manual_files, general_settings["jobs"].value, general_settings["fused"].value
+    )
+    try:
+        _watch(build)
+    except KeyboardInterrupt:
+        console.log("Stopped watching")
+    finally:
+        build.close()
+
+
+def _watch(build: IncrementalBuild):
+    """
+    Builds everything, and then whatever changes, until interrupted
+    """
+    console.log(f"Obfuscating {len(build.files)} files...")
+    start = perf_counter()
+    # changes that weren't obfuscated successfully yet. None for everything
+    pending = []
+    try:
+        build.build()
+        console.log(f"Done in {perf_counter() - start:.2f}s", style="green")
+    except Exception:
+        console.print_exception()
+        console.log("Obfuscation failed, it will be tried again when a file changes", style="red")
+        pending = None
+    console.log("Watching for changes. Ctrl+C to stop")
+    while True:
+        sleep(watch_interval)
+        try:
+            changed = build.add_files(resolve_manual_includes())
+        except ValueError:
+            changed = []  # a directory of a manual include was removed, it's fine if it comes back later
+        polled, deleted = build.poll()
+        changed += polled
+        for x in deleted:
+            console.log("Removed:", x)
+        if len(changed) == 0:
+            continue
+        for x in changed:
+            console.log("Changed:", x[build.common_prefix_l :])
+        if pending is not None:
+            pending = list(dict.fromkeys(pending + changed))
+        start = perf_counter()
+        try:
+            written = build.build(pending)
+        except Exception:
+            console.print_exception()
+            continue
+        pending = []
+        for x in written:
+            console.log("... " + x)
+        took = (perf_counter() - start) * 1000
+        console.log(f"Rewrote {len(written)} files in {took:.0f}ms", style="green")
+
+
+def go_single(profiler: Profiler | None = None):
+    input_file = general_settings["input_file"].value
+    output_file = general_settings["output_file"].value
+    if not os.path.exists(input_file) or not os.path.isfile(input_file):
+        console.log(
+            "The input file at",
+            os.path.abspath(input_file),
+            "does not exist",
+            style="red",
+        )
+        exit(1)
+    transformers_to_run = list(filter(lambda x: x.config["enabled"].value, all_transformers))
+    if len(transformers_to_run) == 0:
+        console.log("Nothing to do, exiting", style="red")
+        exit(1)
+    if os.path.exists(output_file) and os.path.isdir(output_file):  # output "file" is a dir
+        base = os.path.basename(input_file)  # so append the input file name to it
+        output_file = os.path.join(output_file, base)
+    if os.path.exists(output_file) and not general_settings["overwrite_output_forcefully"].value:
+        console.log(
+            "The output path at",
+            output_file,
+            "already exists, choosing alternative...",
+            style="yellow",
+        )
+        base1 = os.path.basename(output_file)
+        base1 = ".".join(base1.split(".")[0:-1]) if base1.endswith(".py") else base1
+        attempts = 0
+        while os.path.exists(output_file):
+            output_file = os.path.join(os.path.dirname(output_file), f"{base1}_{attempts}.py")
+            attempts += 1
+        console.log("Found one:", output_file, style="green")
+    with open(input_file, "r", encoding="utf8") as f:
+        inp_source = f.read()
+    console.log("Parsing AST...")
+    with profile_span(profiler, "parse", "parse", file=os.path.abspath(input_file)):
+        compiled_ast: AST = ast.parse(inp_source)
+    absolute_input_file = os.path.abspath(input_file)
+    console.log("Obfuscating...")
+    compiled_ast = do_obfuscation_single_ast(
+        compiled_ast, absolute_input_file, general_settings["fused"].value, profiler
+    )
+    fix_missing_locations(compiled_ast)
+    console.log("Re-structuring source...")
+    try:
+        with profile_span(profiler, "unparse", "unparse", file=output_file):
+            src = NonEscapingUnparser().visit(compiled_ast)
+    except Exception as e:
+        console.print_exception(max_frames=3)
+        if str(e) == "Unable to avoid backslash in f-string expression part":
+            console.log(
+                "[red]An error occurred with re-parsing the python AST into source code.[/red] AST was not able to "
+                "escape ASCII characters in an "
+                "F-String expression. Please check if you have any ASCII characters in F-Strings, and escape them "
+                "manually. "
+            )
+        exit(1)
+    console.log("Writing...")
+    with profile_span(profiler, "write", "write", file=output_file):
+        with open(output_file, "w", encoding="utf8") as f:
+            f.write(src)
+    console.log("Doing post run...")
+    out_file_path = Path(output_file)
+    do_post_run(out_file_path.parent, [out_file_path], profiler)
+    console.log("Done", style="green")
@@ -1,48 +1,21 @@
 import os.path
 import pathlib
+import random
 from ast import *
+from typing import Callable, Iterator
 
 from .cfg import *
-from .transformers.collector import Collector
-from .transformers.compileFinalFiles import CompileFinalFiles
-from .transformers.constructDynamicCodeObjTransformer import ConstructDynamicCodeObject
-from .transformers.encodeStringsTransformer import EncodeStrings
-from .transformers.floatsToComplex import FloatsToComplex
-from .transformers.fstrToFormatTransformer import FstringsToFormatSequence
-from .transformers.intObfuscatorTransformer import IntObfuscator
-from .transformers.logicTransformer import LogicTransformer
-from .transformers.memberRenamerTransformer import MemberRenamer
-from .transformers.packPyz import PackInPyz
-from .transformers.removeTypeHintsTransformer import RemoveTypeHints
-from .transformers.replaceAttribsTransformer import ReplaceAttribs
-from .transformers.typeAliasTransformer import TypeAliasTransformer
-from .transformers.unicodeNameTransformer import UnicodeNameTransformer
-from .transformers.stringCollectorTransformer import StringCollectorTransformer
+from .profiler import Profiler, count_nodes, profile_span, run_profiled
+from .registry import LazyTransformer, transformer_infos
+from .transformers import FusedNodeTransformer
 
 config_file = "config.toml"
 
 all_config_segments = []
 
-all_transformers = [
-    x()
-    for x in [
-        LogicTransformer,
-        RemoveTypeHints,
-        FstringsToFormatSequence,
-        EncodeStrings,
-        StringCollectorTransformer,
-        FloatsToComplex,
-        IntObfuscator,
-        MemberRenamer,
-        TypeAliasTransformer,
-        ReplaceAttribs,
-        ConstructDynamicCodeObject,
-        Collector,
-        UnicodeNameTransformer,
-        CompileFinalFiles,
-        PackInPyz,
-    ]
-]
+# The built-in transformers are only imported once they're used, which only happens when they're enabled.
+# Their names and configs are known without that, see pyobf2.lib.registry
+all_transformers = [LazyTransformer(x) for x in transformer_infos]
 
 for x in all_transformers:
     all_config_segments.append(x.config)
@@ -87,38 +60,365 @@ def set_config_dict(cfg: dict[str, Any]):
         set_configuration_key(x, cfg[x])
 
 
-def do_obfuscation_batch_ast(source_asts: list[AST], source_file_names: list[str]):
+def _init_worker(cfg: dict[str, Any]):
+    """
+    Initializer for worker processes in parallel batch runs. Copies the configuration of the parent process over
+    :param cfg: The configuration of the parent process, as returned by get_current_config
+    :return: Nothing
+    """
+    for x in all_config_segments:
+        for v in x.keys():
+            k = f"{x.name}.{v}"
+            if k in cfg:
+                x[v].value = cfg[k]
+    random.seed()  # forked workers would otherwise all share the same random state
+
+
+def _group_consecutive(transformers: list, joinable: Callable[[Any], bool]) -> list[list]:
+    """
+    Groups consecutive transformers that are joinable. Every other transformer gets a group of its own
+    :param transformers: The transformers to group
+    :param joinable: Whether a transformer can share a group with its neighbours
+    :return: The groups, in order
+    """
+    groups = []
+    for x in transformers:
+        if joinable(x) and len(groups) > 0 and joinable(groups[-1][0]):
+            groups[-1].append(x)
+        else:
+            groups.append([x])
+    return groups
+
+
+def _run_profiled_step(
+    name: str, source_ast: AST, source_file_name: str, step: Callable[[AST], AST], profiler: Profiler | None
+) -> AST:
+    """
+    Runs one transformation step over a file, and records it in the profiler, if there is one
+    :param name: The name of the step
+    :param source_ast: The AST to transform
+    :param source_file_name: The file name of the AST
+    :param step: The transformation, returning the new AST
+    :param profiler: The profiler to record the step in, or None
+    :return: The transformed AST
+    """
+    if profiler is None:
+        return fix_missing_locations(step(source_ast))
+    nodes_before = count_nodes(source_ast)
+    with profiler.span(name, "transform", file=source_file_name, nodes_before=nodes_before) as args:
+        source_ast = fix_missing_locations(step(source_ast))
+    args["nodes_after"] = count_nodes(source_ast)
+    return source_ast
+
+
+def _transform_file(
+    source_ast: AST, source_file_name: str, transformers: list, fused: bool, profiler: Profiler | None = None
+) -> AST:
+    """
+    Runs the specified transformers over one file, without giving them access to any other file
+    :param source_ast: The source AST
+    :param source_file_name: The source file name
+    :param transformers: The transformers to run, in order
+    :param fused: Whether to run consecutive transformers that declare node types in one traversal
+    :param profiler: The profiler to record each transformer (or fused group of them) in, or None
+    :return: The transformed AST
+    """
+    # FusedNodeTransformer looks things up on the transformers for every node, don't go through LazyTransformer
+    transformers = [x.instance if isinstance(x, LazyTransformer) else x for x in transformers]
+    if fused:
+        groups = _group_consecutive(transformers, lambda x: len(x.node_types) > 0)
+    else:
+        groups = [[x] for x in transformers]
+    for group in groups:
+        if len(group) == 1:
+            x = group[0]
+            step = lambda a: x.transform(a, source_file_name, None, None)
+        else:
+            step = FusedNodeTransformer(group, source_file_name).visit
+        source_ast = _run_profiled_step(
+            "+".join(x.name for x in group), source_ast, source_file_name, step, profiler
+        )
+    return source_ast
+
+
+def _transform_file_worker(
+    source_ast: AST,
+    source_file_name: str,
+    transformer_indices: list[int],
+    fused: bool,
+    profiler: Profiler | None = None,
+) -> AST:
+    """
+    Entry point of the worker processes in parallel batch runs. See _transform_file
+    :param transformer_indices: Indexes into all_transformers, in the order to run them
+    """
+    transformers = [all_transformers[i] for i in transformer_indices]
+    return _transform_file(source_ast, source_file_name, transformers, fused, profiler)
+
+
+def _unparse_finished(
+    source_ast: AST, source_file_name: str, profiler: Profiler | None = None
+) -> tuple[str | None, Exception | None]:
+    """
+    Unparses a finished file, for do_obfuscation_batch_ast
+    :return: The source, and None, or None, and the exception unparsing raised
+    """
+    from .util import NonEscapingUnparser
+
+    with profile_span(profiler, "unparse", "unparse", file=source_file_name):
+        try:
+            return NonEscapingUnparser().visit(source_ast), None
+        except Exception as e:
+            return None, e
+
+
+def _transform_and_unparse_worker(
+    source_ast: AST,
+    source_file_name: str,
+    transformer_indices: list[int],
+    fused: bool,
+    profiler: Profiler | None = None,
+) -> tuple[str | None, Exception | None]:
+    """
+    _transform_file_worker for the last steps of a file, unparsing it right away in the same worker. Only the source
+    is sent back, not the AST. See _unparse_finished
+    """
+    source_ast = _transform_file_worker(source_ast, source_file_name, transformer_indices, fused, profiler)
+    return _unparse_finished(source_ast, source_file_name, profiler)
+
+
+def create_pool(jobs: int):
+    """
+    Creates a process pool for do_obfuscation_batch_ast, to share between several batches. Its workers copy the
+    configuration at the time it is created, so create a new one when it changes
+    :param jobs: How many worker processes to start
+    :return: The pool. Shut it down once done
+    """
+    from concurrent.futures import ProcessPoolExecutor  # slow to import, and only needed here
+
+    return ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(get_current_config(),))
+
+
+def _finished_event(
+    i: int, source_ast: AST | None, source_file_name: str, unparse: bool, profiler: Profiler | None
+) -> dict[str, Any]:
+    """
+    :return: The event do_obfuscation_batch_ast yields for a finished file, unparsing it in this process if asked to
+    """
+    event = {"file_index": i, "transformer": None, "ast": source_ast}
+    if unparse:
+        event["source"], event["error"] = _unparse_finished(source_ast, source_file_name, profiler)
+    return event
+
+
+def _results(futures: list, ordered: bool) -> Iterator[tuple[int, Any]]:
+    """
+    :param futures: The futures of some per file work, in file order
+    :param ordered: Whether to yield the results in file order. Otherwise, each is yielded as soon as it is done
+    :return: The index and result of each of them
+    """
+    if ordered:
+        for i in range(len(futures)):
+            result = futures[i].result()
+            futures[i] = None
+            yield i, result
+        return
+    from concurrent.futures import as_completed
+
+    indices = {f: i for (i, f) in enumerate(futures)}
+    for f in as_completed(futures):
+        i = indices.pop(f)
+        futures[i] = None
+        yield i, f.result()
+
+
+def do_obfuscation_batch_ast(
+    source_asts: list[AST],
+    source_file_names: list[str],
+    jobs: int = 1,
+    fused: bool = False,
+    profiler: Profiler | None = None,
+    pool=None,
+    unparse: bool = False,
+    ordered: bool = True,
+):
     """
     Obfuscates a batch of files at once, which comes at the advantage of the transformers being aware of the other files
     as well. Useful when working across files with mappings (for example, when renaming).
     Will yield each step as
     {"file_index": <index of file being processed>, "transformer": <transformer instance currently running>}
+    As soon as a file can't be changed by any later step anymore, it is yielded as finished:
+    {"file_index": <index of the file>, "transformer": None, "ast": <the obfuscated AST>}
     :param source_asts: The source asts
     :param source_file_names:
     The source file names, corresponding to source_asts. It is assumed that len(source_asts) = len(source_file_names).
+    :param jobs: How many worker processes to use. With more than 1, consecutive transformers that don't need all ASTs
+    are run per file in a process pool. The steps of one file are still yielded in order, files are yielded in order
+    :param fused: Whether to run consecutive transformers that declare node types in one traversal per file.
+    The output is the same as running them one by one
+    :param profiler: The profiler to record each (transformer, file) pair in, or None. Fused transformers are recorded
+    as one step. Steps run in worker processes are recorded there, and merged into it
+    :param pool: A pool from create_pool to run per file work in, instead of creating one for this batch. jobs is
+    ignored then. The pool is left running
+    :param unparse: Whether to unparse the finished files as well. Their events then also have "source": <the
+    source>, and "error": <the exception unparsing raised>, one of which is None. Files finished in a worker process
+    are unparsed by that worker, and their "ast" is None, it isn't sent back. Their entry in source_asts is set to
+    None, too
+    :param ordered: Whether files are yielded in order, in a pool. False yields each file as soon as its worker is done
+    with it, so it can be written right away, instead of waiting for the files before it
     :return: Nothing
     """
     assert len(source_file_names) == len(source_asts)
     source_file_names = list(map(lambda p: p if os.path.isabs(p) else os.path.abspath(p), source_file_names))
     transformers_to_run = list(filter(lambda x: x.config["enabled"].value, all_transformers))
-    for x in transformers_to_run:
+    # if the last transformer can touch every file, no file is finished before it's done with all of them
+    finish_per_file = len(transformers_to_run) > 0 and not transformers_to_run[-1].requires_all_asts
+    if jobs <= 1 and not fused and pool is None:
+        for x in transformers_to_run:
+            for i in range(len(source_asts)):
+                s_ast = source_asts[i]
+                s_fn = source_file_names[i]
+                source_asts[i] = _run_profiled_step(
+                    x.name, s_ast, s_fn, lambda a: x.transform(a, s_fn, source_asts, source_file_names), profiler
+                )
+                yield {"file_index": i, "transformer": x}
+                if finish_per_file and x is transformers_to_run[-1]:
+                    yield _finished_event(i, source_asts[i], s_fn, unparse, profiler)
+        if not finish_per_file:
+            for i in range(len(source_asts)):
+                yield _finished_event(i, source_asts[i], source_file_names[i], unparse, profiler)
+    else:
+        yield from _do_obfuscation_batch_segmented(
+            source_asts, source_file_names, transformers_to_run, jobs, fused, profiler, pool, unparse, ordered
+        )
+
+
+def _do_obfuscation_batch_segmented(
+    source_asts: list[AST],
+    source_file_names: list[str],
+    transformers_to_run: list,
+    jobs: int,
+    fused: bool,
+    profiler: Profiler | None,
+    pool,
+    unparse: bool,
+    ordered: bool,
+):
+    """
+    do_obfuscation_batch_ast, but running consecutive transformers that don't need all ASTs per file, optionally in a
+    process pool
+    """
+    own_pool = None
+    if pool is None and jobs > 1:
+        pool = own_pool = create_pool(jobs)
+    try:
+        segments = _group_consecutive(transformers_to_run, lambda x: not x.requires_all_asts)
+        for segment in segments:
+            finish_per_file = segment is segments[-1] and not segment[0].requires_all_asts
+            if segment[0].requires_all_asts:
+                x = segment[0]
+                for i in range(len(source_asts)):
+                    s_ast = source_asts[i]
+                    s_fn = source_file_names[i]
+                    source_asts[i] = _run_profiled_step(
+                        x.name, s_ast, s_fn, lambda a: x.transform(a, s_fn, source_asts, source_file_names), profiler
+                    )
+                    yield {"file_index": i, "transformer": x}
+                continue
+            if pool is None:
+                for i in range(len(source_asts)):
+                    source_asts[i] = _transform_file(source_asts[i], source_file_names[i], segment, fused, profiler)
+                    for x in segment:
+                        yield {"file_index": i, "transformer": x}
+                    if finish_per_file:
+                        yield _finished_event(i, source_asts[i], source_file_names[i], unparse, profiler)
+                continue
+            indices = [all_transformers.index(x) for x in segment]
+            # the last steps of a file are followed by unparsing it in the same worker, if asked to
+            worker = _transform_and_unparse_worker if finish_per_file and unparse else _transform_file_worker
+            work = [(source_asts[i], source_file_names[i], indices, fused) for i in range(len(source_asts))]
+            if profiler is None:
+                futures = [pool.submit(worker, *x) for x in work]
+            else:
+                futures = [pool.submit(run_profiled, profiler.trace_memory, worker, *x) for x in work]
+            del work
+            try:
+                for i, result in _results(futures, ordered):
+                    if profiler is not None:
+                        result, events = result
+                        profiler.add_events(events)
+                    for x in segment:
+                        yield {"file_index": i, "transformer": x}
+                    if worker is _transform_and_unparse_worker:
+                        source_asts[i] = None
+                        src, error = result
+                        yield {"file_index": i, "transformer": None, "ast": None, "source": src, "error": error}
+                        continue
+                    source_asts[i] = result
+                    if finish_per_file:
+                        yield _finished_event(i, source_asts[i], source_file_names[i], unparse, profiler)
+            finally:
+                for f in futures:
+                    if f is not None:
+                        f.cancel()
+        if len(segments) == 0 or segments[-1][0].requires_all_asts:
+            yield from _finish_all(source_asts, source_file_names, profiler, pool, unparse, ordered)
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown(cancel_futures=True)
+
+
+def _finish_all(
+    source_asts: list[AST],
+    source_file_names: list[str],
+    profiler: Profiler | None,
+    pool,
+    unparse: bool,
+    ordered: bool,
+):
+    """
+    Yields every file as finished, at the end of a batch whose last transformer needs all ASTs. If they are to be
+    unparsed and there is a pool, they are unparsed in there. Their ASTs are sent to it once, they aren't sent back
+    """
+    if not unparse or pool is None:
         for i in range(len(source_asts)):
-            s_ast = source_asts[i]
-            s_fn = source_file_names[i]
-            source_asts[i] = fix_missing_locations(x.transform(s_ast, s_fn, source_asts, source_file_names))
-            yield {"file_index": i, "transformer": x}
+            yield _finished_event(i, source_asts[i], source_file_names[i], unparse, profiler)
+        return
+    work = [(source_asts[i], source_file_names[i]) for i in range(len(source_asts))]
+    if profiler is None:
+        futures = [pool.submit(_unparse_finished, *x) for x in work]
+    else:
+        futures = [pool.submit(run_profiled, profiler.trace_memory, _unparse_finished, *x) for x in work]
+    del work
+    try:
+        for i, result in _results(futures, ordered):
+            if profiler is not None:
+                result, events = result
+                profiler.add_events(events)
+            src, error = result
+            yield {"file_index": i, "transformer": None, "ast": source_asts[i], "source": src, "error": error}
+    finally:
+        for f in futures:
+            if f is not None:
+                f.cancel()
 
 
-def do_obfuscation_single_ast(source_ast: AST, source_file_name: str) -> AST:
+def do_obfuscation_single_ast(
+    source_ast: AST, source_file_name: str, fused: bool = False, profiler: Profiler | None = None
+) -> AST:
     """
     Does obfuscation on a single AST. When obfuscating multiple ASTs that depend on each other, don't call this method
     on all of them separately. Use do_obfuscation_batch_ast, which can recognize import relations between them,
     and will consider them as well.
     :param source_ast: The source AST to transform
     :param source_file_name: The source file name
+    :param fused: Whether to run consecutive transformers that declare node types in one traversal
+    :param profiler: The profiler to record each transformer in, or None
     :return: The transformed AST
     """
     transformers_to_run = list(filter(lambda x: x.config["enabled"].value, all_transformers))
+    if fused or profiler is not None:
+        return _transform_file(source_ast, source_file_name, transformers_to_run, fused, profiler)
     for x in transformers_to_run:
         source_ast = x.transform(source_ast, source_file_name, None, None)
 
@@ -126,14 +426,18 @@ def do_obfuscation_single_ast(source_ast: AST, source_file_name: str) -> AST:
     return source_ast
 
 
-def do_post_run(output_location: pathlib.Path, output_files: list[pathlib.Path]) -> list[pathlib.Path]:
+def do_post_run(
+    output_location: pathlib.Path, output_files: list[pathlib.Path], profiler: Profiler | None = None
+) -> list[pathlib.Path]:
     """
     Transforms all output files
     :param output_location: The parent folder of the output files. Will be used to write any new files to
     :param output_files: All files to transform
+    :param profiler: The profiler to record each transformer in, or None
     :return: The new output paths
     """
     transformers_to_run = list(filter(lambda x: x.config["enabled"].value, all_transformers))
     for x in transformers_to_run:
-        output_files = x.transform_output(output_location, output_files)
+        with profile_span(profiler, x.name, "post run", files=len(output_files)):
+            output_files = x.transform_output(output_location, output_files)
     return output_files
@@ -0,0 +1,239 @@
+import asyncio
+import contextlib
+import os.path
+import tempfile
+from ast import AST, fix_missing_locations, parse
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator
+
+from . import (
+    LazyTransformer,
+    _group_consecutive,
+    _init_worker,
+    _transform_file_worker,
+    all_transformers,
+    get_current_config,
+)
+from .util import NonEscapingUnparser, replaced_file_mode
+
+# the configuration this worker process was last initialized with, see _transform_file_configured
+_worker_config = None
+
+
+def _transform_file_configured(
+    parent_pid: int,
+    cfg: dict[str, Any],
+    source_ast: AST,
+    source_file_name: str,
+    transformer_indices: list[int],
+    fused: bool,
+) -> AST:
+    """
+    _transform_file_worker, for executors that weren't created with _init_worker as initializer
+    :param parent_pid: The process the work was submitted from. Executors running it in there (like a
+    ThreadPoolExecutor) already have its configuration, and share its random state
+    :param cfg: The configuration of the parent process
+    """
+    global _worker_config
+    if os.getpid() != parent_pid and _worker_config != cfg:
+        _init_worker(cfg)
+        _worker_config = cfg
+    return _transform_file_worker(source_ast, source_file_name, transformer_indices, fused)
+
+
+async def _settle(futures: list[Future | None]):
+    """
+    Cancels the futures that haven't started yet, and waits for the ones that have. Cancelling a task awaiting a
+    future doesn't stop the work once it's running, so this makes sure none of it is still going on afterwards.
+    Cancelling the wait itself is only passed on once it's done
+    :param futures: The futures. None entries are skipped
+    :return: Nothing
+    """
+    running = [asyncio.wrap_future(x) for x in futures if x is not None and not x.cancel() and not x.done()]
+    if len(running) == 0:
+        return
+    waiting = asyncio.ensure_future(asyncio.wait(running))
+    cancelled = None
+    while not waiting.done():
+        try:
+            await asyncio.shield(waiting)
+        except asyncio.CancelledError as e:
+            cancelled = e
+    if cancelled is not None:
+        raise cancelled
+
+
+async def _run(executor: Executor, fn, *args) -> Any:
+    """
+    Runs fn in executor, like loop.run_in_executor, but if the caller is cancelled while fn is running, waits for it
+    to finish before passing the cancellation on
+    """
+    future = executor.submit(fn, *args)
+    try:
+        return await asyncio.wrap_future(future)
+    finally:
+        await _settle([future])
+
+
+def _unparse(source_ast: AST) -> str:
+    return NonEscapingUnparser().visit(source_ast)
+
+
+def _read(path: str) -> str:
+    with open(path, "r", encoding="utf8") as f:
+        return f.read()
+
+
+def _write_atomic(path: str, content: str):
+    """
+    Writes a file by writing a temporary file next to it, and renaming that over it. Readers (and anything that
+    stops halfway through) never see a half-written file
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix="." + os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as f:
+            f.write(content)
+        os.chmod(tmp, replaced_file_mode(path))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+async def do_obfuscation_batch_async(
+    source_asts: list[AST],
+    source_file_names: list[str],
+    executor: Executor | None = None,
+    fused: bool = False,
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    The asyncio counterpart of do_obfuscation_batch_ast. Yields the same events, but does the work off the event loop.
+    Transformers that need all ASTs run in a background thread. Everything else runs per file, either in the same
+    background thread, or in parallel in executor.
+    Cancelling (or timing out) drops any queued work, and waits until the steps already running are done, so
+    nothing touches the ASTs or the transformers afterwards. The ASTs are left in an unspecified state then.
+    :param source_asts: The source asts
+    :param source_file_names: The source file names, corresponding to source_asts
+    :param executor: The executor to run per file work in, or None to run it in the background thread. Process pools
+    don't need to be initialized with anything, the configuration is sent along with the work. Thread pools work as
+    well, per file state of the transformers is kept apart per thread (see Transformer.file_context). Don't change
+    the configuration while the batch is running, in either case
+    :param fused: See do_obfuscation_batch_ast
+    :return: An async iterator over the events
+    """
+    assert len(source_file_names) == len(source_asts)
+    source_file_names = list(map(lambda p: p if os.path.isabs(p) else os.path.abspath(p), source_file_names))
+    transformers_to_run = list(filter(lambda x: x.config["enabled"].value, all_transformers))
+    # like in do_obfuscation_batch_ast
+    finish_per_file = len(transformers_to_run) > 0 and not transformers_to_run[-1].requires_all_asts
+    background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pyobf2")
+    cfg = get_current_config()
+    try:
+        segments = _group_consecutive(transformers_to_run, lambda x: not x.requires_all_asts)
+        for segment in segments:
+            if segment[0].requires_all_asts:
+                x = segment[0]
+                for i in range(len(source_asts)):
+                    s_fn = source_file_names[i]
+                    source_asts[i] = await _run(
+                        background,
+                        lambda: fix_missing_locations(x.transform(source_asts[i], s_fn, source_asts, source_file_names)),
+                    )
+                    yield {"file_index": i, "transformer": x}
+                continue
+            indices = [all_transformers.index(x) for x in segment]
+            for x in segment:  # created here, not by several threads at once
+                if isinstance(x, LazyTransformer):
+                    x.instance
+            if executor is None:  # same process, the configuration is already there
+                futures = [
+                    background.submit(_transform_file_worker, source_asts[i], source_file_names[i], indices, fused)
+                    for i in range(len(source_asts))
+                ]
+            else:
+                pid = os.getpid()
+                futures = [
+                    executor.submit(
+                        _transform_file_configured, pid, cfg, source_asts[i], source_file_names[i], indices, fused
+                    )
+                    for i in range(len(source_asts))
+                ]
+            try:
+                for i in range(len(source_asts)):
+                    source_asts[i] = await asyncio.wrap_future(futures[i])
+                    futures[i] = None
+                    for x in segment:
+                        yield {"file_index": i, "transformer": x}
+                    if finish_per_file and segment is segments[-1]:
+                        yield {"file_index": i, "transformer": None, "ast": source_asts[i]}
+            finally:
+                await _settle(futures)
+        if not finish_per_file:
+            for i in range(len(source_asts)):
+                yield {"file_index": i, "transformer": None, "ast": source_asts[i]}
+    finally:
+        background.shutdown(wait=False, cancel_futures=True)
+
+
+async def obfuscate_files_async(
+    files: list[str],
+    output_dir: str,
+    executor: Executor | None = None,
+    fused: bool = False,
+    timeout: float | None = None,
+) -> dict[str, str]:
+    """
+    Reads, obfuscates and writes files as one batch, without blocking the event loop. Files are read concurrently,
+    and each file is unparsed and written as soon as it is finished, while the others are still being obfuscated.
+    Outputs are written atomically, so cancelling or timing out never leaves half-written files behind. Files that
+    were finished before that are written completely.
+    Transformers that only act on output files (see do_post_run) don't run.
+    :param files: The files to obfuscate
+    :param output_dir: The directory to write to. Files keep their path relative to the common parent of all files
+    :param executor: See do_obfuscation_batch_async. Also used for unparsing, if set
+    :param fused: See do_obfuscation_batch_ast
+    :param timeout: Seconds after which to give up, raising TimeoutError. None to wait forever
+    :return: input file : output file pairs
+    """
+    return await asyncio.wait_for(_obfuscate_files(files, output_dir, executor, fused), timeout)
+
+
+async def _obfuscate_files(
+    files: list[str], output_dir: str, executor: Executor | None, fused: bool
+) -> dict[str, str]:
+    if len(files) == 0:
+        return {}
+    files = [os.path.abspath(x) for x in files]
+    root = os.path.commonpath([os.path.dirname(x) for x in files])
+    sources = await asyncio.gather(*[asyncio.to_thread(_read, x) for x in files])
+    asts = [parse(src, fn) for (src, fn) in zip(sources, files)]
+    del sources
+    outputs = {}
+    writes = []
+    io = ThreadPoolExecutor(thread_name_prefix="pyobf2-io")
+
+    async def write(source_ast: AST, path: str):
+        # unparsing is pure python, keep it off the loop
+        src = await _run(executor if executor is not None else io, _unparse, source_ast)
+        await _run(io, _write_atomic, path, src)
+
+    try:
+        async with contextlib.aclosing(do_obfuscation_batch_async(asts, files, executor, fused)) as events:
+            async for event in events:
+                if event["transformer"] is not None:
+                    continue
+                file = files[event["file_index"]]
+                asts[event["file_index"]] = None
+                outputs[file] = os.path.join(output_dir, os.path.relpath(file, root))
+                writes.append(asyncio.ensure_future(write(event["ast"], outputs[file])))
+        await asyncio.gather(*writes)
+    except BaseException:
+        for x in writes:
+            x.cancel()
+        # the writes that are already running finish (or clean up) first, so nothing is left behind
+        await asyncio.gather(*writes, return_exceptions=True)
+        raise
+    finally:
+        io.shutdown(wait=False)
+    return outputs
@@ -1,13 +1,24 @@
 import math
 import opcode
+from bisect import bisect_left
 from types import CodeType
 from typing import Any
 
 
 class _insn:
-    def __init__(self, opcode: int, arg: int):
+    """
+    An instruction, and where it is in the bytecode. The offset points at its first EXTENDED_ARG, if it has any,
+    and size includes them and the inline cache entries after it
+    """
+
+    __slots__ = ("opc", "arg", "offset", "size", "line")
+
+    def __init__(self, opcode: int, arg: int, offset: int = 0, line: int | None = None):
         self.opc = opcode
         self.arg = arg
+        self.offset = offset
+        self.size = 0
+        self.line = line
 
     def to_bc_seq(self):
         bl = self.arg.bit_length()
@@ -26,25 +37,63 @@ class _insn:
         return bytes(constructed)
 
 
-def _encode_varint(value) -> bytes:
-    a = value
-    v = 0
-    while a > 0:  # reverse bytes of a
-        v |= a & 63
-        v = v << 6
-        a = a >> 6
+_RETURN_GENERATOR = opcode.opmap["RETURN_GENERATOR"]
+_BACKWARD_JUMPS = {x for x in opcode.hasjrel if "JUMP_BACKWARD" in opcode.opname[x]}
+# instructions after which execution never continues with the next one
+_NO_FALLTHROUGH = {
+    opcode.opmap[x]
+    for x in ("RETURN_VALUE", "RAISE_VARARGS", "RERAISE", "JUMP_FORWARD", "JUMP_BACKWARD", "JUMP_BACKWARD_NO_INTERRUPT")
+}
+
+
+def _stack_effect(insn: _insn, jump: bool) -> int:
+    if insn.opc == _RETURN_GENERATOR:  # the generator resumes after it with the sent value (None) on the stack
+        return 1
+    if insn.opc < opcode.HAVE_ARGUMENT:
+        return opcode.stack_effect(insn.opc)
+    return opcode.stack_effect(insn.opc, insn.arg, jump=jump)
+
+
+def _encode_location_varint(value: int) -> bytes:
+    # little endian groups of 6 bits, 0x40 marks that another one follows
     b = []
-    while v > 0:
-        val = v & 0b11_11_11  # 6 bits at once
-        v = v >> 6  # shift 6 bits right
-        if v > 0:
-            val = val | 0b1_00_00_00  # add cont bit, we have a next byte to encode
-        b.append(val)  # add byte to the result
-    if len(b) == 0:  # nothing encoded
-        b = [0x00]
+    while value >= 64:
+        b.append(0x40 | (value & 63))
+        value >>= 6
+    b.append(value)
     return bytes(b)
 
 
+def _const_key(value: Any) -> Any:
+    """
+    The key of a constant in the constant pool. Like the compiler, it doesn't merge constants that are equal, but
+    aren't the same, like 0, 0.0 and False, or 0.0 and -0.0, or tuples containing those
+    """
+    t = type(value)
+    if t is tuple or t is frozenset:
+        return t, t(_const_key(x) for x in value)
+    if t is float:
+        return t, value.hex()
+    if t is complex:
+        return t, value.real.hex(), value.imag.hex()
+    try:
+        hash(value)
+    except TypeError:  # only the same object can be reused
+        return t, id(value)
+    return t, value
+
+
+def _encode_varint(value) -> bytes:
+    # big endian groups of 6 bits, 0x40 marks that another one follows
+    groups = [value & 63]
+    value >>= 6
+    while value > 0:
+        groups.append(value & 63)
+        value >>= 6
+    groups.reverse()
+    return bytes([0x40 | x for x in groups[:-1]] + [groups[-1]])
+
+
 class Assembler:
     """
     An assembler for python bytecode
@@ -84,14 +133,15 @@ class Assembler:
             self.lasti = is_lasti
 
         def to_bc_seq(self):
-            bc = b""
+            bc = bytearray()
             bc += _encode_varint(
                 self.from_i // 2
             )  # since bytecode indexes are whole numbers, we can safely divide by 2 to "compress" the varints
+            bc[0] |= 0x80  # marks the start of an entry, the interpreter looks for it when bisecting large tables
             bc += _encode_varint(self.len // 2)
             bc += _encode_varint(self.target // 2)
             bc += _encode_varint(self.depth << 1 | int(self.lasti))
-            return bc
+            return bytes(bc)
 
     def __init__(self, arg_names: list[str] = None):
         """
@@ -100,11 +150,17 @@ class Assembler:
         """
         if arg_names is None:
             arg_names = list()
-        self._insns = []
+        self._insns: list[_insn] = []
+        # the bytecode of _insns, built up as they are added
+        self._code = bytearray()
         self._consts = []
+        self._const_indices: dict[Any, int] = {}
         self._names = []
+        self._name_indices: dict[str, int] = {}
         self._varnames = []
+        self._varname_indices: dict[str, int] = {}
         self._exctable = []
+        self._line = None
         self._argnames = arg_names
         for n in arg_names:
             self.locals_create_or_get(n)
@@ -114,7 +170,7 @@ class Assembler:
         Returns the length of the currently built bytecode sequence (aka the index of the next instruction)
         :return: the length of the currently built bytecode sequence
         """
-        return len(self._build_co_str())
+        return len(self._code)
 
     def insn(self, name: str, arg: int = 0):
         """
@@ -151,7 +207,9 @@ class Assembler:
             raise ValueError("Opcode not in range 0-255")
         if arg < 0:
             raise ValueError("arg out of bounds")
-        insn = _insn(opcode, arg)
+        insn = _insn(opcode, arg, len(self._code), self._line)
+        self._code += insn.to_bc_seq()
+        insn.size = len(self._code) - insn.offset
         self._insns.append(insn)
 
     def add_exception_table_span(self, from_index: int, to_index: int, target_index: int, depth: int, is_lasti: bool):
@@ -167,29 +225,124 @@ class Assembler:
         """
         self._exctable.append(self._exc_table_entry(from_index, to_index, target_index, depth, is_lasti))
 
+    def set_line(self, line: int | None):
+        """
+        Sets the source line of the insns added after this. Once any insn has a line, the code object gets a line table
+        :param line: The line, or None for no line
+        :return: Nothing
+        """
+        self._line = line
+
+    def _jump_target(self, index: int) -> int:
+        insn = self._insns[index]
+        # relative to the end of the insn, including its cache entries
+        delta = -insn.arg * 2 if insn.opc in _BACKWARD_JUMPS else insn.arg * 2
+        return insn.offset + insn.size + delta
+
+    def stack_depths(self) -> list[int | None]:
+        """
+        Computes the stack depth before each insn, by following every path through the code (jumps and exception
+        handlers included) with opcode.stack_effect
+        :return: The depth before each insn, or None if the insn is unreachable
+        :raises ValueError: If the stack underflows, a jump or handler doesn't land on an insn, the code runs off its
+        end, two paths meet with different depths, or an exception table entry is deeper than the stack in its span
+        """
+        n = len(self._insns)
+        offsets = [x.offset for x in self._insns]
+        index_of = {offsets[i]: i for i in range(n)}
+        handlers: list[list[tuple[int, int, int]]] = [[] for _ in range(n)]  # entry depth, handler, handler depth
+        for x in self._exctable:
+            if x.target not in index_of:
+                raise ValueError(f"Exception handler at {x.target} is not the start of an insn")
+            for i in range(bisect_left(offsets, x.from_i), bisect_left(offsets, x.from_i + x.len)):
+                handlers[i].append((x.depth, index_of[x.target], x.depth + 1 + int(x.lasti)))
+
+        depths: list[int | None] = [None] * n
+        work = []
+
+        def reach(i: int, depth: int, origin: int):
+            if i >= n:
+                raise ValueError(f"Execution runs off the end of the code after {offsets[origin]}")
+            if depth < 0:
+                raise ValueError(f"Stack underflow after {offsets[origin]}")
+            if depths[i] is None:
+                depths[i] = depth
+                work.append(i)
+            elif depths[i] != depth:
+                raise ValueError(f"Stack depth at {offsets[i]} is either {depths[i]} or {depth}, depending on the path")
+
+        if n > 0:
+            depths[0] = 0
+            work.append(0)
+        while len(work) > 0:
+            i = work.pop()
+            insn = self._insns[i]
+            depth = depths[i]
+            for entry_depth, handler, handler_depth in handlers[i]:
+                if depth < entry_depth:
+                    raise ValueError(
+                        f"Exception table entry covering {insn.offset} has depth {entry_depth}, but the stack is "
+                        f"only {depth} deep there"
+                    )
+                reach(handler, handler_depth, i)
+            if insn.opc in opcode.hasjrel:
+                target = self._jump_target(i)
+                if target not in index_of:
+                    raise ValueError(f"Jump at {insn.offset} to {target} doesn't land on an insn")
+                reach(index_of[target], depth + _stack_effect(insn, True), i)
+            if insn.opc not in _NO_FALLTHROUGH:
+                reach(i + 1, depth + _stack_effect(insn, False), i)
+        return depths
+
+    def stack_size(self) -> int:
+        """
+        :return: The deepest the stack gets while running the code, see stack_depths
+        """
+        return max((x for x in self.stack_depths() if x is not None), default=0)
+
+    def _build_line_table(self, first_line: int) -> bytes:
+        b = bytearray()
+        line = first_line
+        i = 0
+        while i < len(self._insns):
+            # a run of insns on the same line, split into entries of at most 8 code units
+            j = i
+            while j < len(self._insns) and self._insns[j].line == self._insns[i].line:
+                j += 1
+            units = (self._insns[j - 1].offset + self._insns[j - 1].size - self._insns[i].offset) // 2
+            new_line = self._insns[i].line
+            while units > 0:
+                length = min(units, 8)
+                if new_line is None:
+                    b.append(0x80 | (15 << 3) | (length - 1))  # no location
+                else:
+                    delta = new_line - line
+                    b.append(0x80 | (13 << 3) | (length - 1))  # line only, no columns
+                    b += _encode_location_varint((-delta << 1) | 1 if delta < 0 else delta << 1)
+                    line = new_line
+                units -= length
+            i = j
+        return bytes(b)
+
     def _build_co_str(self) -> bytes:
-        b = b""
-        for x in self._insns:
-            b += x.to_bc_seq()
-        return b
+        return bytes(self._code)
 
     def _build_exc_table(self) -> bytes:
-        b = b""
-        for x in self._exctable:
-            b += x.to_bc_seq()
-        return b
+        return b"".join(x.to_bc_seq() for x in self._exctable)
 
     def pack_code_object(self) -> CodeType:
         """
-        Compiles this assembler into a code object
+        Compiles this assembler into a code object. The stack size is computed from the code, see stack_depths
         :return: The constructed code object. Can be marshalled using marshal.dumps, or executed using eval() or exec()
+        :raises ValueError: If the code is inconsistent, see stack_depths
         """
+        first_line = next((x.line for x in self._insns if x.line is not None), None)
         return CodeType(
             len(self._argnames),
             0,
             0,
             len(self._varnames),
-            30,
+            self.stack_size(),
             0,
             self._build_co_str(),
             tuple(self._consts),
@@ -198,8 +351,8 @@ class Assembler:
             "<asm>",
             "",
             "",
-            0,
-            b"",
+            0 if first_line is None else first_line,
+            b"" if first_line is None else self._build_line_table(first_line),
             self._build_exc_table(),
         )
 
@@ -209,12 +362,12 @@ class Assembler:
         :param value: The desired value
         :return: An existing or new index to the constant pool, where the specified value is
         """
-        if value in self._consts:
-            return self._consts.index(value)
-        else:
-            i = len(self._consts)
+        key = _const_key(value)
+        i = self._const_indices.get(key)
+        if i is None:
+            i = self._const_indices[key] = len(self._consts)
             self._consts.append(value)
-            return i
+        return i
 
     def names_create_or_get(self, value: str) -> int:
         """
@@ -222,12 +375,11 @@ class Assembler:
         :param value: The desired value
         :return: An existing or new index to the name pool, where the specified value is
         """
-        if value in self._names:
-            return self._names.index(value)
-        else:
-            i = len(self._names)
+        i = self._name_indices.get(value)
+        if i is None:
+            i = self._name_indices[value] = len(self._names)
             self._names.append(value)
-            return i
+        return i
 
     def locals_create_or_get(self, value: str) -> int:
         """
@@ -235,9 +387,8 @@ class Assembler:
         :param value: The desired value
         :return: An existing or new index to the local pool, where the specified value is
         """
-        if value in self._varnames:
-            return self._varnames.index(value)
-        else:
-            i = len(self._varnames)
+        i = self._varname_indices.get(value)
+        if i is None:
+            i = self._varname_indices[value] = len(self._varnames)
             self._varnames.append(value)
-            return i
+        return i
@@ -0,0 +1,111 @@
+import hashlib
+import importlib.metadata
+import json
+import os.path
+import sys
+import tempfile
+
+from . import get_current_config
+from .sources import SourceCache
+from .util import replaced_file_mode
+
+
+def _pyobf2_version() -> str:
+    try:
+        return importlib.metadata.version("pyobf2")
+    except importlib.metadata.PackageNotFoundError:  # running from a checkout
+        return "unknown"
+
+
+class BuildCache:
+    """
+    An on-disk cache for obfuscated sources. Entries are addressed by a hash of everything that goes into the output
+    of a file: its source, the sources of everything it imports (transitively), the configuration, and the versions
+    of pyobf2 and python. Changing a file thus invalidates the file itself, and every file that imports it.
+    Entries are written atomically, so the cache can be shared between parallel builds.
+    Names generated by the renamer have to be deterministic (the default rename_format is), since files served from
+    the cache keep referring to the names generated for the files they import in earlier builds.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+
+    @staticmethod
+    def _config_fingerprint() -> str:
+        cfg = {k: v for (k, v) in get_current_config().items() if not k.startswith("general.")}  # cli only
+        return json.dumps(cfg, sort_keys=True, default=str)
+
+    def compute_keys(
+        self, files: list[str], deptree: dict[str, list[str]], sources: SourceCache | None = None
+    ) -> dict[str, str]:
+        """
+        Computes the cache key of each file
+        :param files: The files to compute the keys of
+        :param deptree: The dependency tree of the files, as returned by get_dependency_tree
+        :param sources: The cache to read the files through, or None to use a new one
+        :return: file : key pairs
+        """
+        if sources is None:
+            sources = SourceCache()
+        source_hashes = {}
+
+        def source_hash(file: str) -> str:
+            if file not in source_hashes:
+                source_hashes[file] = hashlib.sha256(sources.source(file).encode("utf8")).hexdigest()
+            return source_hashes[file]
+
+        base = hashlib.sha256()
+        base.update(_pyobf2_version().encode("utf8") + b"\x00")
+        base.update(sys.version.encode("utf8") + b"\x00")
+        base.update(self._config_fingerprint().encode("utf8") + b"\x00")
+        common_prefix_l = len(os.path.commonpath([os.path.dirname(x) + "/" for x in files])) + 1
+
+        keys = {}
+        for file in files:
+            closure = {file}
+            work = [file]
+            while len(work) > 0:
+                for dep in deptree.get(work.pop(), []):
+                    if dep not in closure:
+                        closure.add(dep)
+                        work.append(dep)
+            h = base.copy()
+            h.update(file[common_prefix_l:].encode("utf8") + b"\x00")
+            for dep in sorted(closure):
+                h.update(f"{dep[common_prefix_l:]}:{source_hash(dep)}\x00".encode("utf8"))
+            keys[file] = h.hexdigest()
+        return keys
+
+    def _path_of(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key[2:] + ".py")
+
+    def get(self, key: str) -> str | None:
+        """
+        Gets the obfuscated source stored under a key
+        :param key: The key, from compute_keys
+        :return: The obfuscated source, or None if there is no entry for the key
+        """
+        try:
+            with open(self._path_of(key), "r", encoding="utf8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, source: str):
+        """
+        Stores an obfuscated source under a key
+        :param key: The key, from compute_keys
+        :param source: The obfuscated source
+        :return: Nothing
+        """
+        p = self._path_of(key)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(p), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf8") as f:
+                f.write(source)
+            os.chmod(tmp, replaced_file_mode(p))
+            os.replace(tmp, p)
+        except BaseException:
+            os.unlink(tmp)
+            raise
@@ -0,0 +1,196 @@
+import os.path
+import pathlib
+import pickle
+from ast import AST
+
+from . import all_transformers, create_pool, do_obfuscation_batch_ast, do_post_run
+from .sources import SourceCache
+from .util import NonEscapingUnparser, get_dependency_tree, update_dependency_tree
+
+
+class IncrementalBuild:
+    """
+    Keeps the sources and the dependency tree of a transitive run in memory, to re-obfuscate only what a change
+    affects: the changed files, and every file that (transitively) imports one of them. If a transformer looking at
+    other files (like the renamer) is enabled, the files those import are obfuscated along with them, so it can apply
+    their mappings, but are not written again.
+    Outputs are only written if their content changed, and the outputs of deleted files are deleted.
+    Files are only parsed again once they change. Their parsed source is kept in between, and copied for each build.
+    With jobs > 1, one process pool is used for every build. Call close once done.
+    Like the build cache, this requires a deterministic renamer.rename_format, if the renamer is enabled.
+    """
+
+    def __init__(self, input_file: str, output_dir: str, files: list[str], jobs: int = 1, fused: bool = False):
+        """
+        :param input_file: The file the dependency tree is crawled from
+        :param output_dir: The directory to write the obfuscated files to
+        :param files: Additional files to obfuscate, which the crawler doesn't find (manual includes)
+        :param jobs: See do_obfuscation_batch_ast
+        :param fused: See do_obfuscation_batch_ast
+        """
+        self.input_file = os.path.abspath(input_file)
+        self.output_dir = output_dir
+        self.jobs = jobs
+        self.fused = fused
+        self.sources = SourceCache()
+        self.deptree = get_dependency_tree(self.input_file, self.sources, jobs)
+        self.files = []
+        for x in [self.input_file, *self.deptree.keys(), *[y for ys in self.deptree.values() for y in ys], *files]:
+            if x not in self.files:
+                self.files.append(x)
+        self.common_prefix_l = len(os.path.commonpath([os.path.dirname(x) + "/" for x in self.files])) + 1
+        # the stat signature of each file when it was last built from, to tell which ones changed since
+        self.signatures: dict[str, tuple[int, int]] = {}
+        # the last written source of each file, and where it ended up after the post run
+        self.outputs: dict[str, str] = {}
+        self.output_files: dict[str, str] = {}
+        # the pickled, unobfuscated AST of each file, since it last changed
+        self.parsed: dict[str, bytes] = {}
+        self.pool = None
+        for x in self.files:
+            self._load(x)
+
+    def _load(self, file: str):
+        # in this order, so a change while reading still shows up in the next poll
+        self.signatures[file] = self.sources.signature(file)
+        self.sources.source(file)
+        self.parsed.pop(file, None)
+
+    def _take_ast(self, file: str) -> AST:
+        """
+        :return: An unobfuscated AST of a file, which the caller may modify. Only parsed if the file changed
+        """
+        if file not in self.parsed:
+            tree = self.sources.take_ast(file)
+            self.parsed[file] = pickle.dumps(tree)
+            return tree
+        return pickle.loads(self.parsed[file])
+
+    def output_path(self, file: str) -> str:
+        return os.path.join(self.output_dir, file[self.common_prefix_l :])
+
+    def add_files(self, files: list[str]) -> list[str]:
+        """
+        Starts tracking files, for example ones that newly match a manual include
+        :param files: The files. Files that are already tracked, or are outside the project root, are ignored
+        :return: The files that are new
+        """
+        root = os.path.commonpath([os.path.dirname(x) + "/" for x in self.files])
+        new = [x for x in files if x not in self.signatures and os.path.commonpath([root, x]) == root]
+        for x in new:
+            self.files.append(x)
+            self._load(x)
+        return new
+
+    def poll(self) -> tuple[list[str], list[str]]:
+        """
+        Checks which tracked files changed on disk since they were last read, and reads them again. Files that were
+        deleted are not tracked anymore, and their outputs are deleted
+        :return: The changed files, and the deleted outputs
+        """
+        changed = []
+        deleted = []
+        for x in list(self.files):
+            try:
+                sig = self.sources.signature(x)
+            except FileNotFoundError:
+                deleted += self._remove(x)
+                continue
+            if sig != self.signatures[x]:
+                self._load(x)
+                changed.append(x)
+        return changed, deleted
+
+    def _remove(self, file: str) -> list[str]:
+        """
+        Stops tracking a deleted file, and deletes its output, so it can't be imported from the output anymore
+        :return: The deleted output, if there was one
+        """
+        self.files.remove(file)
+        del self.signatures[file]
+        self.sources.forget(file)
+        self.parsed.pop(file, None)
+        self.outputs.pop(file, None)
+        self.deptree.pop(file, None)
+        for deps in self.deptree.values():
+            if file in deps:
+                deps.remove(file)
+        out = self.output_files.pop(file, self.output_path(file))
+        if not os.path.isfile(out):
+            return []
+        os.remove(out)
+        return [out]
+
+    def affected_by(self, changed: list[str]) -> list[str]:
+        """
+        :param changed: The changed files
+        :return: The changed files, and every file that imports one of them, transitively. In tracking order
+        """
+        importers = {}
+        for x, deps in self.deptree.items():
+            for y in deps:
+                importers.setdefault(y, []).append(x)
+        dirty = set(changed)
+        work = list(changed)
+        while len(work) > 0:
+            for x in importers.get(work.pop(), []):
+                if x not in dirty:
+                    dirty.add(x)
+                    work.append(x)
+        return [x for x in self.files if x in dirty]
+
+    def build(self, changed: list[str] | None = None) -> list[str]:
+        """
+        Obfuscates the files affected by a change, and writes the ones whose output changed
+        :param changed: The changed files, as returned by poll. None to build everything
+        :return: The written output paths
+        """
+        if changed is None:
+            dirty = list(self.files)
+        else:
+            changed = [x for x in changed if x in self.signatures]  # not deleted since
+            update_dependency_tree(self.input_file, self.deptree, changed, self.sources)
+            self.add_files([*self.deptree.keys(), *[y for ys in self.deptree.values() for y in ys]])
+            dirty = self.affected_by(changed)
+        needed = set(dirty)
+        # the files they import are only needed by transformers looking at other files, like the renamer
+        if any(x.requires_all_asts for x in all_transformers if x.config["enabled"].value):
+            for x in dirty:
+                needed.update(self.deptree.get(x, []))
+            needed.add(self.input_file)  # the renamer resolves absolute imports relative to the top-most file
+        batch = [x for x in self.files if x in needed]
+        batch_asts = [self._take_ast(x) for x in batch]
+        if self.jobs > 1 and self.pool is None:
+            self.pool = create_pool(self.jobs)
+        dirty = set(dirty)
+        written = {}
+        for event in do_obfuscation_batch_ast(batch_asts, batch, self.jobs, self.fused, pool=self.pool):
+            if event["transformer"] is not None:
+                continue
+            file = batch[event["file_index"]]
+            batch_asts[event["file_index"]] = None
+            if file not in dirty:
+                continue
+            src = NonEscapingUnparser().visit(event["ast"])
+            if self.outputs.get(file) == src and os.path.exists(self.output_files.get(file, "")):
+                continue
+            out = self.output_path(file)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with open(out, "w", encoding="utf8") as f:
+                f.write(src)
+            self.outputs[file] = src
+            written[file] = out
+        if len(written) > 0:
+            post = do_post_run(pathlib.Path(self.output_dir), [pathlib.Path(x) for x in written.values()])
+            for file, out in zip(written.keys(), post):
+                self.output_files[file] = str(out)
+        return list(written.values())
+
+    def close(self):
+        """
+        Shuts down the process pool, if there is one
+        :return: Nothing
+        """
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
@@ -0,0 +1,75 @@
+import ast
+import functools
+import os.path
+from types import CodeType
+from typing import BinaryIO
+
+from . import all_transformers, do_obfuscation_batch_ast
+from .transformers.compileFinalFiles import code_to_pyc, compile_source
+from .util import NonEscapingUnparser
+
+
+class Result:
+    """
+    The obfuscated form of one source. The code object and .pyc contents are only created when first asked for
+    """
+
+    def __init__(self, name: str, source: str):
+        self.name = name
+        self.source = source
+
+    @functools.cached_property
+    def code(self) -> CodeType:
+        """
+        The compiled source, without line number information, like compileFinalFiles compiles it
+        """
+        return compile_source(self.source)
+
+    @functools.cached_property
+    def pyc(self) -> bytes:
+        """
+        The contents of a .pyc file holding the code object
+        """
+        return code_to_pyc(self.code)
+
+
+def obfuscate_sources(sources: dict[str, str], jobs: int = 1, fused: bool = False) -> dict[str, Result]:
+    """
+    Obfuscates sources without touching the disk, with the current configuration. The sources are obfuscated as one
+    batch, see do_obfuscation_batch_ast.
+    Transformers that only act on output files (compileFinalFiles, packInPyz) don't run, use Result.code, Result.pyc
+    and pack_pyz instead.
+    :param sources: name : source pairs. The names are paths relative to the project root (for example pkg/util.py),
+    which is how the transformers find out which source imports which
+    :param jobs: See do_obfuscation_batch_ast
+    :param fused: See do_obfuscation_batch_ast
+    :return: name : Result pairs, in the same order as sources
+    """
+    names = list(sources.keys())
+    asts = [ast.parse(sources[x], x) for x in names]
+    results = {}
+    for event in do_obfuscation_batch_ast(asts, names, jobs, fused):
+        if event["transformer"] is None:
+            name = names[event["file_index"]]
+            results[name] = Result(name, NonEscapingUnparser().visit(event["ast"]))
+            asts[event["file_index"]] = None
+    return {x: results[x] for x in names}
+
+
+def pack_pyz(results: dict[str, Result], out: BinaryIO, compiled: bool = False) -> bool:
+    """
+    Packs obfuscated sources into a .pyz archive, like packInPyz does with output files. Uses the packInPyz
+    configuration (bootstrap_file, encrypt)
+    :param results: The results, as returned by obfuscate_sources
+    :param out: The stream to write the archive to, for example a BytesIO
+    :param compiled: Whether to pack the .pyc files instead of the sources. The bootstrap file has to be a .pyc then
+    :return: Whether the archive was written. It isn't if the bootstrap file is missing
+    """
+    packer = next(x for x in all_transformers if x.name == "packInPyz")
+    files = {}
+    for name, result in results.items():
+        if compiled:
+            files[os.path.splitext(name)[0] + ".pyc"] = result.pyc
+        else:
+            files[name] = result.source.encode("utf8")
+    return packer.pack(files, out)
@@ -0,0 +1,62 @@
+import os.path
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class MappingStore:
+    """
+    Keeps the names generated by the renamer between builds, in an sqlite database. Bindings that are already in the
+    store keep their name, and only new bindings get new names, so the output of a module doesn't change just because
+    something else in the project changed.
+    Modules are identified by a name chosen by the caller (the renamer uses the path relative to the project), and
+    bindings by their key in MappingGenerator.mappings. Lookups go through the primary key, so they stay fast with
+    any number of modules. Each module is generated while holding the write lock of the database, so parallel builds
+    can share a store.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._connection: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # autocommit, transactions are started explicitly in bindings
+            con = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS mappings (module TEXT, key TEXT, name TEXT, PRIMARY KEY (module, key)) "
+                "WITHOUT ROWID"
+            )
+            self._connection = con
+        return self._connection
+
+    @contextmanager
+    def bindings(self, module: str) -> Iterator[dict[str, str]]:
+        """
+        Loads the stored names of a module, and stores the ones added to them once the block is done. Other builds
+        wait until then, so the names they generate don't race with the ones generated in the block. If the block
+        raises, nothing is stored
+        :param module: The module
+        :return: A context manager, giving key : name pairs. Add the new names to it
+        """
+        con = self._connect()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            known = dict(con.execute("SELECT key, name FROM mappings WHERE module = ?", (module,)))
+            stored = set(known.keys())
+            yield known
+            con.executemany(
+                "INSERT INTO mappings VALUES (?, ?, ?)",
+                [(module, k, v) for (k, v) in known.items() if k not in stored],
+            )
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
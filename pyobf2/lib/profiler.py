@@ -0,0 +1,156 @@
+import ast
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable
+
+
+def count_nodes(node: ast.AST) -> int:
+    """
+    Counts the nodes in an AST
+    :param node: The root node
+    :return: The amount of nodes in the tree, including the root
+    """
+    return sum(1 for _ in ast.walk(node))
+
+
+class Profiler:
+    """
+    Records how long each step of an obfuscation run takes, and how much memory it needs. Steps are recorded as
+    spans with the wall time, the CPU time of the thread running them and the tracemalloc peak while they ran.
+    The spans can be written as Chrome trace events (chrome://tracing, https://ui.perfetto.dev), or summarized per step.
+    Spans recorded in other processes (see run_profiled) can be merged in with add_events.
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.events: list[dict[str, Any]] = []
+        self._peak_stack: list[int] = []
+        self._started_tracing = False
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args: Any):
+        """
+        Records a span around the body of the with statement
+        :param name: The name of the step, for example the transformer name
+        :param cat: The category of the step, for example "transform" or "write"
+        :param args: Additional information to attach to the span
+        :return: The args of the span. They can still be amended after the span ended, to add information
+        that shouldn't be measured as part of it (for example, node counts)
+        """
+        tracing = tracemalloc.is_tracing()
+        mem_before = 0
+        if tracing:
+            mem_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._peak_stack.append(0)
+        wall_before = time.perf_counter_ns()
+        cpu_before = time.thread_time_ns()
+        try:
+            yield args
+        finally:
+            cpu = time.thread_time_ns() - cpu_before
+            wall = time.perf_counter_ns() - wall_before
+            # resetting the peak for this span cleared the one of the enclosing span, so hand ours up to it
+            peak = self._peak_stack.pop()
+            if tracing:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if len(self._peak_stack) > 0:
+                    self._peak_stack[-1] = max(self._peak_stack[-1], peak)
+            args["cpu_ms"] = cpu / 1e6
+            if tracing:
+                args["peak_kib"] = max(0, peak - mem_before) / 1024
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": cat,
+                    "ph": "X",
+                    "ts": wall_before / 1000,
+                    "dur": wall / 1000,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": args,
+                }
+            )
+
+    def add_events(self, events: list[dict[str, Any]]):
+        self.events.extend(events)
+
+    def write_chrome_trace(self, path: str):
+        """
+        Writes the recorded spans as a Chrome trace event file
+        :param path: The file to write to
+        :return: Nothing
+        """
+        with open(path, "w", encoding="utf8") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self) -> list[dict[str, Any]]:
+        """
+        Sums up the recorded spans per step
+        :return: One entry per (cat, name), in order of first appearance: the amount of spans, the total wall time and
+        CPU time in ms, the highest memory peak in KiB, and the total node counts before and after, if recorded
+        """
+        rows = {}
+        for x in self.events:
+            k = (x["cat"], x["name"])
+            if k not in rows:
+                rows[k] = {
+                    "cat": x["cat"],
+                    "name": x["name"],
+                    "count": 0,
+                    "wall_ms": 0.0,
+                    "cpu_ms": 0.0,
+                    "peak_kib": None,
+                    "nodes_before": None,
+                    "nodes_after": None,
+                }
+            row = rows[k]
+            args = x["args"]
+            row["count"] += 1
+            row["wall_ms"] += x["dur"] / 1000
+            row["cpu_ms"] += args.get("cpu_ms", 0)
+            if "peak_kib" in args:
+                row["peak_kib"] = max(row["peak_kib"] or 0, args["peak_kib"])
+            for n in ["nodes_before", "nodes_after"]:
+                if n in args:
+                    row[n] = (row[n] or 0) + args[n]
+        return list(rows.values())
+
+
+def profile_span(profiler: Profiler | None, name: str, cat: str, **args: Any):
+    """
+    Profiler.span, or a no-op if profiler is None
+    """
+    if profiler is None:
+        return nullcontext(args)
+    return profiler.span(name, cat, **args)
+
+
+def run_profiled(trace_memory: bool, fn: Callable, *args: Any) -> tuple[Any, list[dict[str, Any]]]:
+    """
+    Calls fn(*args, profiler=<a new profiler>). Meant to be submitted to worker processes, to profile what they do
+    :param trace_memory: Whether to trace memory in the new profiler
+    :param fn: The function to call
+    :param args: The arguments to pass
+    :return: The result of fn, and the spans it recorded
+    """
+    profiler = Profiler(trace_memory)
+    profiler.start()
+    try:
+        return fn(*args, profiler=profiler), profiler.events
+    finally:
+        profiler.stop()
@@ -0,0 +1,224 @@
+import importlib
+from typing import Any
+
+from .cfg import ConfigSegment, ConfigValue
+
+
+class TransformerInfo:
+    """
+    Everything known about a built-in transformer without importing its implementation: its name, its configuration,
+    and where it is implemented
+    """
+
+    def __init__(
+        self, name: str, desc: str, module: str, class_name: str, default_enabled: bool = False, **add_config: ConfigValue
+    ):
+        """
+        :param name: The name of the transformer, and of its config segment
+        :param desc: The description of the transformer
+        :param module: The module implementing it, relative to pyobf2.lib.transformers
+        :param class_name: The name of the class implementing it
+        :param default_enabled: Whether the transformer is enabled by default
+        :param add_config: Additional config values, besides enabled
+        """
+        self.name = name
+        self.module = module
+        self.class_name = class_name
+        self.config = ConfigSegment(
+            name, desc, enabled=ConfigValue("Enables this transformer", default_enabled), **add_config
+        )
+
+
+class LazyTransformer:
+    """
+    Stands in for a built-in transformer in all_transformers. The name and config are available right away, the
+    implementation is imported and created the first time anything else is needed, and everything else is
+    forwarded to it
+    """
+
+    def __init__(self, info: TransformerInfo):
+        self.info = info
+        self.name = info.name
+        self.config = info.config
+        self._instance = None
+
+    @property
+    def instance(self):
+        """
+        The transformer, imported and created if this is the first time it's needed
+        """
+        if self._instance is None:
+            module = importlib.import_module("." + self.info.module, "pyobf2.lib.transformers")
+            self._instance = getattr(module, self.info.class_name)()
+        return self._instance
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, item: str) -> Any:
+        if item.startswith("__") or item in ("info", "_instance"):  # not forwarded, see copy and pickle
+            raise AttributeError(item)
+        return getattr(self.instance, item)
+
+    def __repr__(self):
+        return f"LazyTransformer({self.name!r}, loaded={self.loaded})"
+
+
+transformer_infos = [
+    TransformerInfo(
+        "logicTransformer",
+        "Transforms boolean logic into confusing, but equally valid statements",
+        "logicTransformer",
+        "LogicTransformer",
+    ),
+    TransformerInfo("removeTypeHints", "Removes type hints", "removeTypeHintsTransformer", "RemoveTypeHints"),
+    TransformerInfo(
+        "fstrToFormatSeq",
+        "Converts F-Strings to their str.format equivalent",
+        "fstrToFormatTransformer",
+        "FstringsToFormatSequence",
+    ),
+    TransformerInfo(
+        "encodeStrings",
+        "Encodes strings to make them harder to read",
+        "encodeStringsTransformer",
+        "EncodeStrings",
+        mode=ConfigValue(
+            "How to transform the strings\n"
+            "Mode chararray is best used with the intObfuscator transformer\n"
+            "Available modes: b64lzma, chararray, xortable",
+            "b64lzma",
+        ),
+        decode_once=ConfigValue(
+            "Decodes each string once, when the module is imported, and looks it up in a table afterwards, instead "
+            "of decoding it every time it's used. Use this for strings in hot code",
+            False,
+        ),
+    ),
+    TransformerInfo(
+        "stringCollector",
+        "Collects all strings into a list",
+        "stringCollectorTransformer",
+        "StringCollectorTransformer",
+        sample_size=ConfigValue("How many characters to store in a string element. -1 is off", -1),
+        max_samples=ConfigValue("How many samples to have, at max", 512),
+    ),
+    TransformerInfo(
+        "floatsToComplex",
+        "Converts floats to a representation of them on the complex number plane, "
+        "then converts them back at runtime\n"
+        "Warning: float precision might change some numbers in ways you don't want, please open a bug report "
+        "if you find such a case",
+        "floatsToComplex",
+        "FloatsToComplex",
+    ),
+    TransformerInfo(
+        "intObfuscator",
+        "Obscures int constants",
+        "intObfuscatorTransformer",
+        "IntObfuscator",
+        mode=ConfigValue("How to obfuscate int constants\nPossible values: bits, complement, decode", "bits"),
+    ),
+    TransformerInfo(
+        "renamer",
+        "Renames all members (methods, classes, fields, args)",
+        "memberRenamerTransformer",
+        "MemberRenamer",
+        rename_format=ConfigValue(
+            "Format for the renamer. Will be queried using eval().\n"
+            "'counter' is a variable incrementing with each name generated\n"
+            "'kind' is either 'method', 'var', 'arg' or 'class', depending on the current element\n"
+            "'get_counter(name)' is a method that increments a counter behind 'name', and returns its current "
+            "value\n"
+            "'random_identifier(length)' returns a valid python identifier, according to "
+            "https://docs.python.org/3/reference/lexical_analysis.html#identifiers\n"
+            "'short' isn't evaluated, and gives the most used names the shortest identifiers instead, like a minifier",
+            "f'{kind}{get_counter(kind)}'",
+        ),
+        mapping_store=ConfigValue(
+            "A file to keep the generated names in between runs. Names that are already in it are reused, only new "
+            "names are generated. Empty to generate all names again each run",
+            "",
+        ),
+        project_root=ConfigValue(
+            "The directory modules are identified relative to in the mapping store. Empty for the directory of the "
+            "input file when run from the CLI, and the current directory otherwise",
+            "",
+        ),
+    ),
+    TransformerInfo(
+        "typeAliasTransformer",
+        "Adds alias classes to certain classes to obfuscate their original meaning",
+        "typeAliasTransformer",
+        "TypeAliasTransformer",
+        classes_to_alias=ConfigValue(
+            "Classes to create aliases for",
+            [
+                "str",
+                "int",
+                "float",
+                "filter",
+                "bytes",
+                "map",
+            ],
+        ),
+    ),
+    TransformerInfo(
+        "replaceAttribSet",
+        "Replaces direct attribute sets with setattr",
+        "replaceAttribsTransformer",
+        "ReplaceAttribs",
+    ),
+    TransformerInfo(
+        "dynamicCodeObjLauncher",
+        "Launches the program by constructing it from the ground up with dynamic code objects. This REQUIRES "
+        "PYTHON 3.11",
+        "constructDynamicCodeObjTransformer",
+        "ConstructDynamicCodeObject",
+    ),
+    TransformerInfo(
+        "varCollector",
+        "Converts var access to a hidden eval()",
+        "collector",
+        "Collector",
+        cache_size=ConfigValue(
+            "How many compiled expressions to keep per module at runtime, so they don't have to be decompressed and "
+            "compiled again. The least recently used ones are dropped first",
+            256,
+        ),
+    ),
+    TransformerInfo(
+        "unicodeTransformer",
+        "Converts names to equally valid, but weird looking unicode names\n"
+        "Does not work with compileFinalFiles, has to be source code",
+        "unicodeNameTransformer",
+        "UnicodeNameTransformer",
+    ),
+    TransformerInfo(
+        "compileFinalFiles", "Compiles all output files to .pyc", "compileFinalFiles", "CompileFinalFiles"
+    ),
+    TransformerInfo(
+        "packInPyz",
+        'Packs all of the scripts into a .pyz file, creating an one file "executable". '
+        "Specifically effective when used with multiple input files",
+        "packPyz",
+        "PackInPyz",
+        bootstrap_file=ConfigValue(
+            "The file to start when the .pyz is started. File will be renamed to __main__.py inside the .pyz",
+            "__main__.py",
+        ),
+        encrypt=ConfigValue("Encrypts all contents of the .pyz using a random RSA256 key", True),
+    ),
+]
+
+
+def get_transformer_info(name: str) -> TransformerInfo:
+    """
+    :param name: The name of a built-in transformer
+    :return: Its TransformerInfo
+    """
+    for x in transformer_infos:
+        if x.name == name:
+            return x
+    raise KeyError(name)
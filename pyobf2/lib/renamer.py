@@ -1,7 +1,11 @@
+import builtins
+import itertools
 import random
 import string
 from ast import *
-from typing import Any
+from bisect import bisect
+from keyword import kwlist, softkwlist
+from typing import Any, Callable
 
 
 def random_identifier(length: int):
@@ -15,33 +19,116 @@ def random_identifier(length: int):
     return built
 
 
+# Rename formats that are common enough to have a native implementation, which gives the same names without eval
+_NATIVE_FORMATS: dict[str, Callable[["MappingGenerator", str], str]] = {
+    "f'{kind}{get_counter(kind)}'": lambda g, kind: f"{kind}{g.counter_shit(kind)}",
+    'f"{kind}{get_counter(kind)}"': lambda g, kind: f"{kind}{g.counter_shit(kind)}",
+    'f"{kind[0]}{get_counter(kind)}"': lambda g, kind: f"{kind[0]}{g.counter_shit(kind)}",
+}
+
+
+def _short_identifiers():
+    """
+    :return: Every identifier, shortest first
+    """
+    first = string.ascii_letters + "_"
+    rest = first + string.digits
+    for length in itertools.count(1):
+        for head in first:
+            for tail in itertools.product(rest, repeat=length - 1):
+                yield head + "".join(tail)
+
+
+def _identifiers_in(s: AST) -> set[str]:
+    """
+    :return: Every name that appears in a tree, and every name that can't be used as one
+    """
+    names = {*kwlist, *softkwlist, *dir(builtins)}
+    for node in walk(s):
+        if isinstance(node, Name):
+            names.add(node.id)
+        elif isinstance(node, Attribute):
+            names.add(node.attr)
+        elif isinstance(node, (FunctionDef, AsyncFunctionDef, ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (arg, keyword)) and node.arg is not None:
+            names.add(node.arg)
+        elif isinstance(node, alias):
+            names.update(node.name.split("."))
+            if node.asname is not None:
+                names.add(node.asname)
+        elif isinstance(node, (Global, Nonlocal)):
+            names.update(node.names)
+    return names
+
+
+class ScopeTable:
+    """
+    Mappings indexed by scope. Each scope (the module, a function, a class, ...) is a node in a tree, reached from the
+    module through the location stack of the scope, and maps the names bound in it to their new names.
+    A name resolves to the mapping of the innermost enclosing scope that has one, which only takes a dict lookup per
+    level of the location stack.
+    """
+
+    __slots__ = ("names", "children")
+
+    def __init__(self):
+        self.names: dict[str, str] = {}
+        self.children: dict[str, ScopeTable] = {}
+
+    @staticmethod
+    def from_mappings(mappings: dict[str, str]) -> "ScopeTable":
+        """
+        :param mappings: Mappings as in MappingGenerator.mappings ("loc|loc.name": new name)
+        :return: The mappings, as a scope table
+        """
+        table = ScopeTable()
+        for k, v in mappings.items():
+            loc, name = k.split(".")[:2]
+            table.put_if_absent(loc.split("|") if loc != "" else [], name, v)
+        return table
+
+    def put_if_absent(self, location: list[str], old: str, new: str):
+        """
+        Maps a name in a scope, if it isn't mapped in that scope already
+        :param location: The location stack of the scope
+        :param old: The old name
+        :param new: The new name
+        :return: Nothing
+        """
+        scope = self
+        for x in location:
+            child = scope.children.get(x)
+            if child is None:
+                child = scope.children[x] = ScopeTable()
+            scope = child
+        if old not in scope.names:
+            scope.names[old] = new
+
+    def lookup(self, location: list[str], old):
+        """
+        Finds the new name of a name, as seen from a scope
+        :param location: The location stack of the scope the name is used in
+        :param old: The name
+        :return: The new name, from the innermost scope (of location and its parents) mapping old, or old if none does
+        """
+        found = self.names.get(old, old)
+        scope = self
+        for x in location:
+            scope = scope.children.get(x)
+            if scope is None:
+                break
+            found = scope.names.get(old, found)
+        return found
+
+
 class MappingGenerator(NodeVisitor):
     """
     A generator for mappings
     """
 
     def remap_name_if_needed(self, old):
-        sorted_names = list(self.mappings.keys())
-        # Sort by longest (most specific) path first
-        sorted_names.sort(key=lambda v: grade_name_order(v.split(".")[0]), reverse=True)
-        for x in sorted_names:
-            s_loc = x.split(".")[0]
-            location_split = s_loc.split("|")
-            if len(location_split) == 1 and location_split[0] == "":
-                location_split = []
-            loc_matches = True
-            if len(self.location_stack) >= len(location_split):
-                for i in range(len(location_split)):
-                    current_loc_pos = self.location_stack[i]
-                    existing_loc_pos = location_split[i]
-                    if current_loc_pos != existing_loc_pos:
-                        loc_matches = False
-                        break
-            else:
-                loc_matches = False
-            if loc_matches and x.split(".")[1] == old:
-                return self.mappings[x]
-        return old
+        return self.scopes.lookup(self.location_stack, old)
 
     def counter_shit(self, name: str):
         if name not in self.counters:
@@ -51,27 +138,82 @@ class MappingGenerator(NodeVisitor):
         return self.counters[name]
 
     def mapping_name(self, for_type: str):
-        fmt = self.fmt
-        generated_name = eval(
-            fmt,
-            {
-                "counter": self.counter_shit("cnt"),
-                "kind": for_type,
-                "get_counter": self.counter_shit,
-                "random_identifier": random_identifier,
-            },
-        )
-        if type(generated_name) != str:
-            generated_name = str(generated_name)
+        generated_name = self._generate_name(for_type)
+        attempts = 1
+        while generated_name in self.reserved:  # taken by a known binding
+            if attempts == 1000:
+                raise ValueError(f"rename format {self.fmt!r} doesn't generate names that aren't taken")
+            generated_name = self._generate_name(for_type)
+            attempts += 1
         return generated_name
 
-    def __init__(self, fmt):
+    def _compile_format(self, fmt: str) -> Callable[[str], str]:
+        """
+        Turns the rename format into a function generating a name for a kind, evaluating the format at most once per
+        name, instead of parsing it every time
+        """
+        if fmt == "short":  # placeholders, replaced by the shortest names in _assign_short_names
+            return lambda kind: self._placeholder()
+        if fmt in _NATIVE_FORMATS:
+            native = _NATIVE_FORMATS[fmt]
+            return lambda kind: native(self, kind)
+        code = compile(fmt, "<rename_format>", "eval")
+        env = {"get_counter": self.counter_shit, "random_identifier": random_identifier}
+
+        def generate(kind: str) -> str:
+            env["counter"] = self.counter_shit("cnt")
+            env["kind"] = kind
+            generated_name = eval(code, env)
+            if type(generated_name) != str:
+                generated_name = str(generated_name)
+            return generated_name
+
+        return generate
+
+    def _placeholder(self) -> str:
+        # not an identifier, so it can't clash with any name in the source
+        name = f"\x00{len(self.placeholders)}"
+        self.placeholders.append(name)
+        return name
+
+    def _assign_short_names(self, s: AST):
+        """
+        Replaces the placeholders of the "short" rename format. The names that are referenced the most get the shortest
+        identifiers that don't appear in the module already
+        """
+        counter = _ReferenceCounter(self.mappings)
+        counter.visit(s)
+        used = set(self.mappings.values())  # a name is generated for every binding, even if it was mapped already
+        ranked = [x for x in self.placeholders if x in used]
+        ranked.sort(key=lambda x: -counter.counts.get(x, 0))  # stable, ties by definition order
+        taken = _identifiers_in(s) | self.reserved
+        names = (x for x in _short_identifiers() if x not in taken)
+        final = {x: next(names) for x in ranked}
+        self.mappings = {k: final.get(v, v) for (k, v) in self.mappings.items()}
+        self.scopes = ScopeTable.from_mappings(self.mappings)
+        for node in walk(s):  # visit_Global already put placeholders in here
+            if isinstance(node, Global):
+                node.names = [final.get(x, x) for x in node.names]
+
+    def __init__(self, fmt, known: dict[str, str] | None = None):
+        """
+        :param fmt: The rename format
+        :param known: Mappings generated earlier (see MappingStore). Bindings in there keep their name, and new ones
+        don't get any of the names in there
+        """
         self.skip_args = False
         self.fmt = fmt
         self.counters = {}
+        # "loc|loc.name": new name, in the order they were generated
         self.mappings = {}
+        # the same mappings, indexed for lookups
+        self.scopes = ScopeTable()
         self.location_stack = []
         self.tabu_method_arguments = []
+        self.known = known if known is not None else {}
+        self.reserved = set(self.known.values())
+        self.placeholders = []
+        self._generate_name = self._compile_format(fmt)
 
     def go(self, s: AST):
         for node in walk(s):
@@ -85,6 +227,8 @@ class MappingGenerator(NodeVisitor):
                     # equally suboptimal fix: just don't remap that specific method's parameters :/
                     self.tabu_method_arguments.append(node.func.id)
         self.visit(s)
+        if len(self.placeholders) > 0:
+            self._assign_short_names(s)
 
     def visit_Global(self, node: Global) -> Any:
         for i in range(len(node.names)):
@@ -98,6 +242,7 @@ class MappingGenerator(NodeVisitor):
                 # this is straight up evil coding practise but some fucked up people do it so it has to be supported
                 remapped_name = self.mapping_name("var")
                 self.put_name_at_module_level(x, remapped_name)
+                remapped_name = self.mappings[f".{x}"]  # might be a known one
                 self.put_name_if_absent(x, remapped_name)
                 node.names[i] = remapped_name
 
@@ -123,7 +268,9 @@ class MappingGenerator(NodeVisitor):
     def put_name_at_module_level(self, old, new):
         full = f".{old}"
         if full not in self.mappings:
+            new = self.known.get(full, new)
             self.mappings[full] = new
+            self.scopes.put_if_absent([], old, new)
 
     def put_name_if_absent(self, old, new):
         """
@@ -137,7 +284,9 @@ class MappingGenerator(NodeVisitor):
         loc = "|".join(self.location_stack)
         full = f"{loc}.{old}"
         if full not in self.mappings:
+            new = self.known.get(full, new)
             self.mappings[full] = new
+            self.scopes.put_if_absent(self.location_stack, old, new)
 
     def start_visit(self, name):
         self.location_stack.append(name)
@@ -206,12 +355,6 @@ class MappingGenerator(NodeVisitor):
         self.generic_visit(node)
 
 
-def grade_name_order(name: str):
-    if len(name) == 0:
-        return 0
-    return len(name.split("|")) + 1
-
-
 class OtherFileMappingApplicator(NodeVisitor):
     def __init__(self, mappings: dict[str, str], owning_module_names: list[str], all_els_in_other_file: list[str]):
         self.mappings = mappings
@@ -301,6 +444,10 @@ class OtherFileMappingApplicator(NodeVisitor):
             node.attr = built_attribute.attr
 
     def visit_Assign(self, node: Assign) -> Any:
+        self._track_assign(node)
+        self.generic_visit(node)
+
+    def _track_assign(self, node: Assign):
         """
         jesus fucking christ
         """
@@ -340,12 +487,71 @@ class OtherFileMappingApplicator(NodeVisitor):
                     continue
                 if name2 in self.names_containing_module:
                     self.names_containing_module.remove(name2)
+
+    def visit_sites(self, sites: "ReferenceSites"):
+        """
+        Does the same as visiting the file the sites were collected from, but only looks at the nodes that matter.
+        Attributes only ever change if the name they start with refers to the module, so the others are skipped
+        :param sites: The sites of the file
+        :return: Nothing
+        """
+        states = [(-1, [])]  # position : names referring to the module from there on
+        for position, node in sites.statements:
+            if isinstance(node, ImportFrom):
+                self.visit_ImportFrom(node)
+            elif isinstance(node, Import):
+                self.visit_Import(node)
+            else:
+                self._track_assign(node)
+            if self.names_containing_module != states[-1][1]:
+                states.append((position, list(self.names_containing_module)))
+        positions = [x[0] for x in states]
+        for root in {n.split(".")[0] for (_, names) in states for n in names}:
+            for position, node in sites.attributes.get(root, ()):
+                self.names_containing_module = states[bisect(positions, position) - 1][1]
+                self.visit_Attribute(node)
+
+
+class ReferenceSites(NodeVisitor):
+    """
+    The nodes of a file OtherFileMappingApplicator acts on, in the order it visits them: imports and assignments, and
+    attributes, grouped by the name they start with. See OtherFileMappingApplicator.visit_sites.
+    The sites stay valid as long as the names in the file aren't renamed, renaming imported names in it is fine
+    """
+
+    def __init__(self, tree: AST):
+        self.statements: list[tuple[int, AST]] = []
+        self.attributes: dict[str, list[tuple[int, Attribute]]] = {}
+        self._position = 0
+        self.visit(tree)
+
+    def _next_position(self) -> int:
+        self._position += 1
+        return self._position
+
+    def visit_ImportFrom(self, node: ImportFrom) -> Any:
+        self.statements.append((self._next_position(), node))
+
+    def visit_Import(self, node: Import) -> Any:
+        self.statements.append((self._next_position(), node))
+
+    def visit_Assign(self, node: Assign) -> Any:
+        self.statements.append((self._next_position(), node))
         self.generic_visit(node)
 
+    def visit_Attribute(self, node: Attribute) -> Any:
+        # not visiting the value, like OtherFileMappingApplicator
+        root = node.value
+        while isinstance(root, Attribute):
+            root = root.value
+        if isinstance(root, Name):
+            self.attributes.setdefault(root.id, []).append((self._next_position(), node))
+
 
 class MappingApplicator(NodeVisitor):
     def __init__(self, mappings):
         self.mappings = mappings
+        self.scopes = ScopeTable.from_mappings(mappings)
         self.location_stack = []
 
     def visit_Import(self, node: Import) -> Any:
@@ -361,27 +567,7 @@ class MappingApplicator(NodeVisitor):
     def remap_name_if_needed(self, old, loc_stack=None):
         if loc_stack is None:
             loc_stack = self.location_stack
-        sorted_names = list(self.mappings.keys())
-        # Sort by longest (most specific) path first
-        sorted_names.sort(key=lambda v: grade_name_order(v.split(".")[0]), reverse=True)
-        for x in sorted_names:
-            s_loc = x.split(".")[0]
-            location_split = s_loc.split("|")
-            if len(location_split) == 1 and location_split[0] == "":
-                location_split = []
-            loc_matches = True
-            if len(loc_stack) >= len(location_split):
-                for i in range(len(location_split)):
-                    current_loc_pos = loc_stack[i]
-                    existing_loc_pos = location_split[i]
-                    if current_loc_pos != existing_loc_pos:
-                        loc_matches = False
-                        break
-            else:
-                loc_matches = False
-            if loc_matches and x.split(".")[1] == old:
-                return self.mappings[x]
-        return old
+        return self.scopes.lookup(loc_stack, old)
 
     def start_visit(self, name):
         self.location_stack.append(name)
@@ -438,3 +624,19 @@ class MappingApplicator(NodeVisitor):
     def visit_Name(self, node: Name) -> Any:
         node.id = self.remap_name_if_needed(node.id)
         self.generic_visit(node)
+
+
+class _ReferenceCounter(MappingApplicator):
+    """
+    Counts how often each new name would be used, without renaming anything
+    """
+
+    def __init__(self, mappings):
+        super().__init__(mappings)
+        self.counts: dict[str, int] = {}
+
+    def remap_name_if_needed(self, old, loc_stack=None):
+        new = super().remap_name_if_needed(old, loc_stack)
+        if new is not old:
+            self.counts[new] = self.counts.get(new, 0) + 1
+        return old
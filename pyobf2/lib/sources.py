@@ -0,0 +1,80 @@
+import os
+from ast import AST, parse
+
+
+class _Entry:
+    __slots__ = ("signature", "source", "tree")
+
+    def __init__(self, signature: tuple[int, int], source: str):
+        self.signature = signature
+        self.source = source
+        self.tree: AST | None = None
+
+
+class SourceCache:
+    """
+    Reads and parses each source file once, for everything that needs it during a run: the dependency crawler, the
+    build cache and the obfuscation itself. Entries are keyed by path, and are only valid as long as the stat
+    signature (mtime and size) of the file stays the same. A file that changed on disk is read again.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, _Entry] = {}
+
+    @staticmethod
+    def signature(path: str) -> tuple[int, int]:
+        """
+        :param path: The file
+        :return: The modification time (in ns) and size of the file
+        """
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def _entry(self, path: str) -> _Entry:
+        sig = self.signature(path)
+        entry = self._entries.get(path)
+        if entry is None or entry.signature != sig:
+            with open(path, "r", encoding="utf8") as f:
+                entry = _Entry(sig, f.read())
+            self._entries[path] = entry
+        return entry
+
+    def source(self, path: str) -> str:
+        """
+        :param path: The file
+        :return: The source of the file
+        """
+        return self._entry(path).source
+
+    def ast(self, path: str) -> AST:
+        """
+        Gets the parsed source of a file. The AST is shared with every other caller, and must not be modified. Use
+        take_ast to get one that can be
+        :param path: The file
+        :return: The parsed source
+        """
+        entry = self._entry(path)
+        if entry.tree is None:
+            entry.tree = parse(entry.source, path)
+        return entry.tree
+
+    def take_ast(self, path: str) -> AST:
+        """
+        Gets a pristine parsed source of a file, which the caller owns and may modify (for example, by obfuscating
+        it). If the file was already parsed, that AST is handed over and forgotten, so a file is only parsed once if
+        it is only taken once. Otherwise, it is parsed from the cached source
+        :param path: The file
+        :return: The parsed source
+        """
+        entry = self._entry(path)
+        tree = entry.tree
+        entry.tree = None
+        return tree if tree is not None else parse(entry.source, path)
+
+    def forget(self, path: str):
+        """
+        Drops the cached source and AST of a file
+        :param path: The file
+        :return: Nothing
+        """
+        self._entries.pop(path, None)
@@ -1,27 +1,261 @@
 import ast
+import contextlib
+import contextvars
 import os.path
 import pathlib
 import random
 from ast import *
+from typing import Any, Callable
 
 from ..cfg import ConfigSegment, ConfigValue
+from ..registry import get_transformer_info
 from ..renamer import MappingGenerator, MappingApplicator
 
 
+class FileContext:
+    """
+    The state a transformer keeps while transforming one file. Transformer instances are shared by every file they
+    transform, so anything that only makes sense for one file belongs in here, not on the transformer.
+    Transformers that need more than the file name subclass this, and override Transformer.new_context
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.prelude = Prelude()
+
+
+# transformer : the context of the file it is currently transforming, see Transformer.file_context
+_file_contexts: contextvars.ContextVar[dict["Transformer", FileContext]] = contextvars.ContextVar(
+    "file_contexts", default={}
+)
+
+
+class Prelude:
+    """
+    Definitions added to the top of a module once, and used by everything a transformer generates in it, instead of
+    repeating the same expressions at every use: imported modules, and helper functions decoding generated
+    constants. Their names are random, like the other generated names.
+    Each FileContext has one. FusedNodeTransformer adds it to the module when the transformer's turn at the module comes,
+    so the transformers after it process it as well. Transformers with their own traversal add it at the end of
+    transform, using add_to
+    """
+
+    def __init__(self):
+        self.names: dict[str, str] = {}  # key : name
+        self.body: list[stmt] = []
+
+    def helper(self, key: str, create: Callable[[str], stmt]) -> Name:
+        """
+        :param key: Identifies the helper in the module
+        :param create: Creates the definition of the helper, given its name. Only called the first time the key is used
+        :return: A name referring to the helper
+        """
+        if key not in self.names:
+            self.names[key] = rnd_name()
+            self.body.append(create(self.names[key]))
+        return Name(self.names[key], Load())
+
+    def module(self, name: str) -> Name:
+        """
+        :param name: The name of a module
+        :return: A name referring to the module, imported once at the top of the module
+        """
+        return self.helper("import " + name, lambda x: Assign([Name(x, Store())], ast_import_full(name)))
+
+    def add_to(self, tree: AST):
+        """
+        Adds the definitions to the top of a module, after its docstring and __future__ imports
+        :param tree: The module. Anything else is left as it is
+        :return: Nothing
+        """
+        if isinstance(tree, Module) and len(self.body) > 0:
+            pos = module_header_length(tree)
+            tree.body[pos:pos] = self.body
+            self.body = []
+
+
 class Transformer(object):
-    def __init__(self, name: str, desc: str, default_enabled: bool = False, **add_config: ConfigValue):
+    # Whether this transformer needs to see (or modify) the ASTs of all files in a batch.
+    # Transformers that do are run in the main process, in parallel runs
+    requires_all_asts = False
+    # The node types this transformer rewrites. Transformers that declare some implement visit_<node type> for each
+    # of them, without descending into the children of the node (they are already transformed), and can share one
+    # traversal with other such transformers. See FusedNodeTransformer
+    node_types: tuple[type, ...] = ()
+    # The node types whose children this transformer doesn't touch
+    skip_children_of: tuple[type, ...] = ()
+    # The attributes this transformer deliberately shares between all files it transforms, besides its config.
+    # Everything else belongs in its FileContext
+    shared_state: tuple[str, ...] = ()
+
+    def __init__(self, name: str, desc: str | None = None, default_enabled: bool = False, **add_config: ConfigValue):
+        """
+        :param name: The name of the transformer
+        :param desc: The description of the transformer. None for built-in transformers, whose description and config
+        are declared in pyobf2.lib.registry, and shared with their LazyTransformer
+        :param default_enabled: Whether the transformer is enabled by default
+        :param add_config: Additional config values, besides enabled
+        """
         self.name = name
-        self.config = ConfigSegment(
-            self.name, desc, enabled=ConfigValue("Enables this transformer", default_enabled), **add_config
-        )
+        if desc is None:
+            self.config = get_transformer_info(name).config
+        else:
+            self.config = ConfigSegment(
+                self.name, desc, enabled=ConfigValue("Enables this transformer", default_enabled), **add_config
+            )
+
+    @property
+    def ctx(self) -> Any:
+        """
+        The context of the file currently being transformed, see file_context
+        """
+        return _file_contexts.get().get(self)
+
+    def new_context(self, current_file_name: str) -> FileContext:
+        return FileContext(current_file_name)
+
+    @contextlib.contextmanager
+    def file_context(self, current_file_name: str):
+        """
+        Creates a new FileContext using new_context, and makes it available as self.ctx while transforming one file.
+        The context is kept in a ContextVar, not on the transformer, so other threads using the same transformer
+        instance at the same time each see their own
+        :param current_file_name: The file about to be transformed
+        :return: The new context
+        """
+        ctx = self.new_context(current_file_name)
+        token = _file_contexts.set({**_file_contexts.get(), self: ctx})
+        try:
+            yield ctx
+        finally:
+            _file_contexts.reset(token)
 
     def transform_output(self, output_location: pathlib.Path, all_files: list[pathlib.Path]) -> list[pathlib.Path]:
         return all_files
 
     def transform(self, ast: AST, current_file_name, all_asts, all_file_names) -> AST:
+        if len(self.node_types) > 0:
+            with self.file_context(current_file_name) as ctx:
+                result = _NodeRules(self).visit(ast)
+                ctx.prelude.add_to(result)
+                return result
         return ast
 
 
+class _NodeRules(NodeTransformer):
+    """
+    Runs the node rules of a single transformer (see Transformer.node_types) with a plain NodeTransformer. Like in
+    FusedNodeTransformer, the children of a node are transformed before its rule is applied to it
+    """
+
+    def __init__(self, transformer: Transformer):
+        self.transformer = transformer
+        # node type : (its rule or None, whether to skip its children)
+        self._kinds: dict[type, tuple[Callable[[AST], Any] | None, bool]] = {}
+
+    def visit(self, node: AST) -> Any:
+        kind = self._kinds.get(node.__class__)
+        if kind is None:
+            rule = None
+            if isinstance(node, self.transformer.node_types):
+                rule = getattr(self.transformer, "visit_" + node.__class__.__name__)
+            kind = rule, isinstance(node, self.transformer.skip_children_of)
+            self._kinds[node.__class__] = kind
+        rule, skip_children = kind
+        if not skip_children:
+            self.generic_visit(node)
+        if rule is None:
+            return node
+        return rule(node)
+
+
+class FusedNodeTransformer:
+    """
+    Runs the node rules of multiple transformers (see Transformer.node_types) in a single traversal.
+    The tree is walked children first. At each node, the rules of the transformers are applied in order, each one
+    getting the result of the last one. Nodes created by a rule are only processed by the transformers after it.
+    This gives the same result as running the transformers one after the other, as long as each rule only depends on
+    the node it is given.
+    """
+
+    def __init__(self, transformers: list[Transformer], file_name: str):
+        self.transformers = transformers
+        self.file_name = file_name
+        self._done = {}
+
+    def visit(self, node: AST) -> Any:
+        self._done = {}
+        try:
+            with contextlib.ExitStack() as stack:
+                for x in self.transformers:
+                    stack.enter_context(x.file_context(self.file_name))
+                return self._visit(node, tuple(range(len(self.transformers))))
+        finally:
+            self._done = {}
+
+    def _visit_child(self, node: AST, active: tuple[int, ...]) -> Any:
+        if id(node) in self._done:  # already went through every transformer, a rule moved this into its result
+            return node
+        return self._visit(node, active)
+
+    def _visit(self, node: AST, active: tuple[int, ...]) -> Any:
+        child_active = tuple(i for i in active if not isinstance(node, self.transformers[i].skip_children_of))
+        for field, old_value in iter_fields(node):
+            if isinstance(old_value, list):
+                new_values = []
+                for value in old_value:
+                    if isinstance(value, AST):
+                        value = self._visit_child(value, child_active)
+                        if value is None:
+                            continue
+                        elif not isinstance(value, AST):
+                            new_values.extend(value)
+                            continue
+                    new_values.append(value)
+                old_value[:] = new_values
+            elif isinstance(old_value, AST):
+                new_node = self._visit_child(old_value, child_active)
+                if new_node is None:
+                    delattr(node, field)
+                else:
+                    setattr(node, field, new_node)
+        for i in range(len(active)):
+            transformer = self.transformers[active[i]]
+            rule = None
+            if isinstance(node, transformer.node_types):
+                rule = getattr(transformer, "visit_" + node.__class__.__name__)
+            elif not isinstance(node, Module) or len(transformer.ctx.prelude.body) == 0:
+                continue
+            rest = active[i + 1 :]
+            if len(rest) > 0:
+                # the rule can move the nodes below this one into its result, they must not be transformed again there
+                self._finish_children(node)
+            result = node if rule is None else rule(node)
+            if isinstance(node, Module):
+                # the transformer is done with the module, its prelude has to go through the transformers after it
+                transformer.ctx.prelude.add_to(result)
+            if len(rest) == 0:
+                return result
+            # whatever the rule created still has to go through the transformers after it
+            if result is None:
+                return None
+            elif isinstance(result, list):
+                return [self._visit_child(x, rest) for x in result]
+            return self._visit_child(result, rest)
+        return node
+
+    def _finish_children(self, node: AST):
+        """
+        Marks everything below a node as done, see _visit_child
+        """
+        work = list(iter_child_nodes(node))
+        while len(work) > 0:
+            x = work.pop()
+            if id(x) not in self._done:  # otherwise, everything below it is already marked as well
+                self._done[id(x)] = x
+                work.extend(iter_child_nodes(x))
+
+
 def compute_import_path(from_path: str, to_path: str):
     common_prefix = len(os.path.commonpath([os.path.dirname(from_path), os.path.dirname(to_path)]))
     from_path = from_path[common_prefix + 1 :].split(os.path.sep)
@@ -68,6 +302,20 @@ def optimize_ast(ast1: AST):
     return ast1
 
 
+def module_header_length(node: Module) -> int:
+    """
+    :return: How many statements at the start of the module have to stay there: its docstring, and __future__ imports
+    """
+    pos = 0
+    body = node.body
+    if len(body) > 0 and isinstance(body[0], Expr) and isinstance(body[0].value, Constant):
+        if isinstance(body[0].value.value, str):
+            pos = 1
+    while pos < len(body) and isinstance(body[pos], ImportFrom) and body[pos].module == "__future__":
+        pos += 1
+    return pos
+
+
 def clear_docstring(node):
     if not isinstance(node, (AsyncFunctionDef, FunctionDef, ClassDef, Module)):
         raise TypeError("%r can't have docstrings" % node.__class__.__name__)
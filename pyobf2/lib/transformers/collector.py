@@ -3,73 +3,126 @@ import inspect
 import marshal
 import textwrap
 import zlib
-from _ast import Name, Load, Subscript, Constant, Assign, Store, Call, Attribute, AST, Module
-from ast import NodeTransformer
+from _ast import Name, Load, Subscript, Constant, Assign, Store, Call, Attribute, Module
 from typing import Any
 
 from . import Transformer, rnd_name, optimize_ast, ast_import_full
 from ..assembler import Assembler
 
 
-class Collector(Transformer, NodeTransformer):
+class _InlineName(ast.NodeTransformer):
+    """
+    Replaces loads of a name with a constant
+    """
+
+    def __init__(self, name: str, value: Any):
+        self.name = name
+        self.value = value
+
+    def visit_Name(self, node: Name) -> Any:
+        if node.id == self.name and isinstance(node.ctx, Load):
+            return Constant(self.value)
+        return node
+
+
+class Collector(Transformer):
+    node_types = (Name, Module)
+    # the name of the loader variable is the same in every file
+    shared_state = ("vname",)
+
     def __init__(self):
         self.vname = rnd_name()
-        super().__init__("varCollector", "Converts var access to a hidden eval()")
+        super().__init__("varCollector")
 
     def visit_Name(self, node: Name) -> Any:
         if not type(node.ctx) == Load:  # we only want loads here, shit is getting too real
-            return self.generic_visit(node)
+            return node
         if node.id == "super":  # this will fuck with class context so lets skip this one
-            return self.generic_visit(node)
+            return node
         return Subscript(
             Name(self.vname, Load()), Constant(b"\x00" + zlib.compress(node.id.encode("utf8"), level=9)), Load()
         )
 
     @staticmethod
-    def _create_co_obj():
+    def _create_co_obj(cache_size: int):
         def getitem_method_real(_slf, item):
             """
             3 separate functions in one.
             If item starts with 0x00, item[1:] is decompressed with zlib and eval'd, the result is returned.
             If item starts with 0x01, item[1:] is decompressed with zlib and exec'd, the result is returned (usually None).
             Otherwise, item[1:] is decompressed with zlib and flipped, then returned
+            The builtins are looked up once, and the compiled expressions of the last cache_size items are kept.
+            Safe to call from multiple threads
             :param _slf: Self
             :param item: Expression to evaluate
             :return: Resulting value. See docstring
             """
-            import zlib as zlib1
-            import codecs as codecs1
-            import builtins as builtins1
-            import sys as sys1
-            from types import FrameType
+            state = _slf.__dict__
+            if len(state) == 0:  # first access in this module
+                import zlib as zlib1
+                import codecs as codecs1
+                import builtins as builtins1
+                import sys as sys1
+
+                class Scope(dict):
+                    # looks names up in the locals of several frames, innermost first, without copying them
+                    __slots__ = ("maps",)
+
+                    def __missing__(self, key):
+                        for m in self.maps:
+                            if key in m:
+                                return m[key]
+                        raise KeyError(key)
+
+                codecs = codecs1.lookup("rot13")
+                modes = (codecs.decode("riny")[0], codecs.decode("rkrp")[0])
+                # published at once, other threads see either nothing or everything
+                state.update(
+                    decompress=zlib1.decompress,
+                    getframe=sys1._getframe,
+                    compile=getattr(builtins1, codecs.decode("pbzcvyr")[0]),
+                    modes=modes,
+                    run=(getattr(builtins1, modes[0]), getattr(builtins1, modes[1])),
+                    compiled={},
+                    scope=Scope,
+                )
 
             expr_to_eval = item
-            codecs = codecs1.lookup("rot13")
-            frame_above: FrameType = sys1._getframe(1)
-            local_frames = {}
-            depth = 1
-            while True:
-                try:
-                    current_frame: FrameType = sys1._getframe(depth)
-                    local_frames = {**current_frame.f_locals, **local_frames}
-                    depth += 1
-                    if not current_frame.f_code.co_name.startswith("<"):  # this is beyond our search range, cancel
-                        break
-                except ValueError:  # we hit the bottom
+            kind = expr_to_eval[0]
+            if kind > 0x01:
+                return state["decompress"](expr_to_eval[1:])[::-1]
+            frame_above = state["getframe"](1)
+            # the locals of the caller, and of the frames it's nested in (comprehensions, lambdas, ...)
+            local_frames = []
+            current_frame = frame_above
+            while current_frame is not None:
+                local_frames.append(current_frame.f_locals)
+                if not current_frame.f_code.co_name.startswith("<"):  # this is beyond our search range, cancel
                     break
-            frame = {**frame_above.f_globals, **local_frames}
-            if expr_to_eval[0] == 0x00:
-                # eval encoded with rot13
-                return getattr(builtins1, codecs.decode("riny")[0])(zlib1.decompress(expr_to_eval[1:]), frame)
-            elif expr_to_eval[0] == 0x01:
-                # exec encoded with rot13
-                return getattr(builtins1, codecs.decode("rkrp")[0])(zlib1.decompress(expr_to_eval[1:]), frame)
-            else:
-                return zlib1.decompress(expr_to_eval[1:])[::-1]
+                current_frame = current_frame.f_back
+            if kind == 0x00 and len(local_frames) == 1:  # the common case. reading can't change them
+                frame = local_frames[0]
+            else:  # exec writes into the scope itself, not into any frame
+                frame = state["scope"]()
+                frame.maps = local_frames
+            # 0x00 is eval, 0x01 is exec. both encoded with rot13
+            compiled = state["compiled"]
+            code = compiled.pop(expr_to_eval, None)  # and put back, so it's the most recently used
+            if code is None:
+                code = state["compile"](state["decompress"](expr_to_eval[1:]), "", state["modes"][kind])
+            compiled[expr_to_eval] = code
+            if len(compiled) > cache_size:
+                # other threads might change the cache while we look for the oldest entry, or evict it first
+                try:
+                    compiled.pop(next(iter(compiled)), None)
+                except (RuntimeError, StopIteration):
+                    pass
+            return state["run"][kind](code, frame_above.f_globals, frame)
 
         gs = inspect.getsource(getitem_method_real.__code__)
         gs = textwrap.dedent(gs)
         getitem_ast = ast.parse(gs)
+        getitem_ast = ast.fix_missing_locations(_InlineName("cache_size", cache_size).visit(getitem_ast))
         getitem_ast = optimize_ast(getitem_ast)
         actual_co_obj = compile(getitem_ast, filename="", mode="exec", optimize=2)
         the_method = actual_co_obj.co_consts[
@@ -111,7 +164,7 @@ class Collector(Transformer, NodeTransformer):
         return main.pack_code_object()
 
     def create_loader(self):
-        co = self._create_co_obj()
+        co = self._create_co_obj(self.config["cache_size"].value)
         the_funny = marshal.dumps(co)
         return Assign(  # {vname} = eval(__import__("marshal").loads(the_funny))()
             [Name(self.vname, Store())],
@@ -126,8 +179,6 @@ class Collector(Transformer, NodeTransformer):
             ),
         )
 
-    def transform(self, ast: AST, current_file_name, all_asts, all_file_names) -> AST:
-        trafod_ast = self.visit(ast)
-        if isinstance(trafod_ast, Module):  # just to make pycharm shut up, this will always be true
-            trafod_ast.body.insert(0, self.create_loader())
-        return trafod_ast
+    def visit_Module(self, node: Module) -> Any:
+        node.body.insert(0, self.create_loader())
+        return node
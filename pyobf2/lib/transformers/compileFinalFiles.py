@@ -49,21 +49,35 @@ def _code_to_bytecode(code, compile_time=0, source_size=0):
     return data
 
 
+def compile_source(src: str | bytes) -> CodeType:
+    """
+    Compiles a source the way it ends up in the .pyc files: optimized, and without line number information
+    :param src: The source
+    :return: The code object
+    """
+    compiled: CodeType = compile(src, "", "exec", optimize=2)
+    return strip_lnotab(compiled)
+
+
+def code_to_pyc(code: CodeType) -> bytes:
+    """
+    Serializes a code object into the contents of a .pyc file
+    :param code: The code object
+    :return: The .pyc file contents
+    """
+    return bytes(_code_to_bytecode(marshal.dumps(code)))
+
+
 def do_compile(p_file: pathlib.Path):
     root_file = os.path.splitext(p_file)[0]
     with open(p_file, "rb") as f, open(root_file + ".pyc", "wb") as out:
-        src = f.read()
-        compiled: CodeType = compile(src, "", "exec", optimize=2)
-        compiled = strip_lnotab(compiled)
-        dumped = marshal.dumps(compiled)
-        bc_content = _code_to_bytecode(dumped)
-        out.write(bc_content)
+        out.write(code_to_pyc(compile_source(f.read())))
     p_file.unlink()
 
 
 class CompileFinalFiles(Transformer):
     def __init__(self):
-        super().__init__("compileFinalFiles", "Compiles all output files to .pyc")
+        super().__init__("compileFinalFiles")
 
     def transform_output(self, output_location: pathlib.Path, all_files: list[pathlib.Path]):
         all_f_copy = all_files[:]
@@ -28,11 +28,17 @@ from ast import fix_missing_locations
 from types import CodeType
 from typing import Any, Callable
 
-from . import Transformer, rnd_name
+from . import Transformer, FileContext, rnd_name
 from ..log import warn_simple
 from ..util import randomize_cache
 
 
+class _DynamicCodeObjectContext(FileContext):
+    def __init__(self, file_name: str):
+        super().__init__(file_name)
+        self.code_obj_dict = dict()  # code object : name of the function creating it
+
+
 class ConstructDynamicCodeObject(Transformer):
     _ctype_arg_names = [
         "co_argcount",
@@ -56,12 +62,10 @@ class ConstructDynamicCodeObject(Transformer):
     ]
 
     def __init__(self):
-        self.code_obj_dict = dict()
-        super().__init__(
-            "dynamicCodeObjLauncher",
-            "Launches the program by constructing it from the ground up with dynamic code objects. This REQUIRES "
-            "PYTHON 3.11",
-        )
+        super().__init__("dynamicCodeObjLauncher")
+
+    def new_context(self, current_file_name: str) -> _DynamicCodeObjectContext:
+        return _DynamicCodeObjectContext(current_file_name)
 
     def get_all_code_objects(self, args):
         all_cos = []
@@ -82,8 +86,8 @@ class ConstructDynamicCodeObject(Transformer):
         elif isinstance(el, list):
             return List(elts=[self._parse_const(x, ctx) for x in el], ctx=ctx)
         elif isinstance(el, CodeType):
-            if el in self.code_obj_dict:  # we have a generator for this, use it
-                return Call(func=Name(self.code_obj_dict[el], Load()), args=[], keywords=[])
+            if el in self.ctx.code_obj_dict:  # we have a generator for this, use it
+                return Call(func=Name(self.ctx.code_obj_dict[el], Load()), args=[], keywords=[])
             else:  # we dont have a generator? alright then, just marshal it
                 b = marshal.dumps(el)
                 return Call(
@@ -178,12 +182,14 @@ class ConstructDynamicCodeObject(Transformer):
         all_code_objs = self.get_all_code_objects(self.args_from_co(compiled_code_obj))
 
         loaders = []
-        for x in all_code_objs:  # create names first...
-            name = rnd_name()
-            self.code_obj_dict[x] = name
-        for x in all_code_objs:  # ... then use them
-            loaders.append(self.create_code_obj_loader(self.code_obj_dict[x], x))
-        main = rnd_name()
+        with self.file_context(current_file_name) as ctx:
+            for x in all_code_objs:  # create names first...
+                name = rnd_name()
+                ctx.code_obj_dict[x] = name
+            for x in all_code_objs:  # ... then use them
+                loaders.append(self.create_code_obj_loader(ctx.code_obj_dict[x], x))
+            main = rnd_name()
+            main_loader = self.create_code_obj_loader(main, compiled_code_obj)
         return Module(
             type_ignores=[],
             body=[
@@ -194,7 +200,7 @@ class ConstructDynamicCodeObject(Transformer):
                     decorator_list=[],
                 ),
                 *loaders,
-                self.create_code_obj_loader(main, compiled_code_obj),
+                main_loader,
                 Expr(
                     Call(
                         func=Name("exec", Load()),
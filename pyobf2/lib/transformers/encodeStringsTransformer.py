@@ -5,146 +5,197 @@ from _ast import *
 from ast import NodeTransformer
 from typing import Any
 
-from . import Transformer, ast_import_full
-from ..cfg import ConfigValue
-from ..log import warn
+from . import Transformer, FileContext, module_header_length, rnd_name
 
 
-class EncodeStrings(Transformer, NodeTransformer):
-    def __init__(self):
+def _int_from_bytes(value: expr) -> Call:
+    return Call(
+        func=Attribute(value=Name("int", Load()), attr="from_bytes", ctx=Load()),
+        args=[value, Constant("big")],
+        keywords=[],
+    )
+
+
+class _EncodeStringsContext(FileContext):
+    def __init__(self, file_name: str):
+        super().__init__(file_name)
         self.in_formatted_str = False
         self.no_lzma = False
-        self.xor_table = []
-        self.fname = None
-        super().__init__(
-            "encodeStrings",
-            "Encodes strings to make them harder to read",
-            mode=ConfigValue(
-                "How to transform the strings\n"
-                "Mode chararray is best used with the intObfuscator transformer\n"
-                "Available modes: b64lzma, chararray, xortable",
-                "b64lzma",
-            ),
-        )
+        # xortable: a random permutation of all byte values
+        self.xor_table = b""
+        # decode_once: the encoded strings of this file, in the order they were found, as
+        # [value, encoded expression, index constants of its uses], and the index of each value in it
+        self.decoded = []
+        self.decoded_indexes = {}
+        self.decoded_table_name = rnd_name()
+
+
+class EncodeStrings(Transformer, NodeTransformer):
+    def __init__(self):
+        super().__init__("encodeStrings")
+
+    def new_context(self, current_file_name: str) -> _EncodeStringsContext:
+        return _EncodeStringsContext(current_file_name)
 
     def visit_JoinedStr(self, node: JoinedStr) -> Any:
-        self.in_formatted_str = True
-        self.no_lzma = True
+        # format specs are nested fstrings, the rest of the outer one is still in an fstring after them
+        prev = self.ctx.in_formatted_str, self.ctx.no_lzma
+        self.ctx.in_formatted_str = True
+        self.ctx.no_lzma = True
         r = self.generic_visit(node)
-        self.no_lzma = False
-        self.in_formatted_str = False
+        self.ctx.in_formatted_str, self.ctx.no_lzma = prev
         return r
 
     def visit_FormattedValue(self, node: FormattedValue) -> Any:
-        prev = self.in_formatted_str
-        self.in_formatted_str = False
+        prev = self.ctx.in_formatted_str
+        self.ctx.in_formatted_str = False
         r = self.generic_visit(node)
-        self.in_formatted_str = prev
+        self.ctx.in_formatted_str = prev
         return r
 
+    def _b64_decoder(self, text: bool) -> Name:
+        """
+        :param text: Whether the decoder returns a str instead of bytes
+        :return: The decoder of the b64lzma mode, defined once per module and variant:
+        def decoder(data):
+            return base64.b64decode(zlib.decompress(data)).decode()
+        Without the decompress call in fstrings, and without the decode call for bytes
+        """
+        prelude = self.ctx.prelude
+        # We haven't compressed if we're in an fstr
+        compressed = not self.ctx.no_lzma
+        key = "encodeStrings.b64lzma" + (".zlib" if compressed else "") + (".str" if text else "")
+
+        def create(name: str) -> FunctionDef:
+            t = Name("d", Load())
+            if compressed:
+                zlib_mod = prelude.module("zlib")
+                t = Call(func=Attribute(value=zlib_mod, attr="decompress", ctx=Load()), args=[t], keywords=[])
+            base64_mod = prelude.module("base64")
+            t = Call(func=Attribute(value=base64_mod, attr="b64decode", ctx=Load()), args=[t], keywords=[])
+            if text:
+                t = Call(func=Attribute(value=t, attr="decode", ctx=Load()), args=[], keywords=[])
+            return FunctionDef(
+                name=name,
+                args=arguments(posonlyargs=[], args=[arg("d")], kwonlyargs=[], kw_defaults=[], defaults=[]),
+                body=[Return(t)],
+                decorator_list=[],
+            )
+
+        return prelude.helper(key, create)
+
     def visit_constant_b64lzma(self, node: Constant):
         do_decode = False
         val = node.value
         if isinstance(val, str):
             encoded = base64.b64encode(val.encode("utf8"))
             do_decode = True
-            if self.no_lzma:  # can't use unicode chars in fstrings since these would lead to escapes
+            if self.ctx.no_lzma:  # can't use unicode chars in fstrings since these would lead to escapes
                 compressed = encoded
             else:
                 compressed = zlib.compress(encoded, 9)
         elif type(val) == bytes:
             encoded = base64.b64encode(val)
-            if self.no_lzma:
+            if self.ctx.no_lzma:
                 compressed = encoded
             else:
                 compressed = zlib.compress(encoded, 9)
         else:
             compressed = None
         if compressed is not None:
-            t = Call(
-                func=Attribute(value=ast_import_full("base64"), attr="b64decode", ctx=Load()),
-                args=[
-                    # We haven't compressed if we're in an fstr
-                    Call(
-                        func=Attribute(value=ast_import_full("zlib"), attr="decompress", ctx=Load()),
-                        args=[Constant(compressed)],
-                        keywords=[],
-                    )
-                    if not self.no_lzma
-                    else Constant(compressed)
-                ],
-                keywords=[],
-            )
-            if do_decode:
-                t = Call(func=Attribute(value=t, attr="decode", ctx=Load()), args=[], keywords=[])
-            if self.in_formatted_str:
+            t = Call(func=self._b64_decoder(do_decode), args=[Constant(compressed)], keywords=[])
+            if self.ctx.in_formatted_str:
                 t = FormattedValue(value=t, conversion=-1)
             return t
         else:
             return self.generic_visit(node)
 
+    def _xor_bytes(self, data: bytes) -> Constant | Call:
+        if self.ctx.no_lzma:  # no escapes in fstrings, see visit_constant_b64lzma
+            return Call(
+                func=Attribute(value=Name("bytes", Load()), attr="fromhex", ctx=Load()),
+                args=[Constant(data.hex())],
+                keywords=[],
+            )
+        return Constant(data)
+
+    def _xor_decoder(self) -> Name:
+        """
+        :return: The decoder of the xortable mode, defined once per module:
+        def decoder(data, offset):
+            n = len(data)
+            key = (xor_table * (n // 256 + 2))[offset : offset + n]
+            return (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(n, "big").translate(xor_table)
+        """
+        prelude = self.ctx.prelude
+
+        def create(name: str) -> FunctionDef:
+            def table() -> Name:
+                return prelude.helper(
+                    "encodeStrings.xor_table", lambda x: Assign([Name(x, Store())], Constant(self.ctx.xor_table))
+                )
+
+            def n() -> Call:
+                return Call(func=Name("len", Load()), args=[Name("d", Load())], keywords=[])
+
+            key = Subscript(
+                value=BinOp(
+                    left=table(),
+                    op=Mult(),
+                    right=BinOp(left=BinOp(left=n(), op=FloorDiv(), right=Constant(256)), op=Add(), right=Constant(2)),
+                ),
+                slice=Slice(lower=Name("o", Load()), upper=BinOp(left=Name("o", Load()), op=Add(), right=n())),
+                ctx=Load(),
+            )
+            xored = BinOp(left=_int_from_bytes(Name("d", Load())), op=BitXor(), right=_int_from_bytes(key))
+            return FunctionDef(
+                name=name,
+                args=arguments(posonlyargs=[], args=[arg("d"), arg("o")], kwonlyargs=[], kw_defaults=[], defaults=[]),
+                body=[
+                    Return(
+                        Call(
+                            func=Attribute(
+                                value=Call(
+                                    func=Attribute(value=xored, attr="to_bytes", ctx=Load()),
+                                    args=[n(), Constant("big")],
+                                    keywords=[],
+                                ),
+                                attr="translate",
+                                ctx=Load(),
+                            ),
+                            args=[table()],
+                            keywords=[],
+                        )
+                    )
+                ],
+                decorator_list=[],
+            )
+
+        return prelude.helper("encodeStrings.xortable", create)
+
     def visit_constant_xortable(self, node: Constant):
         val = node.value
         if not isinstance(val, str) and not isinstance(val, bytes):
             return self.generic_visit(node)
         if len(val) == 0:
             return node
-        if len(val) > 250:
-            warn(self.fname, node, f"String too big to obfuscate properly using xor table ({len(val)} > 250)")
-            return node
-        raw_ints = [(ord(x) if type(node.value) == str else x) for x in list(val)]
-        encoded_positions = [(raw_ints[i] ^ self.xor_table[i % len(self.xor_table)], i) for i in range(len(raw_ints))]
-        random.shuffle(encoded_positions)
-        ie = IfExp(
-            test=Compare(left=Name("i", Load()), ops=[Eq()], comparators=[Constant(encoded_positions[0][1])]),
-            body=Constant(encoded_positions[0][0]),
-            orelse=Constant(random.randint(0, 0xFFFF)),
-        )
-        for x in range(1, len(encoded_positions)):
-            current_ps = encoded_positions[x]
-            ie = IfExp(
-                test=Compare(left=Name("i", Load()), ops=[Eq()], comparators=[Constant(current_ps[1])]),
-                body=Constant(current_ps[0]),
-                orelse=ie,
-            )
-        generator_elem = BinOp(
-            left=ie,
-            op=BitXor(),
-            right=Subscript(
-                value=Name("xor_table", Load()),
-                slice=BinOp(
-                    left=Name(id="i", ctx=Load()),
-                    op=Mod(),
-                    right=Call(func=Name(id="len", ctx=Load()), args=[Name(id="xor_table", ctx=Load())], keywords=[]),
-                ),
-                ctx=Load(),
-            ),
-        )
+        raw = val.encode("utf8") if type(val) == str else val
+        xor_table = self.ctx.xor_table
+        n = len(raw)
+        # each byte is substituted with the shuffled table, then the whole string is xored with a part of the table
+        # as one big int. Decoding takes a constant number of operations, each linear in the length of the string
+        inverse = bytearray(256)
+        for i in range(256):
+            inverse[xor_table[i]] = i
+        offset = random.randrange(256)
+        key = (xor_table * (n // 256 + 2))[offset : offset + n]
+        encoded = (int.from_bytes(raw.translate(inverse), "big") ^ int.from_bytes(key, "big")).to_bytes(n, "big")
+        t = Call(func=self._xor_decoder(), args=[self._xor_bytes(encoded), Constant(offset)], keywords=[])
         if type(val) == str:
-            generator_elem = Call(Name("chr", Load()), [generator_elem], [])
-        decrypt_generator = ListComp(
-            elt=generator_elem,
-            generators=[
-                comprehension(
-                    target=Name("i", Store()),
-                    iter=Call(func=Name("range", Load()), args=[Constant(len(encoded_positions))], keywords=[]),
-                    ifs=[],
-                    is_async=0,
-                )
-            ],
-        )
-        if type(val) == str:
-            return Call(
-                func=Attribute(value=Constant("" if type(val) == str else b""), attr="join", ctx=Load()),
-                args=[decrypt_generator],
-                keywords=[],
-            )
-        else:
-            return Call(
-                func=Name("bytes", Load()),
-                args=[decrypt_generator],
-                keywords=[],
-            )
+            t = Call(func=Attribute(value=t, attr="decode", ctx=Load()), args=[], keywords=[])
+        if self.ctx.in_formatted_str:
+            t = FormattedValue(value=t, conversion=-1)
+        return t
 
     def visit_constant_chararray(self, node: Constant):
         val = node.value
@@ -177,7 +228,7 @@ class EncodeStrings(Transformer, NodeTransformer):
                 keywords=[],
             )
 
-    def visit_Constant(self, node: Constant) -> Any:
+    def _encode_constant(self, node: Constant):
         mode = self.config["mode"].value
         if mode == "b64lzma":
             return self.visit_constant_b64lzma(node)
@@ -186,18 +237,71 @@ class EncodeStrings(Transformer, NodeTransformer):
         elif mode == "xortable":
             return self.visit_constant_xortable(node)
 
-    def _generator_xor_table(self, length: int):
-        self.xor_table = [random.randint(0x0001, 0xFFFF) for _ in range(length)]
+    def _decode_once(self, node: Constant):
+        ctx = self.ctx
+        if node.value not in ctx.decoded_indexes:
+            # the encoded expression goes into the table, outside of any fstring
+            in_formatted_str, no_lzma = ctx.in_formatted_str, ctx.no_lzma
+            ctx.in_formatted_str = ctx.no_lzma = False
+            encoded = self._encode_constant(node)
+            ctx.in_formatted_str, ctx.no_lzma = in_formatted_str, no_lzma
+            if encoded is node:  # the mode leaves this one as it is
+                return node
+            ctx.decoded_indexes[node.value] = len(ctx.decoded)
+            ctx.decoded.append([node.value, encoded, []])
+        entry = ctx.decoded[ctx.decoded_indexes[node.value]]
+        index = Constant(0)  # set once the table is built, see _decoded_table
+        entry[2].append(index)
+        t = Subscript(value=Name(ctx.decoded_table_name, Load()), slice=index, ctx=Load())
+        if ctx.in_formatted_str:
+            t = FormattedValue(value=t, conversion=-1)
+        return t
+
+    def _decoded_table(self) -> Assign:
+        """
+        Builds the table decode_once looks the strings up in. It is evaluated once, when the module is imported, so
+        every string is decoded once per process. The str ones are interned, like the compiler does with the
+        identifier-like ones, so comparing and hashing them stays as cheap as it was before they were encoded
+        :return: The assignment of the table
+        """
+        ctx = self.ctx
+        entries = [x for x in ctx.decoded if type(x[0]) == str] + [x for x in ctx.decoded if type(x[0]) != str]
+        for i in range(len(entries)):
+            for index in entries[i][2]:
+                index.value = i
+        strs = [x[1] for x in entries if type(x[0]) == str]
+        rest = [x[1] for x in entries if type(x[0]) != str]
+        interned = Starred(
+            value=Call(
+                func=Name("map", Load()),
+                args=[Attribute(value=self.ctx.prelude.module("sys"), attr="intern", ctx=Load()), List(strs, Load())],
+                keywords=[],
+            ),
+            ctx=Load(),
+        )
+        return Assign([Name(ctx.decoded_table_name, Store())], List([interned] + rest, Load()))
+
+    def visit_Constant(self, node: Constant) -> Any:
+        if self.config["decode_once"].value and isinstance(node.value, (str, bytes)):
+            return self._decode_once(node)
+        return self._encode_constant(node)
+
+    def _generator_xor_table(self):
+        self.ctx.xor_table = bytes(random.sample(range(256), 256))
 
     def visit_Module(self, node: Module) -> Any:
-        if self.config["mode"].value == "xortable":
-            self._generator_xor_table(64)
-            xor_table_save = Assign([Name("xor_table", Store())], List([Constant(x) for x in self.xor_table], Load()))
-            node.body.insert(0, xor_table_save)
-        return self.generic_visit(node)
+        r = self.generic_visit(node)
+        # added after the visit, so it isn't encoded itself
+        if len(self.ctx.decoded) > 0:
+            r.body.insert(module_header_length(r), self._decoded_table())
+        return r
 
     def transform(self, ast: AST, current_file_name, all_asts, all_file_names) -> AST:
         if self.config["mode"].value not in ("b64lzma", "chararray", "xortable"):
             raise ValueError("Invalid mode " + self.config["mode"].value)
-        self.fname = current_file_name
-        return self.visit(ast)
+        with self.file_context(current_file_name):
+            if self.config["mode"].value == "xortable":
+                self._generator_xor_table()
+            r = self.visit(ast)
+            self.ctx.prelude.add_to(r)
+            return r
@@ -19,21 +19,17 @@ def decoder_float(c: float):
     return BinOp(left=decoder_int(int(c)), op=Add(), right=Constant(float_part))
 
 
-class FloatsToComplex(Transformer, NodeTransformer):
+class FloatsToComplex(Transformer):
+    node_types = (Constant,)
+
     def __init__(self):
-        super().__init__(
-            "floatsToComplex",
-            "Converts floats to a representation of them on the complex number plane, "
-            "then converts them back at runtime\n"
-            "Warning: float precision might change some numbers in ways you don't want, please open a bug report "
-            "if you find such a case",
-        )
+        super().__init__("floatsToComplex")
 
     def visit_Constant(self, node: Constant) -> Any:
         val = node.value
         t = type(val)
         if t != int and t != float:
-            return self.generic_visit(node)
+            return node
         negate = False
         if val < 0:
             # negative input, we cant really use this so we'll invert it and put it back later
@@ -51,6 +47,3 @@ class FloatsToComplex(Transformer, NodeTransformer):
                 di
             )
         return di
-
-    def transform(self, ast: AST, current_file_name, all_asts, all_file_names) -> AST:
-        return self.visit(ast)
@@ -1,15 +1,16 @@
-from _ast import JoinedStr, FormattedValue, Call, Name, Load, Constant, Attribute, AST
-from ast import NodeTransformer
+from _ast import JoinedStr, FormattedValue, Call, Name, Load, Constant, Attribute
 from typing import Any
 
 from . import Transformer, collect_fstring_consts
 
 
-class FstringsToFormatSequence(Transformer, NodeTransformer):
+class FstringsToFormatSequence(Transformer):
+    node_types = (JoinedStr,)
+    skip_children_of = (JoinedStr,)
     conversion_method_dict = {"s": "str", "r": "repr", "a": "ascii"}
 
     def __init__(self):
-        super().__init__("fstrToFormatSeq", "Converts F-Strings to their str.format equivalent")
+        super().__init__("fstrToFormatSeq")
 
     def visit_JoinedStr(self, node: JoinedStr) -> Any:
         converted_format = ""
@@ -32,6 +33,3 @@ class FstringsToFormatSequence(Transformer, NodeTransformer):
             args=collected_args,
             keywords=[],
         )
-
-    def transform(self, ast: AST, current_file_name, all_asts, all_file_names) -> AST:
-        return self.visit(ast)
@@ -1,11 +1,9 @@
 import math
 import random
 from _ast import *
-from ast import NodeTransformer
 from typing import Any
 
-from . import Transformer
-from ..cfg import ConfigValue
+from . import Transformer, Prelude
 
 
 def bt():
@@ -37,6 +35,9 @@ def transform_complement(node: Constant):
 
 
 def transform_bits(node: Constant):
+    """
+    Builds the int out of ones shifted into place, the shift amounts being built the same way
+    """
     ic: int = node.value
     if ic == 0:
         # True >> True, effectively 0
@@ -55,7 +56,7 @@ def transform_bits(node: Constant):
     if len(conv_bits) == 0:
         conv_bits = [(0, 0)]
     sm = (
-        BinOp(left=bt(), op=LShift(), right=Constant(conv_bits[0][1]))  # this will always be true
+        BinOp(left=bt(), op=LShift(), right=transform_bits(Constant(conv_bits[0][1])))  # this will always be true
         if conv_bits[0][1] != 0
         else bt()
     )
@@ -63,18 +64,12 @@ def transform_bits(node: Constant):
         sm = BinOp(
             left=sm,
             op=BitOr(),
-            right=BinOp(left=bt(), op=LShift(), right=Constant(x[1])),  # this will always be true
+            right=BinOp(left=bt(), op=LShift(), right=transform_bits(Constant(x[1]))),  # this will always be true
         )
     return sm
 
 
-def transform_decode(node: Constant):
-    ic: int = node.value
-    is_signed = ic < 0  # signed bit needs to be set only if ic is negative
-    rdx = math.ceil((ic.bit_length() + (1 if is_signed else 0)) / 8)  # add said sign bit if the int is signed
-    int_bytes = ic.to_bytes(rdx, "little", signed=is_signed)
-    off = random.randint(255 + rdx, 999)  # need to keep at least rdx indexes free
-    encoded = "".join([format(off - (x + i), "03d") for (x, i) in zip(int_bytes, range(len(int_bytes)))])
+def _decode_expression(encoded: expr, off: expr, is_signed: expr, count: expr) -> Call:
     return Call(  # int.from_bytes(..., "little", signed=is_signed)
         func=Attribute(Name("int", Load()), "from_bytes", Load()),  # int.from_bytes
         args=[
@@ -90,7 +85,7 @@ def transform_decode(node: Constant):
                             defaults=[],
                         ),
                         body=BinOp(  # off - int(O)
-                            left=Constant(value=off),
+                            left=off,
                             op=Sub(),
                             right=BinOp(
                                 left=Call(func=Name("int", Load()), args=[Name("O", Load())], keywords=[]),  # int(O)
@@ -112,7 +107,7 @@ def transform_decode(node: Constant):
                                                 elts=[
                                                     Call(
                                                         func=Name("iter", Load()),
-                                                        args=[Constant(encoded)],
+                                                        args=[encoded],
                                                         keywords=[],
                                                     )
                                                 ],
@@ -130,8 +125,8 @@ def transform_decode(node: Constant):
                         keywords=[],
                     ),
                     Call(
-                        func=Name("range", Load()),  # range(math.floor(len(encoded)/3))
-                        args=[Constant(math.floor(len(encoded) / 3))],
+                        func=Name("range", Load()),  # range(len(encoded) // 3)
+                        args=[count],
                         keywords=[],
                     ),
                 ],
@@ -139,32 +134,74 @@ def transform_decode(node: Constant):
             ),
             Constant(value="little"),
         ],
-        keywords=[keyword(arg="signed", value=Constant(is_signed))],
+        keywords=[keyword(arg="signed", value=is_signed)],
+    )
+
+
+def _decode_helper(name: str, prelude: Prelude) -> FunctionDef:
+    # each call site always passes the same arguments, so each of them only decodes once
+    return FunctionDef(  # @functools.cache def name(encoded, off, is_signed): return ...
+        name=name,
+        args=arguments(
+            posonlyargs=[],
+            args=[arg("e"), arg("o"), arg("s")],
+            kwonlyargs=[],
+            kw_defaults=[],
+            defaults=[],
+        ),
+        body=[
+            Return(
+                _decode_expression(
+                    Name("e", Load()),
+                    Name("o", Load()),
+                    Name("s", Load()),
+                    BinOp(  # len(e) // 3
+                        left=Call(func=Name("len", Load()), args=[Name("e", Load())], keywords=[]),
+                        op=FloorDiv(),
+                        right=Constant(3),
+                    ),
+                )
+            )
+        ],
+        decorator_list=[Attribute(value=prelude.module("functools"), attr="cache", ctx=Load())],
     )
 
 
-class IntObfuscator(Transformer, NodeTransformer):
+def transform_decode(node: Constant, prelude: Prelude):
+    ic: int = node.value
+    is_signed = ic < 0  # signed bit needs to be set only if ic is negative
+    rdx = math.ceil((ic.bit_length() + (1 if is_signed else 0)) / 8)  # add said sign bit if the int is signed
+    int_bytes = ic.to_bytes(rdx, "little", signed=is_signed)
+    off = random.randint(255 + rdx, 999)  # need to keep at least rdx indexes free
+    encoded = "".join([format(off - (x + i), "03d") for (x, i) in zip(int_bytes, range(len(int_bytes)))])
+    # the decoding is the same for every int, and defined once per module
+    return Call(
+        func=prelude.helper("intObfuscator.decode", lambda x: _decode_helper(x, prelude)),
+        args=[Constant(encoded), Constant(off), Constant(is_signed)],
+        keywords=[],
+    )
+
+
+class IntObfuscator(Transformer):
+    node_types = (Constant,)
+
     def __init__(self):
-        super().__init__(
-            "intObfuscator",
-            "Obscures int constants",
-            mode=ConfigValue("How to obfuscate int constants\nPossible values: bits, complement, decode", "bits"),
-        )
+        super().__init__("intObfuscator")
 
     def visit_Constant(self, node: Constant) -> Any:
-        s = self.generic_visit(node)
         if type(node.value) == int:
             val = self.config["mode"].value
             if val == "decode":
-                return transform_decode(node)
+                return transform_decode(node, self.ctx.prelude)
             elif val == "bits":
-                tfb = transform_bits(node)
-                return self.generic_visit(tfb)
+                return transform_bits(node)
             elif val == "complement":
                 return transform_complement(node)
-        return s
+            else:
+                raise ValueError("Invalid mode " + val)
+        return node
 
     def transform(self, ast: AST, current_file_name, all_asts, all_file_names) -> AST:
         if self.config["mode"].value not in ("bits", "decode", "complement"):
             raise ValueError("Invalid mode " + self.config["mode"].value)
-        return self.visit(ast)
+        return super().transform(ast, current_file_name, all_asts, all_file_names)
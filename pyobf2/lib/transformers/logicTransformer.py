@@ -4,14 +4,24 @@ from . import *
 from ast import *
 
 
-def _generator_if_and(node: If):
+def _betavariate(prelude: Prelude) -> Name:
+    """
+    :param prelude: The prelude of the module
+    :return: random.betavariate, bound to a name once per module. Nothing else uses random, so it isn't imported on
+    its own line
+    """
+    betavariate = Attribute(value=ast_import_full("random"), attr="betavariate", ctx=Load())
+    return prelude.helper("logicTransformer.betavariate", lambda x: Assign([Name(x, Store())], betavariate))
+
+
+def _generator_if_and(node: If, prelude: Prelude):
     node.test = BoolOp(
         op=And(),
         values=[
             node.test,
             Compare(
                 left=Call(
-                    func=Attribute(value=ast_import_full("random"), attr="betavariate", ctx=Load()),
+                    func=_betavariate(prelude),
                     args=[Constant(random.uniform(1, 100)), Constant(random.uniform(1, 100))],
                     keywords=[],
                 ),
@@ -22,14 +32,14 @@ def _generator_if_and(node: If):
     )
 
 
-def _generator_if_or(node: If):
+def _generator_if_or(node: If, prelude: Prelude):
     node.test = BoolOp(
         op=Or(),
         values=[
             node.test,
             Compare(
                 left=Call(
-                    func=Attribute(value=ast_import_full("random"), attr="betavariate", ctx=Load()),
+                    func=_betavariate(prelude),
                     args=[Constant(random.uniform(1, 100)), Constant(random.uniform(1, 100))],
                     keywords=[],
                 ),
@@ -43,8 +53,8 @@ def _generator_if_or(node: If):
 all_cond_gens = [_generator_if_and, _generator_if_or]
 
 
-def create_equivalent_dogshit(node: If) -> If:
-    random.choice(all_cond_gens)(node)
+def create_equivalent_dogshit(node: If, prelude: Prelude) -> If:
+    random.choice(all_cond_gens)(node, prelude)
     return node
 
 
@@ -55,14 +65,14 @@ def wrap_cond(node: If):
     )
 
 
-class LogicTransformer(Transformer, NodeVisitor):
+class LogicTransformer(Transformer):
+    node_types = (If,)
+    skip_children_of = (If,)
+
     def __init__(self):
-        super().__init__("logicTransformer", "Transforms boolean logic into confusing, but equally valid statements")
+        super().__init__("logicTransformer")
 
     def visit_If(self, node: If) -> Any:
-        create_equivalent_dogshit(node)
+        create_equivalent_dogshit(node, self.ctx.prelude)
         wrap_cond(node)
-
-    def transform(self, ast: AST, current_file_name, all_asts, all_file_names) -> AST:
-        self.visit(ast)
-        return ast
+        return node
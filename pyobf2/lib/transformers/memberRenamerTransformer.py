@@ -1,51 +1,190 @@
 import os
+import pathlib
+import weakref
 from _ast import AST
+from ast import Assign, Call, Constant, Import, ImportFrom, Name, walk
 
 from . import Transformer, compute_import_path
-from ..cfg import ConfigValue
-from ..renamer import MappingGenerator, MappingApplicator, OtherFileMappingApplicator
+from ..mappingstore import MappingStore
+from ..renamer import MappingGenerator, MappingApplicator, OtherFileMappingApplicator, ReferenceSites
+
+
+def _imported_modules(tree: AST) -> set[str]:
+    """
+    :return: Every module name a file refers to, the way OtherFileMappingApplicator matches them: "from" imports with
+    their leading dots, imported modules, and __import__("...") assignments
+    """
+    names = set()
+    for node in walk(tree):
+        if isinstance(node, ImportFrom):
+            names.add("." * node.level + (node.module if node.module is not None else ""))
+        elif isinstance(node, Import):
+            names.update(x.name for x in node.names)
+        elif (
+            isinstance(node, Assign)
+            and isinstance(node.value, Call)
+            and isinstance(node.value.func, Name)
+            and node.value.func.id == "__import__"
+            and len(node.value.args) > 0
+            and isinstance(node.value.args[0], Constant)
+            and isinstance(node.value.args[0].value, str)
+        ):
+            names.add(node.value.args[0].value)
+    return names
+
+
+class ImportIndex:
+    """
+    Which file of a batch refers to which module, built in one pass over all files. Renaming the top level names of a
+    file only has an effect on the files that import it, so only those have to be visited.
+    Renaming doesn't change which modules a file imports, so the index stays valid for the whole renaming pass.
+    A batch is identified by the list holding its ASTs, which is passed to every transform call of the batch
+    """
+
+    def __init__(self, all_asts: list[AST], all_file_names: list[str]):
+        self.batch = id(all_asts)
+        # weak, the index outlives the run in the transformer, the ASTs shouldn't
+        self.asts = [weakref.ref(x) for x in all_asts]
+        self.given_file_names = list(all_file_names)
+        self.file_names = [os.path.abspath(x) for x in all_file_names]
+        # by_module[directory][module name]: indices of the files in directory importing module name
+        self.by_module: dict[str, dict[str, list[int]]] = {}
+        for i in range(len(all_asts)):
+            in_dir = self.by_module.setdefault(os.path.dirname(self.file_names[i]), {})
+            for x in _imported_modules(all_asts[i]):
+                in_dir.setdefault(x, []).append(i)
+        self.root_file = min(all_file_names, key=lambda x: len(x.split(os.path.sep)))
+        self._sites: dict[int, ReferenceSites] = {}
+        self._pending = set(range(len(all_asts)))
+
+    def sites(self, i: int, tree: AST) -> ReferenceSites:
+        """
+        :param i: The index of a file
+        :param tree: Its AST
+        :return: The reference sites in it, collected the first time they're needed
+        """
+        if i not in self._sites:
+            self._sites[i] = ReferenceSites(tree)
+        return self._sites[i]
+
+    def renamed(self, i: int):
+        """
+        Drops the reference sites of a file, after its own names were renamed
+        :param i: The index of the file
+        :return: Nothing
+        """
+        self._sites.pop(i, None)
+        self._pending.discard(i)
+
+    @property
+    def finished(self) -> bool:
+        """
+        Whether the names of every file in the batch were renamed
+        """
+        return len(self._pending) == 0
+
+    def matches(self, all_asts: list[AST], all_file_names: list[str]) -> bool:
+        """
+        :return: Whether this index was built for this batch of files
+        """
+        return (
+            id(all_asts) == self.batch
+            and len(all_asts) == len(self.asts)
+            and all(a is b() for (a, b) in zip(all_asts, self.asts))
+            and list(all_file_names) == self.given_file_names
+        )
+
+    def importers_of(self, file_name: str) -> list[tuple[int, list[str]]]:
+        """
+        :param file_name: The absolute path of the imported file
+        :return: The index of each file that might import it, and the names it would import it by. Files that
+        certainly don't aren't included
+        """
+        root_import = compute_import_path(self.root_file, file_name)
+        found = {}
+        for directory, modules in self.by_module.items():
+            # the import path only depends on the directory of the importing file. The file name is a placeholder
+            required_import = compute_import_path(os.path.join(directory, "_"), file_name)
+            for x in (required_import, root_import):
+                for i in modules.get(x, ()):
+                    found[i] = [required_import, root_import]
+        return sorted(found.items())
 
 
 class MemberRenamer(Transformer):
+    requires_all_asts = True
+    # the import index of the batch being renamed, and the mapping store the names of every file are kept in
+    shared_state = ("index", "store")
+
     def __init__(self):
-        super().__init__(
-            "renamer",
-            "Renames all members (methods, classes, fields, args)",
-            rename_format=ConfigValue(
-                "Format for the renamer. Will be queried using eval().\n"
-                "'counter' is a variable incrementing with each name generated\n"
-                "'kind' is either 'method', 'var', 'arg' or 'class', depending on the current element\n"
-                "'get_counter(name)' is a method that increments a counter behind 'name', and returns its current "
-                "value\n"
-                "'random_identifier(length)' returns a valid python identifier, according to "
-                "https://docs.python.org/3/reference/lexical_analysis.html#identifiers",
-                "f'{kind}{get_counter(kind)}'",
-            ),
-        )
+        super().__init__("renamer")
+        self.index = None
+        self.store = None
+
+    def _generate_mappings(self, ast: AST, module: str) -> MappingGenerator:
+        store_path = self.config["mapping_store"].value
+        if store_path == "":
+            generator = MappingGenerator(self.config["rename_format"].value)
+            generator.go(ast)
+            return generator
+        if self.store is None or self.store.path != os.path.abspath(store_path):
+            if self.store is not None:
+                self.store.close()
+            self.store = MappingStore(store_path)
+        with self.store.bindings(module) as known:
+            generator = MappingGenerator(self.config["rename_format"].value, known)
+            generator.go(ast)
+            known.update(generator.mappings)
+        return generator
+
+    def _store_module(self, file_name: str) -> str:
+        """
+        :param file_name: The absolute path of a file
+        :return: The name of the file in the mapping store, its path relative to renamer.project_root. This doesn't
+        depend on which other files are in the batch, or on where the project is
+        """
+        root = os.path.abspath(self.config["project_root"].value)  # the current directory, if empty
+        return os.path.relpath(file_name, root).replace(os.path.sep, "/")
 
     def transform(self, ast: AST, current_file_name, all_asts, all_file_names) -> AST:
-        generator = MappingGenerator(self.config["rename_format"].value)
-        generator.go(ast)
+        this_file_name = os.path.abspath(current_file_name)
+        if all_asts is not None:
+            # whichever file of a batch comes first starts it, and the index is dropped once every file is renamed
+            if self.index is None or not self.index.matches(all_asts, all_file_names):
+                self.index = ImportIndex(all_asts, all_file_names)
+        generator = self._generate_mappings(ast, self._store_module(this_file_name))
         # generator.print_mappings()
         MappingApplicator(generator.mappings).visit(ast)
         if all_asts is not None:
+            self.index.renamed(next(i for i in range(len(all_asts)) if all_asts[i] is ast))
             mappings1 = {}
-            this_file_name = os.path.abspath(current_file_name)
             for x in generator.mappings.keys():
                 n = x.split(".")
                 if n[0] == "":
                     mappings1[n[1]] = generator.mappings[x]
-            for i in range(len(all_asts)):
+            for i, owning_modules in self.index.importers_of(this_file_name):
                 that_ast = all_asts[i]
                 if that_ast == ast:
                     continue
-                that_file_name = os.path.abspath(all_file_names[i])
-                required_import = compute_import_path(that_file_name, this_file_name)
-                root_name = list(all_file_names)
-                root_name.sort(key=lambda x: len(x.split(os.path.sep)))
-                OtherFileMappingApplicator(
-                    mappings1,
-                    [required_import, compute_import_path(root_name[0], this_file_name)],
-                    list(mappings1.keys()),
-                ).visit(that_ast)
+                OtherFileMappingApplicator(mappings1, owning_modules, list(mappings1.keys())).visit_sites(
+                    self.index.sites(i, that_ast)
+                )
+            if self.index.finished:
+                self.index = None
+                self._close_store()
+        else:
+            self._close_store()
         return ast
+
+    def transform_output(self, output_location: pathlib.Path, all_files: list[pathlib.Path]) -> list[pathlib.Path]:
+        self._close_store()
+        return all_files
+
+    def _close_store(self):
+        """
+        Closes the mapping store at the end of a batch, so its file isn't kept open between runs. It's opened again by
+        the next file that needs it
+        :return: Nothing
+        """
+        if self.store is not None:
+            self.store.close()
@@ -4,9 +4,10 @@ import os.path
 import pathlib
 import shutil
 import string
-import tempfile
 import textwrap
 import zipfile
+from io import BytesIO
+from typing import BinaryIO
 
 from . import *
 
@@ -46,57 +47,39 @@ def _lhandler(key_passphrase, mainfile):
 
 class PackInPyz(Transformer):
     def __init__(self):
-        super().__init__(
-            "packInPyz",
-            'Packs all of the scripts into a .pyz file, creating an one file "executable". '
-            "Specifically effective when used with multiple input files",
-            bootstrap_file=ConfigValue(
-                "The file to start when the .pyz is started. File will be renamed to __main__.py inside the .pyz",
-                "__main__.py",
-            ),
-            encrypt=ConfigValue("Encrypts all contents of the .pyz using a random RSA256 key", True),
-        )
-
-    def transform_output(self, output_location: pathlib.Path, all_files: list[pathlib.Path]) -> list[pathlib.Path]:
-        if len(all_files) > 1:
-            commom_prefix = os.path.commonpath(all_files)
-            mapped_file_names = [str(x)[len(commom_prefix) + 1 :] for x in all_files]
-        else:
-            commom_prefix = str(all_files[0].parent)
-            mapped_file_names = [x.name for x in all_files]
+        super().__init__("packInPyz")
+
+    def pack(self, files: dict[str, bytes], out: BinaryIO) -> bool:
+        """
+        Packs files into a .pyz archive, encrypting it if configured to
+        :param files: path inside the archive : content pairs. One of the paths has to be the bootstrap file
+        :param out: The stream to write the archive to, for example a BytesIO
+        :return: Whether the archive was written. It isn't if the bootstrap file is missing
+        """
         bs_file = self.config["bootstrap_file"].value
-        if bs_file not in mapped_file_names:
+        if bs_file not in files:
             print(
                 "Cannot locate bootstrap file",
                 bs_file,
                 "in output paths. Available files are:",
-                mapped_file_names,
+                list(files.keys()),
             )
             print("Skipping packInPyz")
-            return all_files
-        tempdir = pathlib.Path(tempfile.mkdtemp())
-        out_path = tempdir.joinpath("archive.pyz")
-        with zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as f:
-            for x in all_files:
-                c_name = str(x)[len(commom_prefix) + 1 :]
+            return False
+        encrypt = self.config["encrypt"].value
+        archive = BytesIO() if encrypt else out
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as f:
+            for c_name, content in files.items():
                 if c_name == bs_file:
-                    f.write(x, "__main__" + os.path.splitext(c_name)[1])
-                else:
-                    f.write(x, c_name)
-        shutil.rmtree(
-            output_location,
-            ignore_errors=False,
-            onerror=None,
-        )
-        if self.config["encrypt"].value:
+                    c_name = "__main__" + os.path.splitext(c_name)[1]
+                f.writestr(c_name.replace(os.path.sep, "/"), content)
+        if encrypt:
             import Crypto.PublicKey.RSA as RSA
             from Crypto.Cipher import PKCS1_OAEP
 
             k = RSA.generate(2048)
             passphr = "".join(random.choices(string.printable, k=16))
             enc_key = k.export_key("PEM", passphr, 8, "scryptAndAES128-CBC")
-            with open(out_path, "rb") as f:
-                orig_bytes = f.read()
             pk = PKCS1_OAEP.new(k)
 
             launcher_bc = _lhandler.__code__
@@ -113,20 +96,33 @@ class PackInPyz(Transformer):
                 ],
                 type_ignores=[],
             )
-            with zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as f:
-                f.writestr("0", pk.encrypt(orig_bytes))
+            with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as f:
+                f.writestr("0", pk.encrypt(archive.getvalue()))
                 f.writestr("id.rsa", enc_key)
                 f.writestr("__main__.py", ast.unparse(ast.fix_missing_locations(gn_ast)))
+        return True
+
+    def transform_output(self, output_location: pathlib.Path, all_files: list[pathlib.Path]) -> list[pathlib.Path]:
+        if len(all_files) > 1:
+            commom_prefix = os.path.commonpath(all_files)
+        else:
+            commom_prefix = str(all_files[0].parent)
+        files = {}
+        for x in all_files:
+            with open(x, "rb") as f:
+                files[str(x)[len(commom_prefix) + 1 :]] = f.read()
+        archive = BytesIO()
+        if not self.pack(files, archive):
+            return all_files
+        shutil.rmtree(
+            output_location,
+            ignore_errors=False,
+            onerror=None,
+        )
 
         output_location.mkdir(parents=True, exist_ok=True)
         fin = output_location.joinpath("archive.pyz")
-        with open(fin, "wb") as outfile, open(out_path, "rb") as infile:
-            while infile.readable():
-                t = infile.read(1024)
-                if len(t) == 0:  # we're done
-                    break
-                outfile.write(t)
-        out_path.unlink()
-        tempdir.rmdir()
+        with open(fin, "wb") as outfile:
+            outfile.write(archive.getvalue())
 
         return [fin]
@@ -6,20 +6,18 @@ from ast import *
 from ..util import random_identifier
 
 
+class _TypeAliasContext(FileContext):
+    def __init__(self, file_name: str):
+        super().__init__(file_name)
+        self.entries = []
+
+
 class TypeAliasTransformer(Transformer, NodeTransformer):
     def __init__(self):
-        super().__init__("typeAliasTransformer",
-                         "Adds alias classes to certain classes to obfuscate their original meaning",
-                         classes_to_alias=ConfigValue("Classes to create aliases for", [
-                             "str",
-                             "int",
-                             "float",
-                             "filter",
-                             "bytes",
-                             "map",
-                         ])
-                         )
-        self.entries = []
+        super().__init__("typeAliasTransformer")
+
+    def new_context(self, current_file_name: str) -> _TypeAliasContext:
+        return _TypeAliasContext(current_file_name)
 
     def visit_Name(self, node: Name) -> Any:
         n = node.id
@@ -27,7 +25,7 @@ class TypeAliasTransformer(Transformer, NodeTransformer):
         if n in cf:
             t = random_identifier(32)
             rec = random.randint(5, 10)
-            self.entries.append({
+            self.ctx.entries.append({
                 "i": rec,
                 "final_name": t,
                 "target": n
@@ -48,10 +46,12 @@ class TypeAliasTransformer(Transformer, NodeTransformer):
         return node
 
     def transform(self, aa: AST, current_file_name, all_asts, all_file_names) -> AST:
-        aa = self.visit(aa)
+        with self.file_context(current_file_name) as ctx:
+            aa = self.visit(aa)
+            entries = ctx.entries
         assert isinstance(aa, Module)
         tta = []
-        for x in self.entries:
+        for x in entries:
             tt = []
             prev = x["target"]
             for i in range(x["i"] - 1):
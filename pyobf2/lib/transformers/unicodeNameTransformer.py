@@ -1,6 +1,5 @@
 import random
-from _ast import Name, AST
-from ast import NodeVisitor
+from _ast import Name
 from typing import Any
 
 from . import Transformer
@@ -31,17 +30,12 @@ def convert_char(ch: str) -> str:
     return random.choice(vs)
 
 
-class UnicodeNameTransformer(Transformer, NodeVisitor):
-    def __init__(self):
-        super().__init__(
-            "unicodeTransformer",
-            "Converts names to equally valid, but weird looking unicode names\n"
-            "Does not work with compileFinalFiles, has to be source code",
-        )
+class UnicodeNameTransformer(Transformer):
+    node_types = (Name,)
 
-    def transform(self, ast: AST, current_file_name: str, all_asts, all_file_names) -> AST:
-        self.visit(ast)
-        return ast
+    def __init__(self):
+        super().__init__("unicodeTransformer")
 
     def visit_Name(self, node: Name) -> Any:
         node.id = "".join([convert_char(x) for x in node.id])
+        return node
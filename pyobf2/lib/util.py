@@ -4,10 +4,18 @@ import importlib.util
 import opcode
 import os.path
 import random
+import stat
 from ast import *
 from types import CodeType
 import string
 
+from .profiler import Profiler, profile_span
+from .sources import SourceCache
+
+# os.umask can only be read by setting it, which isn't safe once other threads create files. Read it once, on import
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 _SINGLE_QUOTES = ("'", '"')
 _MULTI_QUOTES = ('"""', "'''")
 _ALL_QUOTES = (*_SINGLE_QUOTES, *_MULTI_QUOTES)
@@ -59,6 +67,47 @@ class NonEscapingUnparser(getattr(ast, "_Unparser")):
         return escaped_string, possible_quotes
 
 
+def unparse_to_file(source_ast: AST, path: str, profiler: Profiler | None = None) -> str:
+    """
+    Unparses an AST using the NonEscapingUnparser, and writes it to a file. Creates parent directories if needed
+    :param source_ast: The AST to unparse
+    :param path: The file to write to
+    :param profiler: The profiler to record unparsing and writing in, or None
+    :return: The written source
+    """
+    with profile_span(profiler, "unparse", "unparse", file=path):
+        src = NonEscapingUnparser().visit(source_ast)
+    write_to_file(src, path, profiler)
+    return src
+
+
+def write_to_file(src: str, path: str, profiler: Profiler | None = None):
+    """
+    Writes source code to a file. Creates parent directories if needed
+    :param src: The source code
+    :param path: The file to write to
+    :param profiler: The profiler to record writing in, or None
+    :return: Nothing
+    """
+    with profile_span(profiler, "write", "write", file=path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf8") as f:
+            f.write(src)
+
+
+def replaced_file_mode(path: str) -> int:
+    """
+    The permissions a file written with tempfile.mkstemp, then renamed over path, should get. mkstemp creates files
+    only readable by their owner
+    :param path: The file that is replaced
+    :return: The mode of path if it exists, otherwise the mode open() would create it with
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
 def randomize_cache(bc: list[int]):
     """
     Randomizes empty "cache" slots after instructions. Assume the following bytecode:
@@ -146,76 +195,247 @@ def get_file_from_import(name: str, parent: str, path: list[str]):
         raise e
 
 
+class ImportResolver:
+    """
+    Resolves imports to files like get_file_from_import, but without asking the file system about every path segment
+    of every import. Each directory it looks into is listed once, and kept in memory, and each resolved module name is
+    remembered. Directories that change after they were listed aren't noticed, so use a new resolver for each crawl.
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self, path: list[str]):
+        """
+        :param path: The directories to search modules in, like for get_file_from_import
+        """
+        self.path = path
+        # directory : (subdirectories, files, other entries)
+        self._listings: dict[str, tuple[set[str], set[str], set[str]]] = {}
+        self._resolved: dict[str, Imported | None] = {}
+
+    def _listing(self, directory: str) -> tuple[set[str], set[str], set[str]]:
+        listing = self._listings.get(directory)
+        if listing is None:
+            dirs, files, other = set(), set(), set()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir():
+                            dirs.add(entry.name)
+                        elif entry.is_file():
+                            files.add(entry.name)
+                        elif os.path.exists(entry.path):  # not a broken link
+                            other.add(entry.name)
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+            listing = dirs, files, other
+            self._listings[directory] = listing
+        return listing
+
+    def _isdir(self, p: str) -> bool:
+        return os.path.basename(p) in self._listing(os.path.dirname(p))[0]
+
+    def _isfile(self, p: str) -> bool:
+        return os.path.basename(p) in self._listing(os.path.dirname(p))[1]
+
+    def _exists(self, p: str) -> bool:
+        dirs, files, other = self._listing(os.path.dirname(p))
+        name = os.path.basename(p)
+        return name in dirs or name in files or name in other
+
+    def resolve(self, name: str, parent: str) -> Imported | None:
+        """
+        :param name: The name of the imported module, possibly relative
+        :param parent: The package the import is in
+        :return: The file the module is in, or None if it isn't in any of the search paths
+        """
+        resname = importlib.util.resolve_name(name, parent)
+        if resname not in self._resolved:
+            self._resolved[resname] = self._resolve(resname)
+        return self._resolved[resname]
+
+    def _resolve(self, resname: str) -> Imported | None:
+        # the same steps as get_file_from_import
+        searchfor = resname.split(".")
+        for p in self.path:
+            current_path = p
+            visited_path = []
+            for x in searchfor:
+                visited_path.append(x)
+                current_path = os.path.join(current_path, x)
+                if not self._exists(current_path):
+                    return None
+                if self._isdir(current_path):
+                    continue
+                elif self._isfile(current_path + ".py"):
+                    return Imported(current_path + ".py", ".".join(visited_path[:-1]))
+                else:
+                    prevpath = os.path.dirname(current_path)
+                    if self._isfile(os.path.join(prevpath, "__init__.py")):
+                        return Imported(os.path.join(prevpath, "__init__.py"), ".".join(visited_path[:-1]))
+                    return None
+            if self._isdir(current_path):
+                if self._isfile(os.path.join(current_path, "__init__.py")):
+                    return Imported(os.path.join(current_path, "__init__.py"), ".".join(searchfor))
+                else:
+                    return None
+        return None
+
+
 path_blacklist = ["site-packages"]
 
 
-def _walk_deptree(
+def _is_wanted(namespace: str, file: str) -> bool:
+    return file.startswith(namespace) and not any([x in path_blacklist for x in file.split(os.path.sep)])
+
+
+def _file_imports(current_package: str, tree: AST, namespace: str, resolver: ImportResolver):
+    """
+    Finds the project files one file imports
+    :param current_package: The package the file is in
+    :param tree: The parsed file
+    :param namespace: The project root. Files outside of it aren't included
+    :param resolver: The resolver to resolve imports with
+    :return: Whether the file gets an entry in the dependency tree (it does if it has any import statement, or any
+    from-import of a project file), and the imported files, in order
+    """
+    has_entry = False
+    imported: list[Imported] = []
+    for node in ast.walk(tree):
+        if isinstance(node, Import):
+            has_entry = True
+            for x in node.names:
+                spec = resolver.resolve(x.name, current_package)
+                if spec is not None and _is_wanted(namespace, spec.origin):
+                    imported.append(spec)
+        if isinstance(node, ImportFrom):
+            modu = "." * node.level + (node.module or "")
+            spec = resolver.resolve(modu, current_package)
+            if spec is None or not _is_wanted(namespace, spec.origin):
+                continue
+            has_entry = True
+            if any(x.origin == spec.origin for x in imported):
+                continue
+            imported.append(spec)
+    return has_entry, imported
+
+
+def _crawl(
     namespace: str,
-    current_file: str,
-    current_package: str,
-    search_path: list[str],
-    start: AST,
+    roots: list[tuple[str, str]],
     lst: dict[str, list[str]],
+    sources: SourceCache,
+    resolver: ImportResolver,
+    jobs: int = 1,
 ):
-    # print("-- FILE " + current_file + " --")
-    if current_file in lst:
-        return  # already visited
-    for node in ast.walk(start):
-        if isinstance(node, Import):
-            discorvered_specs = list(
-                filter(
-                    lambda x: x is not None,
-                    [get_file_from_import(x.name, current_package, search_path) for x in node.names],
-                )
-            )
-
-            # print(discorvered_specs)
-            if current_file not in lst:
-                lst[current_file] = []
-
-            for x in discorvered_specs:
-                p = x.origin
-                if not p.startswith(namespace):
-                    continue  # unwanted
-                sep_split = p.split(os.path.sep)
-                if any([x in path_blacklist for x in sep_split]):
-                    continue  # also unwanted
-                lst[current_file].append(p)
-                with open(p, "r", encoding="utf8") as f:
-                    _walk_deptree(namespace, p, x.parent, search_path, ast.parse(f.read()), lst)
-        if isinstance(node, ImportFrom):
-            modu = node.module
-            if modu is None:
-                modu = ""
-            modu = "." * node.level + modu
-            discovered_spec = get_file_from_import(modu, current_package, search_path)
-            if discovered_spec is not None:
-                discovered_file = discovered_spec.origin
-                if not discovered_file.startswith(namespace):
-                    continue  # unwanted
-                sep_split = discovered_file.split(os.path.sep)
-                if any([x in path_blacklist for x in sep_split]):
-                    continue  # also unwanted
-                if current_file not in lst:
-                    lst[current_file] = []
-                if discovered_file in lst[current_file]:
-                    continue
-                lst[current_file].append(discovered_file)
-                with open(discovered_file, "r", encoding="utf8") as f:
-                    _walk_deptree(
-                        namespace, discovered_file, discovered_spec.parent, search_path, ast.parse(f.read()), lst
-                    )
+    """
+    Crawls the files reachable from roots, and adds their imports to lst. Files that already are in lst are not
+    crawled again.
+    First, every reachable file is parsed and has its imports resolved, one round of newly discovered files at a time,
+    optionally in a thread pool. Then, the tree is put together depth first, in import order, with an explicit stack,
+    which gives the same tree regardless of the order the files were looked at in
+    :param namespace: The project root
+    :param roots: The files to start at, with the package they are in
+    :param lst: The tree to add to
+    :param sources: The cache to read and parse files through
+    :param resolver: The resolver to resolve imports with
+    :param jobs: How many threads to look at files with. 1 looks at them in this thread
+    :return: Nothing
+    """
 
+    def scan(file: str, package: str):
+        return package, *_file_imports(package, sources.ast(file), namespace, resolver)
 
-def get_dependency_tree(start: str):
+    found: dict[str, tuple[str, bool, list[Imported]]] = {}
+    pending = [x for x in roots if x[0] not in lst]
+    queued = {x[0] for x in pending}
+    pool = None
+    if jobs > 1:
+        from concurrent.futures import ThreadPoolExecutor  # slow to import, and only needed here
+
+        pool = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        while len(pending) > 0:
+            if pool is None:
+                results = [scan(*x) for x in pending]
+            else:
+                results = list(pool.map(lambda x: scan(*x), pending))
+            current, pending = pending, []
+            for (file, _), result in zip(current, results):
+                found[file] = result
+                for x in result[2]:
+                    if x.origin not in queued and x.origin not in lst:
+                        queued.add(x.origin)
+                        pending.append((x.origin, x.parent))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    visited = set()
+
+    def enter(file: str, package: str):
+        if file in lst or file in visited:
+            return None
+        visited.add(file)
+        if file not in found or found[file][0] != package:  # first reached through another package than in the scan
+            found[file] = scan(file, package)
+        _, has_entry, imported = found[file]
+        if has_entry:
+            lst[file] = []
+        return iter(imported)
+
+    for root, root_package in roots:
+        it = enter(root, root_package)
+        stack = [] if it is None else [(root, it)]
+        while len(stack) > 0:
+            file, it = stack[-1]
+            spec = next(it, None)
+            if spec is None:
+                stack.pop()
+                continue
+            lst[file].append(spec.origin)
+            it = enter(spec.origin, spec.parent)
+            if it is not None:
+                stack.append((spec.origin, it))
+
+
+def get_dependency_tree(start: str, sources: SourceCache | None = None, jobs: int = 1):
+    """
+    Crawls the files a file imports, transitively
+    :param start: The file to start at
+    :param sources: The cache to read and parse files through, or None to use a new one. Pass the one the files will
+    be obfuscated from, so they are only read and parsed once
+    :param jobs: How many threads to read, parse and resolve files with. The tree is the same either way
+    :return: file : imported files pairs. Files that don't import anything aren't included as keys
+    """
+    if sources is None:
+        sources = SourceCache()
     resolved_files = {}
     ns = os.path.dirname(os.path.abspath(start))
-    path = [ns]
-    with open(start, "r", encoding="utf8") as f:
-        _walk_deptree(ns, os.path.abspath(start), "", path, ast.parse(f.read()), resolved_files)
+    _crawl(ns, [(os.path.abspath(start), "")], resolved_files, sources, ImportResolver([ns]), jobs)
     return resolved_files
 
 
+def update_dependency_tree(start: str, deptree: dict[str, list[str]], changed: list[str], sources: SourceCache):
+    """
+    Re-resolves the imports of changed files, in a tree returned by get_dependency_tree. Files that are newly imported
+    by them are crawled as well, everything else is kept as it is
+    :param start: The file the tree was crawled from
+    :param deptree: The tree to update, in place
+    :param changed: The changed files
+    :param sources: The cache to read and parse files through. Changed files are read again, since their stat
+    signature changed
+    :return: Nothing
+    """
+    ns = os.path.dirname(os.path.abspath(start))
+    for x in changed:
+        deptree.pop(x, None)
+    roots = []
+    for x in changed:
+        package = os.path.relpath(os.path.dirname(x), ns).replace(os.path.sep, ".")
+        roots.append((x, "" if package == "." else package))
+    _crawl(ns, roots, deptree, sources, ImportResolver([ns]))
+
+
 def strip_lnotab(c: CodeType) -> CodeType:
     consts = []
     for item in c.co_consts:
@@ -0,0 +1,170 @@
+import ast
+import os.path
+import subprocess
+import sys
+
+import pytest
+
+import pyobf2.lib as obf
+from pyobf2.lib.util import NonEscapingUnparser
+
+# A small project: a main file, a package, and a module importing from both, using the constructs the
+# transformers rewrite (type hints, f-strings, attribute sets, ints, cross-file names)
+PROJECT = {
+    "main.py": """
+from pkg.util import Counter, greet
+from pkg.shapes import Square, area
+
+
+def run(n: int) -> list[str]:
+    c = Counter(3)
+    out: list[str] = []
+    for i in range(n):
+        c.count = c.count + i * 2
+        out.append(f"{greet('w' + str(i))} {c.count:>4} {area(Square(i)):.1f}")
+    return out
+
+
+if __name__ == "__main__":
+    print("\\n".join(run(5)))
+""",
+    "pkg/__init__.py": "",
+    "pkg/util.py": """
+class Counter:
+    def __init__(self, start: int):
+        self.count = start
+
+
+def greet(name: str) -> str:
+    return f"hello {name}, {len(name) ** 2}"
+""",
+    "pkg/shapes.py": """
+from pkg.util import Counter
+
+
+class Square:
+    def __init__(self, side: float):
+        self.side = side
+        self.counter = Counter(side)
+
+
+def area(s: Square) -> float:
+    return s.side * s.side + 0.5
+""",
+}
+
+# A project whose imports all point at packages, the only modules get_file_from_import resolves (besides names in
+# them): a main file, a file nothing imports, and two packages, one importing the other
+PACKAGES = {
+    "main.py": """
+import shapes
+import util
+""",
+    "lone.py": "x = 1\n",
+    "util/__init__.py": """
+class Counter:
+    def __init__(self, start: int):
+        self.count = start
+""",
+    "shapes/__init__.py": """
+from util import Counter
+
+
+class Square:
+    def __init__(self, side: float):
+        self.side = side
+        self.counter = Counter(side)
+""",
+}
+
+# Transformers whose output doesn't depend on random numbers, so two runs can be compared
+deterministic_transformers = {
+    "removeTypeHints.enabled": True,
+    "fstrToFormatSeq.enabled": True,
+    "intObfuscator.enabled": True,
+    "intObfuscator.mode": "bits",
+    "replaceAttribSet.enabled": True,
+}
+
+
+@pytest.fixture
+def config():
+    """
+    Sets configuration keys for one test. Every transformer starts out disabled, and the previous configuration is
+    restored afterwards
+    """
+    before = obf.get_current_config()
+    for x in obf.all_config_segments:
+        if "enabled" in x.keys():
+            x["enabled"].value = False
+
+    yield obf.set_config_dict
+
+    for x in obf.all_config_segments:
+        for v in x.keys():
+            x[v].value = before[f"{x.name}.{v}"]
+
+
+@pytest.fixture
+def project(tmp_path) -> list[str]:
+    """
+    Writes PROJECT to a temporary directory
+    :return: The paths of its files, main.py first
+    """
+    return _write(tmp_path / "proj", PROJECT)
+
+
+def _write(root, files: dict[str, str]) -> list[str]:
+    out = []
+    for name, source in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source, encoding="utf8")
+        out.append(os.path.abspath(path))
+    return out
+
+
+@pytest.fixture
+def packages(tmp_path) -> list[str]:
+    """
+    Writes PACKAGES to a temporary directory
+    :return: The paths of its files, main.py first
+    """
+    return _write(tmp_path / "packages", PACKAGES)
+
+
+@pytest.fixture
+def deterministic() -> dict:
+    """
+    :return: A configuration whose output doesn't depend on random numbers, so two runs can be compared
+    """
+    return dict(deterministic_transformers)
+
+
+def obfuscate_batch(files: list[str], **kwargs) -> list[str]:
+    """
+    Obfuscates files as one batch with do_obfuscation_batch_ast
+    :param files: The files
+    :param kwargs: Passed to do_obfuscation_batch_ast
+    :return: The obfuscated sources, in the order of files
+    """
+    asts = []
+    for x in files:
+        with open(x, encoding="utf8") as f:
+            asts.append(ast.parse(f.read(), x))
+    out = {}
+    for event in obf.do_obfuscation_batch_ast(asts, files, **kwargs):
+        if event["transformer"] is None:
+            out[event["file_index"]] = NonEscapingUnparser().visit(event["ast"])
+    return [out[i] for i in range(len(files))]
+
+
+def run_main(directory: str) -> str:
+    """
+    :return: What main.py in a directory prints
+    """
+    result = subprocess.run(
+        [sys.executable, "main.py"], cwd=directory, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout
@@ -0,0 +1,102 @@
+import ast
+import asyncio
+import os.path
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+import pyobf2.lib as obf
+from pyobf2.lib import aio
+from pyobf2.lib.aio import do_obfuscation_batch_async, obfuscate_files_async
+from pyobf2.lib.util import NonEscapingUnparser
+from conftest import obfuscate_batch
+
+
+def parse(files: list[str]) -> list[ast.AST]:
+    asts = []
+    for x in files:
+        with open(x, encoding="utf8") as f:
+            asts.append(ast.parse(f.read(), x))
+    return asts
+
+
+def summarize(events) -> list[tuple]:
+    return [
+        (x["file_index"], x["transformer"], NonEscapingUnparser().visit(x["ast"]) if "ast" in x else None)
+        for x in events
+    ]
+
+
+@pytest.mark.parametrize("enabled", [{}, {"removeTypeHints.enabled": True}, {"renamer.enabled": True}])
+def test_events_match_sync(config, project, enabled):
+    config(enabled)
+
+    async def collect():
+        return [x async for x in do_obfuscation_batch_async(parse(project), project)]
+
+    expected = summarize(obf.do_obfuscation_batch_ast(parse(project), project))
+    assert summarize(asyncio.run(collect())) == expected
+    assert sorted(x[0] for x in expected if x[1] is None) == list(range(len(project)))
+
+
+def test_process_pool_matches_sequential(config, deterministic, project, tmp_path):
+    config(deterministic)
+    root = os.path.dirname(project[0])
+    with ProcessPoolExecutor(2) as pool:
+        outputs = asyncio.run(obfuscate_files_async(project, str(tmp_path / "out"), pool))
+    assert list(outputs) == project
+    for file, source in zip(project, obfuscate_batch(project)):
+        assert outputs[file] == os.path.join(tmp_path, "out", os.path.relpath(file, root))
+        with open(outputs[file], encoding="utf8") as f:
+            assert f.read() == source
+
+
+def test_thread_pool_matches_sequential(config, deterministic, project, tmp_path):
+    config(deterministic)
+    with ThreadPoolExecutor(4) as pool:
+        outputs = asyncio.run(obfuscate_files_async(project, str(tmp_path / "out"), pool))
+    for file, source in zip(project, obfuscate_batch(project)):
+        with open(outputs[file], encoding="utf8") as f:
+            assert f.read() == source
+
+
+def test_timeout_waits_for_running_writes(config, deterministic, project, tmp_path, monkeypatch):
+    config(deterministic)
+    returned = threading.Event()
+    late = []
+
+    def slow_write(path: str, content: str):
+        time.sleep(0.3)
+        write_atomic(path, content)
+        late.append(returned.is_set())
+
+    write_atomic = aio._write_atomic
+    monkeypatch.setattr(aio, "_write_atomic", slow_write)
+
+    async def run():
+        with pytest.raises(TimeoutError):
+            await obfuscate_files_async(project, str(tmp_path / "out"), timeout=0.1)
+        returned.set()
+        await asyncio.sleep(0.5)  # the loop keeps running, as it would in an application
+
+    asyncio.run(run())
+    assert len(late) > 0 and not any(late)
+
+
+def test_no_files(config, deterministic, tmp_path):
+    config(deterministic)
+    assert asyncio.run(obfuscate_files_async([], str(tmp_path / "out"))) == {}
+
+
+@pytest.mark.skipif(os.name != "posix", reason="file modes")
+def test_writes_get_the_mode_of_open(tmp_path):
+    path = str(tmp_path / "new.py")
+    aio._write_atomic(path, "x = 1\n")
+    with open(tmp_path / "reference.py", "w"):
+        pass
+    assert os.stat(path).st_mode == os.stat(tmp_path / "reference.py").st_mode
+    os.chmod(path, 0o640)
+    aio._write_atomic(path, "x = 2\n")  # replacing a file keeps its mode
+    assert os.stat(path).st_mode & 0o777 == 0o640
@@ -0,0 +1,152 @@
+import dis
+import opcode
+
+import pytest
+
+from pyobf2.lib.assembler import Assembler
+
+
+def _returning(value) -> Assembler:
+    a = Assembler()
+    a.insn("RESUME")
+    a.insn("LOAD_CONST", a.consts_create_or_get(value))
+    a.insn("RETURN_VALUE")
+    return a
+
+
+def test_packed_code_runs():
+    a = _returning(123)
+    assert a.stack_size() == 1
+    assert eval(a.pack_code_object()) == 123
+
+
+def test_stack_size_follows_jumps():
+    a = Assembler()
+    a.insn("RESUME")
+    a.insn("LOAD_CONST", a.consts_create_or_get(True))
+    a.insn("POP_JUMP_FORWARD_IF_TRUE", 2)  # to the second LOAD_CONST
+    a.insn("LOAD_CONST", a.consts_create_or_get(1))
+    a.insn("RETURN_VALUE")
+    a.insn("LOAD_CONST", a.consts_create_or_get(2))
+    a.insn("RETURN_VALUE")
+    assert a.stack_depths() == [0, 0, 1, 0, 1, 0, 1]
+    assert eval(a.pack_code_object()) == 2
+
+
+def test_rejects_stack_underflow():
+    a = Assembler()
+    a.insn("RESUME")
+    a.insn("POP_TOP")
+    a.insn("LOAD_CONST", a.consts_create_or_get(None))
+    a.insn("RETURN_VALUE")
+    with pytest.raises(ValueError, match="underflow"):
+        a.stack_depths()
+
+
+def test_rejects_running_off_the_end():
+    a = Assembler()
+    a.insn("RESUME")
+    a.insn("NOP")
+    with pytest.raises(ValueError, match="runs off the end"):
+        a.stack_depths()
+
+
+def test_rejects_exception_entry_deeper_than_the_stack():
+    a = Assembler()
+    a.insn("RESUME")
+    start = a.current_bytecode_index()
+    a.insn("NOP")
+    end = a.current_bytecode_index()
+    a.insn("LOAD_CONST", a.consts_create_or_get(None))
+    a.insn("RETURN_VALUE")
+    handler = a.current_bytecode_index()
+    a.insn("POP_TOP")
+    a.insn("LOAD_CONST", a.consts_create_or_get(None))
+    a.insn("RETURN_VALUE")
+    a.add_exception_table_span(start, end, handler, 0, False)
+    assert a.stack_depths()[-3:] == [1, 0, 1]
+    a._exctable.clear()
+    a.add_exception_table_span(start, end, handler, 2, False)  # nothing is on the stack at the NOP
+    with pytest.raises(ValueError, match="only 0 deep"):
+        a.stack_depths()
+
+
+def test_rejects_handler_inside_an_insn():
+    a = Assembler()
+    a.insn("RESUME")
+    a.insn("LOAD_CONST", a.consts_create_or_get(1))
+    a.insn("LOAD_CONST", a.consts_create_or_get(2))
+    a.insn("BINARY_OP", 0)  # followed by a cache entry
+    a.insn("RETURN_VALUE")
+    add = a._insns[3]
+    assert opcode.opname[add.opc] == "BINARY_OP" and add.size > 2
+    assert eval(a.pack_code_object()) == 3
+    a.add_exception_table_span(0, add.offset, add.offset + 2, 0, False)
+    with pytest.raises(ValueError, match="not the start of an insn"):
+        a.stack_depths()
+
+
+def test_exception_table_far_into_the_code():
+    a = Assembler()
+    a.insn("RESUME")
+    for _ in range(511):  # the try block starts at code unit 512, whose lowest varint group is 0
+        a.insn("NOP")
+    with a.try_block(0, False):
+        a.insn("LOAD_CONST", a.consts_create_or_get(1))
+        a.insn("LOAD_CONST", a.consts_create_or_get(0))
+        a.insn("BINARY_OP", 11)  # 1 / 0
+        a.insn("RETURN_VALUE")
+    a.insn("POP_TOP")
+    a.insn("LOAD_CONST", a.consts_create_or_get("caught"))
+    a.insn("RETURN_VALUE")
+    code = a.pack_code_object()
+    (entry,) = dis._parse_exception_table(code)
+    assert (entry.start, entry.end, entry.target, entry.depth, entry.lasti) == (1024, 1034, 1034, 0, False)
+    assert eval(code) == "caught"
+
+
+def test_line_table():
+    a = Assembler()
+    a.insn("RESUME")
+    a.set_line(10)
+    for _ in range(10):  # longer than one line table entry
+        a.insn("NOP")
+    a.set_line(7)
+    a.insn("LOAD_CONST", a.consts_create_or_get(None))
+    a.set_line(None)
+    a.insn("RETURN_VALUE")
+    code = a.pack_code_object()
+    assert code.co_firstlineno == 10
+    lines = {}
+    for start, end, line in code.co_lines():
+        for x in range(start, end, 2):
+            lines[x] = line
+    assert [lines[x.offset] for x in a._insns] == [None, *[10] * 10, 7, None]
+    assert eval(code) is None
+
+
+def test_no_line_table_without_lines():
+    code = _returning(1).pack_code_object()
+    assert code.co_firstlineno == 0 and code.co_linetable == b""
+
+
+# equal, but different constants, like the compiler keeps them
+DISTINCT_CONSTANTS = [0, False, 0.0, -0.0, 0j, -0j, 1, True, 1.0, (0,), (False,), (0.0,), (-0.0,), ((0,),), ((False,),)]
+
+
+def test_equal_constants_stay_distinct():
+    a = Assembler()
+    indices = [a.consts_create_or_get(x) for x in DISTINCT_CONSTANTS]
+    assert indices == list(range(len(DISTINCT_CONSTANTS)))
+    assert [a.consts_create_or_get(x) for x in DISTINCT_CONSTANTS] == indices
+    assert a.consts_create_or_get(frozenset({0})) != a.consts_create_or_get(frozenset({False}))
+    assert a.consts_create_or_get([]) != a.consts_create_or_get([])  # only the same list can be reused
+
+
+@pytest.mark.parametrize("value", DISTINCT_CONSTANTS, ids=repr)
+def test_constants_load_as_themselves(value):
+    a = _returning(value)
+    for x in DISTINCT_CONSTANTS:  # everything else is in the pool as well
+        a.consts_create_or_get(x)
+    result = eval(a.pack_code_object())
+    assert type(result) is type(value) and repr(result) == repr(value)
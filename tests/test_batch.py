@@ -0,0 +1,72 @@
+import ast
+import os.path
+
+import pyobf2.lib as obf
+from conftest import obfuscate_batch, run_main
+
+
+def test_output_runs_like_the_source(config, deterministic, project, tmp_path):
+    config({**deterministic, "renamer.enabled": True})
+    root = os.path.dirname(project[0])
+    for file, source in zip(project, obfuscate_batch(project)):
+        out = tmp_path / "out" / os.path.relpath(file, root)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(source, encoding="utf8")
+    assert run_main(str(tmp_path / "out")) == run_main(root)
+
+
+def test_jobs_match_sequential(config, deterministic, project):
+    config({**deterministic, "renamer.enabled": True})
+    assert obfuscate_batch(project, jobs=2) == obfuscate_batch(project, jobs=1)
+
+
+def test_fused_matches_sequential(config, deterministic, project):
+    config({**deterministic, "renamer.enabled": True})
+    sequential = obfuscate_batch(project)
+    assert obfuscate_batch(project, fused=True) == sequential
+    assert obfuscate_batch(project, jobs=2, fused=True) == sequential
+
+
+def test_each_file_is_finished_once(config, deterministic, project):
+    config(deterministic)
+    for jobs in (1, 2):
+        asts = []
+        for x in project:
+            with open(x, encoding="utf8") as f:
+                asts.append(ast.parse(f.read(), x))
+        events = list(obf.do_obfuscation_batch_ast(asts, project, jobs))
+        finished = [x["file_index"] for x in events if x["transformer"] is None]
+        assert sorted(finished) == list(range(len(project)))
+
+
+def test_unparsed_sources_match(config, deterministic, project):
+    for enabled in ({**deterministic, "renamer.enabled": True}, {"renamer.enabled": True}):  # renamer in the middle, or last
+        config(enabled)
+        expected = obfuscate_batch(project)
+        for jobs in (1, 2):
+            asts = []
+            for x in project:
+                with open(x, encoding="utf8") as f:
+                    asts.append(ast.parse(f.read(), x))
+            sources = {}
+            for event in obf.do_obfuscation_batch_ast(asts, project, jobs, unparse=True):
+                if event["transformer"] is None:
+                    assert event["error"] is None
+                    sources[event["file_index"]] = event["source"]
+            assert [sources[i] for i in range(len(project))] == expected
+
+
+def test_pool_events_come_in_file_order(config, deterministic, project):
+    config(deterministic)
+    for ordered in (True, False):
+        asts = []
+        for x in project:
+            with open(x, encoding="utf8") as f:
+                asts.append(ast.parse(f.read(), x))
+        events = list(obf.do_obfuscation_batch_ast(asts, project, 2, ordered=ordered))
+        finished = [x["file_index"] for x in events if x["transformer"] is None]
+        if ordered:
+            assert finished == list(range(len(project)))
+            assert [x["file_index"] for x in events] == sorted(x["file_index"] for x in events)
+        else:
+            assert sorted(finished) == list(range(len(project)))
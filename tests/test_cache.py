@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from pyobf2.lib.cache import BuildCache
+from pyobf2.lib.util import get_dependency_tree
+
+
+def test_entries_round_trip(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"))
+    assert cache.get("ab" * 32) is None
+    source = "print('ä\\n')\n"
+    cache.put("ab" * 32, source)
+    assert cache.get("ab" * 32) == source
+    assert BuildCache(str(tmp_path / "cache")).get("ab" * 32) == source
+
+
+@pytest.mark.skipif(os.name != "posix", reason="file modes")
+def test_entries_get_the_mode_of_open(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"))
+    cache.put("ab" * 32, "x = 1\n")
+    with open(tmp_path / "reference.py", "w"):
+        pass
+    assert os.stat(cache._path_of("ab" * 32)).st_mode == os.stat(tmp_path / "reference.py").st_mode
+
+
+def test_keys_follow_imports(config, packages):
+    main, lone, util, shapes = packages
+    cache = BuildCache("unused")
+    deptree = get_dependency_tree(main)
+    before = cache.compute_keys(packages, deptree)
+    assert before == cache.compute_keys(packages, deptree)
+
+    with open(util, "a", encoding="utf8") as f:
+        f.write("\nX = 1\n")
+    after = cache.compute_keys(packages, get_dependency_tree(main))
+    # util changed, and main and shapes import it
+    assert after[util] != before[util]
+    assert after[shapes] != before[shapes]
+    assert after[main] != before[main]
+    assert after[lone] == before[lone]
+
+
+def test_keys_follow_the_configuration(config, project):
+    cache = BuildCache("unused")
+    deptree = get_dependency_tree(project[0])
+    before = cache.compute_keys(project, deptree)
+    config({"removeTypeHints.enabled": True})
+    assert cache.compute_keys(project, deptree)[project[0]] != before[project[0]]
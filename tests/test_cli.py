@@ -0,0 +1,45 @@
+import os.path
+
+import pyobf2.cli as cli
+
+
+def build(config, input_file: str, output_dir: str, cache_dir: str = "", include: list[str] | None = None):
+    config(
+        {
+            "general.input_file": input_file,
+            "general.output_file": output_dir,
+            "general.transitive": True,
+            "general.manual_include": include or [],
+            "general.cache_dir": cache_dir,
+        }
+    )
+    cli.go_transitive()
+
+
+def read_tree(directory) -> dict[str, str]:
+    out = {}
+    for root, _, files in os.walk(directory):
+        for x in files:
+            with open(os.path.join(root, x), encoding="utf8") as f:
+                out[os.path.relpath(os.path.join(root, x), directory)] = f.read()
+    return out
+
+
+def test_cached_rebuild_matches_clean_build(config, deterministic, project, tmp_path):
+    config({**deterministic, "renamer.enabled": True})
+    # nothing imports these, so they are the only files that change below. The absolute import only resolves
+    # relative to the directory of main.py
+    tools = tmp_path / "proj" / "tools"
+    tools.mkdir()
+    (tools / "a.py").write_text("from tools.b import double\n\nprint(double(2))\n", encoding="utf8")
+    (tools / "b.py").write_text("def double(v: int) -> int:\n    return v * 2\n", encoding="utf8")
+    include = [str(tools) + "/*"]
+    cached, cache = str(tmp_path / "cached"), str(tmp_path / "cache")
+    build(config, project[0], cached, cache, include)
+    for x in ("a.py", "b.py"):
+        with open(tools / x, "a", encoding="utf8") as f:
+            f.write("\nTRIPLE = 3\n")
+    build(config, project[0], cached, cache, include)
+
+    build(config, project[0], str(tmp_path / "clean"), include=include)
+    assert read_tree(cached) == read_tree(tmp_path / "clean")
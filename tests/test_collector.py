@@ -0,0 +1,110 @@
+import ast
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import pyobf2.lib as obf
+from pyobf2.lib.transformers.collector import Collector
+
+
+def load(collector: Collector):
+    """
+    :return: A new instance of the loader collector generates
+    """
+    env = {}
+    exec(compile(ast.fix_missing_locations(ast.Module([collector.create_loader()], [])), "", "exec"), env)
+    return env[collector.vname]
+
+
+def expression(source: str) -> bytes:
+    return b"\x00" + zlib.compress(source.encode("utf8"))
+
+
+@pytest.fixture
+def fast_switching():
+    before = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(before)
+
+
+def test_threads_share_a_loader(config, fast_switching):
+    config({"varCollector.cache_size": 2})
+    collector = Collector()
+    for _ in range(50):
+        loader = load(collector)  # a fresh one, so the threads race for its first access too
+        barrier = threading.Barrier(8)
+
+        def run(n: int) -> list:
+            barrier.wait(timeout=10)
+            x = n  # read by the expressions, through the frame
+            return [loader[expression(f"x + {i}")] for i in range(20)]
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(run, range(8)))
+        assert results == [[n + i for i in range(20)] for n in range(8)]
+
+
+def test_compiled_expressions_are_cached(config):
+    config({"varCollector.cache_size": 2})
+    loader = load(Collector())
+    x = 1
+    one, two, three = (expression(f"x + {i}") for i in (1, 2, 3))
+    assert loader[one] == 2 and loader[two] == 3
+    cache = loader.__dict__["compiled"]
+    code = cache[one]
+    assert loader[one] == 2 and loader[three] == 4  # 3 evicts 2, the least recently used one
+    assert list(cache) == [one, three]
+    assert cache[one] is code
+    x = 5
+    assert loader[one] == 6 and loader[two] == 7  # the cached code still reads the current value
+    assert list(cache) == [one, two]
+    assert cache[one] is code
+
+
+@pytest.mark.parametrize("error", [RuntimeError, StopIteration])
+def test_eviction_races_are_ignored(config, error):
+    # what the cache looks like when another thread changes it while it's iterated, or empties it first
+    class Racing(dict):
+        def __iter__(self):
+            raise error
+
+    config({"varCollector.cache_size": 1})
+    loader = load(Collector())
+    x = 1
+    assert loader[expression("x + 1")] == 2
+    loader.__dict__["compiled"] = Racing(loader.__dict__["compiled"])
+    assert loader[expression("x + 2")] == 3
+
+
+SCOPES = """
+g = 10
+
+def f(a):
+    b = 2
+    squares = [a * i + b for i in range(3)]
+    nested = [[i + j + g for j in range(2)] for i in range(2)]
+    adder = lambda k: k + a + b + g
+    inner = lambda: [adder(m) for m in range(2)]
+    total = sum(i * b for i in range(4))
+    late = {i: (lambda: i * a)() for i in range(2)}
+    return squares, nested, adder(1), inner(), total, late
+
+print(f(3))
+print([x + g for x in range(3)])
+exec("w = g + 1")
+print(w)
+"""
+
+
+def test_names_resolve_like_the_source(config, capsys):
+    config({"varCollector.enabled": True})
+    tree = obf.do_obfuscation_single_ast(ast.parse(SCOPES), "a.py")
+    assert not any(isinstance(x, ast.Name) and x.id == "g" and isinstance(x.ctx, ast.Load) for x in ast.walk(tree))
+    exec(SCOPES, {})
+    expected = capsys.readouterr().out
+    exec(compile(tree, "a.py", "exec"), {})
+    assert capsys.readouterr().out == expected
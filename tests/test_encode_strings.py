@@ -0,0 +1,87 @@
+import ast
+import sys
+
+import pytest
+
+import pyobf2.lib as obf
+
+SOURCE = """
+words = []
+for i in range(3):
+    words.append("hot " + str(i))
+    words.append(f"{i:>3} hot {'nested'!r}")
+    words.append(b"raw" * i)
+first = "hello world!"
+second = "hello world!"
+print(words, first, first == second)
+"""
+
+
+def obfuscate(source: str) -> ast.Module:
+    return obf.do_obfuscation_single_ast(ast.parse(source), "a.py")
+
+
+def run(tree: ast.AST) -> dict:
+    env = {}
+    exec(compile(tree, "a.py", "exec"), env)
+    return env
+
+
+@pytest.mark.parametrize("mode", ["b64lzma", "chararray", "xortable"])
+def test_decode_once_decodes_each_string_once(config, capsys, mode):
+    config({"encodeStrings.enabled": True, "encodeStrings.mode": mode, "encodeStrings.decode_once": True})
+    tree = obfuscate(SOURCE)
+    (table,) = [x for x in tree.body if isinstance(x, ast.Assign) and isinstance(x.value, ast.List) and x.value.elts]
+    interned, *rest = table.value.elts  # *map(sys.intern, [strs]), then the bytes
+    assert len(interned.value.args[1].elts) == 5  # "hot ", ">3", " hot ", "nested", "hello world!"
+    assert len(rest) == 1  # b"raw"
+    table_name = table.targets[0].id
+    uses = [x for x in ast.walk(tree) if isinstance(x, ast.Subscript) and getattr(x.value, "id", None) == table_name]
+    assert len(uses) == 7
+    run(ast.parse(SOURCE))
+    expected = capsys.readouterr().out
+    env = run(tree)
+    assert capsys.readouterr().out == expected
+    assert env["first"] is env["second"] is sys.intern(env["first"])
+
+
+XORTABLE_SOURCE = """
+long = "päckchen " * 2000
+everything = bytes(range(256)) * 3
+i = 7
+formatted = f"{i:>{'4'}} xored {'inner'!r} {f'{i}deeper'} tail"
+print(len(long), long[-20:], everything[250:260], formatted)
+"""
+
+
+def test_xortable_encodes_any_length_and_fstrings(config, capsys):
+    config({"encodeStrings.enabled": True, "encodeStrings.mode": "xortable"})
+    strings = [x for x in ast.walk(ast.parse(XORTABLE_SOURCE)) if isinstance(x, ast.Constant) and type(x.value) is str]
+    tree = obfuscate(XORTABLE_SOURCE)
+    constants = [x.value for x in ast.walk(tree) if isinstance(x, ast.Constant)]
+    assert "päckchen " not in constants and "inner" not in constants and " tail" not in constants
+    (decoder,) = [x for x in tree.body if isinstance(x, ast.FunctionDef)]
+    calls = [x for x in ast.walk(tree) if isinstance(x, ast.Call) and getattr(x.func, "id", None) == decoder.name]
+    assert len(calls) == len(strings)  # none per character
+    run(ast.parse(XORTABLE_SOURCE))
+    expected = capsys.readouterr().out
+    env = run(tree)
+    assert capsys.readouterr().out == expected
+    assert env["long"] == "päckchen " * 2000
+    assert env["everything"] == bytes(range(256)) * 3
+
+
+def test_b64lzma_calls_one_decoder_per_variant(config, capsys):
+    config({"encodeStrings.enabled": True, "encodeStrings.mode": "b64lzma"})
+    strings = [x for x in ast.walk(ast.parse(SOURCE)) if isinstance(x, ast.Constant) and type(x.value) in (str, bytes)]
+    tree = obfuscate(SOURCE)
+    # str and bytes, compressed, and str in fstrings
+    decoders = {x.name for x in tree.body if isinstance(x, ast.FunctionDef)}
+    assert len(decoders) == 3
+    calls = [x for x in ast.walk(tree) if isinstance(x, ast.Call) and getattr(x.func, "id", None) in decoders]
+    assert len(calls) == len(strings)
+    assert all(len(x.args) == 1 and isinstance(x.args[0], ast.Constant) for x in calls)
+    run(ast.parse(SOURCE))
+    expected = capsys.readouterr().out
+    run(tree)
+    assert capsys.readouterr().out == expected
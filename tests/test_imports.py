@@ -0,0 +1,36 @@
+import os.path
+
+import pytest
+
+from pyobf2.lib.util import ImportResolver, Imported, get_dependency_tree, get_file_from_import
+
+
+@pytest.fixture
+def root(packages) -> str:
+    return os.path.dirname(packages[0])
+
+
+@pytest.mark.parametrize(
+    "name, parent, file, package",
+    [
+        ("util", "", "util/__init__.py", "util"),
+        ("shapes", "", "shapes/__init__.py", "shapes"),
+        (".", "util", "util/__init__.py", "util"),
+    ],
+)
+def test_resolves_packages(root, name, parent, file, package):
+    expected = Imported(os.path.join(root, file), package)
+    assert get_file_from_import(name, parent, [root]) == expected
+    assert ImportResolver([root]).resolve(name, parent) == expected
+
+
+@pytest.mark.parametrize("name", ["missing", "util.missing.deeper", "json"])
+def test_unresolved_modules(root, name):
+    assert get_file_from_import(name, "", [root]) is None
+    assert ImportResolver([root]).resolve(name, "") is None
+
+
+def test_dependency_tree(packages):
+    main, _, util, shapes = packages
+    tree = get_dependency_tree(main)
+    assert tree == {main: [shapes, util], shapes: [util]}
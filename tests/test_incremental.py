@@ -0,0 +1,55 @@
+import os.path
+
+from pyobf2.lib import sources as sources_module
+from pyobf2.lib.incremental import IncrementalBuild
+
+
+def touch(path: str, text: str):
+    with open(path, "a", encoding="utf8") as f:
+        f.write(text)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))  # a change the stat signature shows
+
+
+def test_only_changed_files_are_parsed_again(config, deterministic, packages, tmp_path, monkeypatch):
+    config({**deterministic, "renamer.enabled": True})
+    main, lone, util, _ = packages
+    build = IncrementalBuild(main, str(tmp_path / "out"), [lone])
+    build.build()
+    parsed = []
+    parse = sources_module.parse
+    monkeypatch.setattr(sources_module, "parse", lambda src, name: parsed.append(name) or parse(src, name))
+
+    touch(util, "\nX = 1\n")
+    changed, deleted = build.poll()
+    assert changed == [util] and deleted == []
+    written = build.build(changed)
+    assert parsed == [util]  # the files importing it are rebuilt from the ASTs kept since the first build
+    assert written == [build.output_path(util)]  # X doesn't change what the others are obfuscated to
+
+
+def test_outputs_of_deleted_files_are_deleted(config, deterministic, packages, tmp_path):
+    config(deterministic)
+    main, lone, _, _ = packages
+    build = IncrementalBuild(main, str(tmp_path / "out"), [lone])
+    build.build()
+    out = build.output_path(lone)
+    assert os.path.isfile(out)
+    os.remove(lone)
+    assert build.poll() == ([], [out])
+    assert not os.path.exists(out)
+    assert lone not in build.files
+
+
+def test_one_pool_per_session(config, deterministic, packages, tmp_path):
+    config(deterministic)
+    main, _, util, _ = packages
+    build = IncrementalBuild(main, str(tmp_path / "out"), [], jobs=2)
+    try:
+        build.build()
+        pool = build.pool
+        touch(util, "\nX = 1\n")
+        build.build(build.poll()[0])
+        assert build.pool is pool
+    finally:
+        build.close()
+    assert build.pool is None
@@ -0,0 +1,20 @@
+import ast
+
+from pyobf2.lib.inmemory import obfuscate_sources
+from pyobf2.lib.util import NonEscapingUnparser
+
+# ast.unparse escapes the zero width space, NonEscapingUnparser keeps it as it is
+SOURCE = 'print(f"{1!r}\\u200b", "\\u200b")\n'
+
+
+def test_no_transformers_use_the_non_escaping_unparser(config):
+    config({})
+    result = obfuscate_sources({"a.py": SOURCE})["a.py"]
+    assert result.source == NonEscapingUnparser().visit(ast.parse(SOURCE))
+    assert "\u200b" in result.source
+    exec(result.code, {})
+
+
+def test_no_sources(config):
+    config({})
+    assert obfuscate_sources({}) == {}
@@ -0,0 +1,50 @@
+import ast
+
+import pytest
+
+from pyobf2.lib.mappingstore import MappingStore
+from pyobf2.lib.renamer import MappingGenerator
+
+
+def test_names_are_kept_per_module(tmp_path):
+    store = MappingStore(str(tmp_path / "store" / "names.db"))
+    with store.bindings("a.py") as known:
+        assert known == {}
+        known.update({".x": "var0", ".f": "method0"})
+    with store.bindings("b.py") as known:
+        assert known == {}
+        known[".x"] = "var5"
+    store.close()
+
+    store = MappingStore(str(tmp_path / "store" / "names.db"))
+    with store.bindings("a.py") as known:
+        assert known == {".x": "var0", ".f": "method0"}
+        known[".x"] = "changed"  # only new keys are stored
+        known[".y"] = "var1"
+    with store.bindings("a.py") as known:
+        assert known == {".x": "var0", ".f": "method0", ".y": "var1"}
+    with store.bindings("b.py") as known:
+        assert known == {".x": "var5"}
+    store.close()
+
+
+def test_nothing_is_stored_if_the_block_raises(tmp_path):
+    store = MappingStore(str(tmp_path / "names.db"))
+    with pytest.raises(ValueError):
+        with store.bindings("a.py") as known:
+            known[".x"] = "var0"
+            raise ValueError("failed")
+    with store.bindings("a.py") as known:
+        assert known == {}
+    store.close()
+
+
+def test_generator_reuses_known_names():
+    known = {".x": "var7", "mt_f.a": "var0"}
+    generator = MappingGenerator("f'{kind}{get_counter(kind)}'", known)
+    generator.go(ast.parse("y = 1\nx = 2\ndef f(a):\n    b = a\n"))
+    assert generator.mappings[".x"] == "var7"
+    assert generator.mappings["mt_f.a"] == "var0"
+    new = [v for (k, v) in generator.mappings.items() if k not in known]
+    assert len(new) > 0
+    assert not set(new) & set(known.values())
@@ -0,0 +1,66 @@
+import ast
+import json
+import os
+
+import pyobf2.lib as obf
+from pyobf2.lib.profiler import Profiler, count_nodes
+
+
+def parse(files: list[str]) -> list[ast.AST]:
+    asts = []
+    for x in files:
+        with open(x, encoding="utf8") as f:
+            asts.append(ast.parse(f.read(), x))
+    return asts
+
+
+def test_records_each_transformer_and_file(config, deterministic, project, tmp_path):
+    config(deterministic)
+    profiler = Profiler()
+    profiler.start()
+    asts = parse(project)
+    nodes = sum(count_nodes(x) for x in asts)
+    list(obf.do_obfuscation_batch_ast(asts, project, profiler=profiler))
+    profiler.stop()
+
+    enabled = [x.name for x in obf.all_transformers if x.config["enabled"].value]
+    rows = profiler.summary()
+    assert [(x["cat"], x["name"], x["count"]) for x in rows] == [("transform", x, len(project)) for x in enabled]
+    assert rows[0]["nodes_before"] == nodes
+    assert rows[-1]["nodes_after"] == sum(count_nodes(x) for x in asts)
+    assert all(x["peak_kib"] is not None for x in rows)
+    assert sorted({x["args"]["file"] for x in profiler.events}) == sorted(project)
+
+    profiler.write_chrome_trace(str(tmp_path / "trace.json"))
+    with open(tmp_path / "trace.json", encoding="utf8") as f:
+        trace = json.load(f)
+    assert trace["traceEvents"] == json.loads(json.dumps(profiler.events))
+    assert all(x["ph"] == "X" and x["dur"] >= 0 for x in trace["traceEvents"])
+
+
+def test_merges_worker_processes(config, deterministic, project):
+    config(deterministic)
+    profiler = Profiler(trace_memory=False)
+    list(obf.do_obfuscation_batch_ast(parse(project), project, jobs=2, fused=True, profiler=profiler))
+    (row,) = profiler.summary()
+    assert row["count"] == len(project)
+    assert "+" in row["name"]  # the fused group, as one step
+    assert all(x["pid"] != os.getpid() for x in profiler.events)
+
+
+def test_nested_spans_hand_their_peak_up():
+    profiler = Profiler()
+    profiler.start()
+    try:
+        with profiler.span("outer", "test"):
+            with profiler.span("inner", "test"):
+                data = bytearray(1 << 20)
+            del data
+            with profiler.span("after", "test"):
+                pass
+    finally:
+        profiler.stop()
+    peaks = {x["name"]: x["args"]["peak_kib"] for x in profiler.events}
+    assert peaks["inner"] >= 1024
+    assert peaks["outer"] >= peaks["inner"]
+    assert peaks["after"] < 1024
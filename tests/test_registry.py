@@ -0,0 +1,41 @@
+import pickle
+import subprocess
+import sys
+
+from pyobf2.lib.registry import LazyTransformer, get_transformer_info, transformer_infos
+
+# checked in a fresh interpreter: importing the library, and reading names and config, imports no implementation
+_FRESH = """
+import sys
+import pyobf2.lib as obf
+names = [x.name for x in obf.all_transformers]
+enabled = [x.config["enabled"].value for x in obf.all_transformers]
+assert not any(x.startswith("pyobf2.lib.transformers.") for x in sys.modules), sorted(sys.modules)
+assert not any(x.loaded for x in obf.all_transformers)
+assert "rich" not in sys.modules and "concurrent.futures.process" not in sys.modules
+print(len(names))
+"""
+
+
+def test_library_import_loads_no_transformer():
+    r = subprocess.run([sys.executable, "-c", _FRESH], capture_output=True, text=True)
+    assert r.returncode == 0, r.stderr
+    assert int(r.stdout) == len(transformer_infos)
+
+
+def test_loads_on_first_use():
+    info = get_transformer_info("removeTypeHints")
+    lazy = LazyTransformer(info)
+    assert not lazy.loaded
+    assert lazy.node_types  # forwarded to the implementation
+    assert lazy.loaded
+    assert type(lazy.instance).__name__ == info.class_name
+    # the implementation shares the config segment of the registry
+    assert lazy.instance.config is info.config is lazy.config
+
+
+def test_stand_ins_pickle_without_loading():
+    lazy = LazyTransformer(get_transformer_info("unicodeTransformer"))
+    copy = pickle.loads(pickle.dumps(lazy))
+    assert copy.name == lazy.name
+    assert not copy.loaded and not lazy.loaded
@@ -0,0 +1,191 @@
+import ast
+import os.path
+import sqlite3
+
+import pytest
+
+import pyobf2.lib as obf
+from pyobf2.lib.renamer import MappingApplicator, MappingGenerator, ScopeTable
+from pyobf2.lib.transformers import compute_import_path
+from pyobf2.lib.transformers.memberRenamerTransformer import ImportIndex
+from conftest import obfuscate_batch, run_main
+
+
+def stored_modules(store: str) -> set[str]:
+    with sqlite3.connect(store) as con:
+        return {x for (x,) in con.execute("SELECT DISTINCT module FROM mappings")}
+
+
+def test_subset_batch_reuses_stored_names(config, project, tmp_path):
+    root = os.path.dirname(project[0])
+    store = str(tmp_path / "names.db")
+    config({"renamer.enabled": True, "renamer.mapping_store": store, "renamer.project_root": root})
+    util = project[2]
+    before = obfuscate_batch(project)[2]
+
+    # a new function in front of the others would take their names, if they weren't stored
+    with open(util, encoding="utf8") as f:
+        source = f.read()
+    with open(util, "w", encoding="utf8") as f:
+        f.write("def first():\n    return 1\n" + source)
+    after = obfuscate_batch([util])[0]
+    assert before in after
+    assert stored_modules(store) == {"main.py", "pkg/util.py", "pkg/shapes.py"}
+
+
+def test_single_files_are_stored_by_their_path(config, project, tmp_path):
+    root = os.path.dirname(project[0])
+    store = str(tmp_path / "names.db")
+    config({"renamer.enabled": True, "renamer.mapping_store": store, "renamer.project_root": root})
+    for x in (project[2], project[3]):
+        with open(x, encoding="utf8") as f:
+            obf.do_obfuscation_single_ast(ast.parse(f.read()), x)
+    assert stored_modules(store) == {"pkg/util.py", "pkg/shapes.py"}
+
+
+def test_store_is_closed_after_each_batch(config, project, tmp_path):
+    config({"renamer.enabled": True, "renamer.mapping_store": str(tmp_path / "names.db")})
+    renamer = next(x for x in obf.all_transformers if x.name == "renamer").instance
+    obfuscate_batch(project)
+    assert renamer.store._connection is None
+    with open(project[2], encoding="utf8") as f:
+        obf.do_obfuscation_single_ast(ast.parse(f.read()), project[2])
+    assert renamer.store._connection is None
+
+
+def test_scope_table_resolves_to_the_innermost_mapping():
+    table = ScopeTable()
+    table.put_if_absent([], "x", "a")
+    table.put_if_absent(["mt_f"], "x", "b")
+    table.put_if_absent(["mt_f"], "x", "c")  # the first one stays
+    table.put_if_absent(["mt_f", "mt_g"], "y", "d")
+    assert table.lookup([], "x") == "a"
+    assert table.lookup(["mt_f"], "x") == "b"
+    assert table.lookup(["mt_f", "mt_g"], "x") == "b"
+    assert table.lookup(["mt_f", "mt_g"], "y") == "d"
+    assert table.lookup(["mt_f"], "y") == "y"
+    assert table.lookup(["mt_h", "mt_g"], "x") == "a"  # unknown scopes see their parents
+    assert table.lookup(["mt_f"], "z") == "z"
+
+
+def test_scope_table_from_generated_mappings():
+    generator = MappingGenerator('f"{kind}{get_counter(kind)}"')
+    source = "x = 1\ndef f(a):\n    x = a\n    return [x for y in a]\nclass C:\n    def m(self):\n        pass"
+    generator.go(ast.parse(source))
+    table = ScopeTable.from_mappings(generator.mappings)
+    for key, new in generator.mappings.items():
+        loc, name = key.split(".")
+        location = loc.split("|") if loc != "" else []
+        assert table.lookup(location, name) == generator.scopes.lookup(location, name) == new
+    assert table.lookup(["mt_f", "sp_lc"], "x") == generator.mappings["mt_f.x"]
+    assert table.lookup(["cl_C", "mt_m"], "x") == generator.mappings[".x"]
+
+
+SHORT_SOURCE = """
+def rare(n):
+    return n + 1
+
+def busy(v):
+    return v * 2
+
+a = busy(busy(busy(rare(1))))
+print(a, busy(a))
+"""
+
+
+def renamed(fmt: str, source: str) -> tuple[dict[str, str], str]:
+    tree = ast.parse(source)
+    generator = MappingGenerator(fmt)
+    generator.go(tree)
+    MappingApplicator(generator.mappings).visit(tree)
+    return generator.mappings, ast.unparse(tree)
+
+
+def test_short_format_gives_the_most_used_names_the_shortest_identifiers(capsys):
+    mappings, output = renamed("short", SHORT_SOURCE)
+    assert mappings[".busy"] == "b"  # a is taken by the source
+    assert "a" not in mappings.values()
+    assert {len(x) for x in mappings.values()} == {1}
+    assert renamed("short", SHORT_SOURCE) == (mappings, output)
+    exec(output, {})
+    exec(SHORT_SOURCE, {})
+    first, second = capsys.readouterr().out.splitlines()
+    assert first == second
+
+
+def test_native_formats_match_evaluated_ones():
+    evaluated = renamed("kind + str(get_counter(kind))", SHORT_SOURCE)
+    assert renamed('f"{kind}{get_counter(kind)}"', SHORT_SOURCE) == evaluated
+    assert renamed("f'{kind}{get_counter(kind)}'", SHORT_SOURCE) == evaluated
+    assert renamed('f"{kind[0]}{get_counter(kind)}"', SHORT_SOURCE) == renamed(
+        "kind[0] + str(get_counter(kind))", SHORT_SOURCE
+    )
+
+
+IMPORTING = {
+    "main.py": 'import pkg.sibling\nimport pkg.util\n\nprint(pkg.util.greet("a"), pkg.sibling.run())\n',
+    "pkg/__init__.py": "",
+    "pkg/util.py": 'def greet(name):\n    return "hello " + name\n',
+    "pkg/sibling.py": 'from pkg.util import greet\n\n\ndef run():\n    return greet("b")\n',
+    "pkg/alone.py": "def greet(name):\n    return name\n",
+}
+
+
+@pytest.fixture
+def importing(tmp_path) -> list[str]:
+    """
+    Writes IMPORTING to a temporary directory
+    :return: The paths of its files, in the order of IMPORTING
+    """
+    files = []
+    for name, source in IMPORTING.items():
+        path = tmp_path / "imp" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source, encoding="utf8")
+        files.append(str(path))
+    return files
+
+
+def test_import_index_finds_the_importing_files(importing):
+    asts = [ast.parse(IMPORTING[x]) for x in IMPORTING]
+    index = ImportIndex(asts, importing)
+    main, init, util, sibling, alone = importing
+    assert index.importers_of(util) == [(0, ["pkg.util", "pkg.util"]), (3, ["util", "pkg.util"])]
+    assert index.importers_of(sibling) == [(0, ["pkg.sibling", "pkg.sibling"])]
+    assert index.importers_of(init) == []
+    assert index.importers_of(alone) == []
+    assert index.matches(asts, importing)
+    assert not index.matches(asts[:-1], importing[:-1])
+
+
+def test_renaming_importers_only_matches_renaming_every_file(config, importing, monkeypatch, tmp_path):
+    config({"renamer.enabled": True})
+    indexed = obfuscate_batch(importing)
+
+    def every_file(self, file_name):  # what the renamer did before there was an index
+        root_import = compute_import_path(self.root_file, file_name)
+        return [(i, [compute_import_path(x, file_name), root_import]) for (i, x) in enumerate(self.file_names)]
+
+    monkeypatch.setattr(ImportIndex, "importers_of", every_file)
+    assert obfuscate_batch(importing) == indexed
+    assert "pkg.util.greet" not in indexed[0]
+    assert "import greet" not in indexed[3]
+    for name, source in zip(IMPORTING, indexed):
+        path = tmp_path / "out" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source, encoding="utf8")
+    assert run_main(str(tmp_path / "out")) == run_main(os.path.dirname(importing[0]))
+
+
+def test_import_index_is_kept_per_batch(config, importing, monkeypatch):
+    config({"renamer.enabled": True})
+    renamer = next(x for x in obf.all_transformers if x.name == "renamer").instance
+    built = []
+    init = ImportIndex.__init__
+    monkeypatch.setattr(ImportIndex, "__init__", lambda self, *args: built.append(args) or init(self, *args))
+    asts = [ast.parse(IMPORTING[x]) for x in IMPORTING]
+    for _ in range(2):
+        for i in reversed(range(len(asts))):  # the order doesn't matter, any file can start the batch
+            renamer.transform(asts[i], importing[i], asts, importing)
+        assert renamer.index is None  # dropped once every file is renamed, so the next pass builds a new one
+    assert len(built) == 2
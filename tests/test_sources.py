@@ -0,0 +1,65 @@
+import ast
+
+import pytest
+
+from pyobf2.lib import sources as sources_module
+from pyobf2.lib.sources import SourceCache
+from pyobf2.lib.util import get_dependency_tree
+
+
+@pytest.fixture
+def counted(monkeypatch) -> dict[str, int]:
+    """
+    Counts the files SourceCache reads and parses
+    """
+    counts = {"open": 0, "parse": 0}
+
+    def counting(name, fn):
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    monkeypatch.setattr(sources_module, "open", counting("open", open), raising=False)
+    monkeypatch.setattr(sources_module, "parse", counting("parse", ast.parse))
+    return counts
+
+
+def test_reads_and_parses_once(counted, tmp_path):
+    path = str(tmp_path / "a.py")
+    with open(path, "w", encoding="utf8") as f:
+        f.write("x = 1\n")
+    cache = SourceCache()
+    assert cache.source(path) == "x = 1\n"
+    tree = cache.ast(path)
+    assert cache.ast(path) is tree
+    assert cache.take_ast(path) is tree  # handed over, and forgotten
+    assert cache.take_ast(path) is not tree
+    assert counted == {"open": 1, "parse": 2}
+
+
+def test_reads_changed_files_again(counted, tmp_path):
+    path = str(tmp_path / "a.py")
+    with open(path, "w", encoding="utf8") as f:
+        f.write("x = 1\n")
+    cache = SourceCache()
+    cache.ast(path)
+    with open(path, "w", encoding="utf8") as f:
+        f.write("x = 12\n")
+    assert cache.source(path) == "x = 12\n"
+    assert ast.unparse(cache.take_ast(path)) == "x = 12"
+    cache.forget(path)
+    cache.source(path)
+    assert counted["open"] == 3
+
+
+def test_crawled_files_are_obfuscated_without_parsing_again(counted, packages):
+    cache = SourceCache()
+    tree = get_dependency_tree(packages[0], cache)
+    crawled = {*tree.keys(), *[y for ys in tree.values() for y in ys]}
+    assert len(crawled) == 3
+    assert counted == {"open": len(crawled), "parse": len(crawled)}
+    for x in crawled:
+        cache.take_ast(x)
+    assert counted == {"open": len(crawled), "parse": len(crawled)}
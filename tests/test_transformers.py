@@ -0,0 +1,183 @@
+import ast
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import pyobf2.lib as obf
+from pyobf2.lib import transformers
+from pyobf2.lib.transformers import FileContext, FusedNodeTransformer, Prelude, Transformer, module_header_length
+from pyobf2.lib.transformers.intObfuscatorTransformer import IntObfuscator
+from pyobf2.lib.transformers.unicodeNameTransformer import UnicodeNameTransformer
+from pyobf2.lib.util import NonEscapingUnparser
+
+SOURCE = '''
+"""doc"""
+from __future__ import annotations
+
+def f(a, b=2):
+    return a * 3 + b
+
+print(f(1), [4, 5])
+'''
+
+
+class IndexInts(Transformer):
+    """
+    Wraps ints in operator.index, with operator imported through the prelude
+    """
+
+    node_types = (ast.Constant,)
+
+    def __init__(self):
+        super().__init__("indexInts", "Test transformer using the prelude")
+
+    def visit_Constant(self, node: ast.Constant):
+        if type(node.value) is not int:
+            return node
+        operator = self.ctx.prelude.module("operator")
+        return ast.Call(ast.Attribute(operator, "index", ast.Load()), [node], [])
+
+
+class _WaitingContext(FileContext):
+    def __init__(self, file_name: str):
+        super().__init__(file_name)
+        self.waited = False
+
+
+class FileNames(Transformer):
+    """
+    Replaces constants with the name of the file they are in. Waits for another thread around the first one
+    """
+
+    node_types = (ast.Constant,)
+
+    def __init__(self, barrier: threading.Barrier):
+        super().__init__("fileNames", "Test transformer using the file context")
+        self.barrier = barrier
+
+    def new_context(self, current_file_name: str) -> _WaitingContext:
+        return _WaitingContext(current_file_name)
+
+    def visit_Constant(self, node: ast.Constant):
+        if self.ctx.waited:
+            return ast.Constant(self.ctx.file_name)
+        self.ctx.waited = True
+        self.barrier.wait(timeout=10)
+        file_name = self.ctx.file_name
+        self.barrier.wait(timeout=10)  # neither thread leaves its context before both have looked at theirs
+        return ast.Constant(file_name)
+
+
+def test_threads_keep_their_file_context():
+    transformer = FileNames(threading.Barrier(2))
+
+    def transform(file_name: str) -> list:
+        tree = transformer.transform(ast.parse("x = 0\ny = [1, 2]"), file_name, [], [])
+        return [x.value for x in ast.walk(tree) if isinstance(x, ast.Constant)]
+
+    with ThreadPoolExecutor(2) as pool:
+        a, b = pool.map(transform, ["a.py", "b.py"])
+    assert a == ["a.py"] * 3
+    assert b == ["b.py"] * 3
+    assert transformer.ctx is None
+
+
+@pytest.fixture
+def predictable(monkeypatch):
+    """
+    Makes generated names and unicode names predictable, so fused and sequential output can be compared
+    :return: Restarts the generated names
+    """
+
+    def restart():
+        counter = itertools.count()
+        monkeypatch.setattr(transformers, "rnd_name", lambda: f"n{next(counter)}")
+
+    restart()
+    monkeypatch.setattr("pyobf2.lib.transformers.unicodeNameTransformer.random.choice", lambda x: x[0])
+    return restart
+
+
+@pytest.mark.parametrize("order", [(IndexInts, UnicodeNameTransformer), (UnicodeNameTransformer, IndexInts)])
+def test_fused_prelude_matches_sequential(predictable, order):
+    tree = ast.parse(SOURCE)
+    for x in order:
+        tree = x().transform(tree, "a.py", [], [])
+    sequential = NonEscapingUnparser().visit(ast.fix_missing_locations(tree))
+
+    predictable()
+
+    fused = ast.fix_missing_locations(FusedNodeTransformer([x() for x in order], "a.py").visit(ast.parse(SOURCE)))
+    assert NonEscapingUnparser().visit(fused) == sequential
+    env = {}
+    exec(sequential, env)
+    assert env["f"](1) == 5
+
+
+def test_int_bits_keep_their_value(config):
+    config({"intObfuscator.enabled": True, "intObfuscator.mode": "bits"})
+    source = "x = [0, 1, 2, 5, 255, 256, 12345, 2 ** 70 + 3]"
+    tree = IntObfuscator().transform(ast.parse(source), "a.py", [], [])
+    constants = [x.value for x in ast.walk(tree) if isinstance(x, ast.Constant)]
+    assert all(type(x) is bool for x in constants)
+    env = {}
+    exec(compile(ast.fix_missing_locations(tree), "a.py", "exec"), env)
+    assert env["x"] == [0, 1, 2, 5, 255, 256, 12345, 2**70 + 3]
+
+
+HEADER = '''
+"""doc"""
+from __future__ import annotations
+from __future__ import generator_stop
+
+def f(a: int) -> int:
+    if a > 1 and a < 10:
+        return a * 3
+    return 0
+
+print(f(2), f(20))
+'''
+
+
+@pytest.mark.parametrize("fused", [False, True])
+def test_prelude_goes_after_the_module_header(config, capsys, fused):
+    config({"logicTransformer.enabled": True, "intObfuscator.enabled": True, "intObfuscator.mode": "decode"})
+    tree = obf.do_obfuscation_single_ast(ast.parse(HEADER), "a.py", fused)
+    assert ast.get_docstring(tree, clean=False) == "doc"
+    assert [x.module for x in tree.body[1:3]] == ["__future__", "__future__"]
+    assert module_header_length(tree) == 3
+    # the preludes of both transformers, right after it: functools, random.betavariate, and the int decoder
+    prelude = tree.body[3:6]
+    assert sorted(type(x).__name__ for x in prelude) == ["Assign", "Assign", "FunctionDef"]
+    (functools,) = [x for x in prelude if isinstance(x, ast.Assign) and isinstance(x.value, ast.Call)]
+    assert functools.value.args[0].value == "functools"
+    (betavariate,) = [x for x in prelude if isinstance(x, ast.Assign) and isinstance(x.value, ast.Attribute)]
+    assert betavariate.value.attr == "betavariate" and betavariate.value.value.args[0].value == "random"
+    exec(HEADER, {})
+    expected = capsys.readouterr().out
+    exec(compile(tree, "a.py", "exec"), {})
+    assert capsys.readouterr().out == expected
+
+
+@pytest.mark.parametrize(
+    "source, length",
+    [
+        ("", 0),
+        ("x = 1", 0),
+        ("'doc'", 1),
+        ("b'not a docstring'", 0),
+        ("'doc'\n'not a docstring'", 1),
+        ("from __future__ import annotations\nimport os", 1),
+    ],
+)
+def test_prelude_keeps_the_header_first(source, length):
+    tree = ast.parse(source)
+    assert module_header_length(tree) == length
+    prelude = Prelude()
+    prelude.module("os")
+    prelude.add_to(tree)
+    assert isinstance(tree.body[length], ast.Assign)
+    assert len(tree.body) == len(ast.parse(source).body) + 1
+    compile(ast.fix_missing_locations(tree), "a.py", "exec")